@@ -1,45 +1,117 @@
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from motor.motor_asyncio import AsyncIOMotorClient
 from database import get_collection
+from cache import user_cache
+from indexes import EMAIL_COLLATION
+from invalidation import bump
+from passwords import policy
 from models import User, TokenData
+from tokens import issue, verify, TokenError, SECRET_KEY, ALGORITHM
 import os
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import asyncio
+import time
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
-SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
+# bcrypt and argon2 release the GIL, so hashing runs on a small thread pool
+# instead of blocking the event loop for PASSWORD_HASH_TARGET_MS per login
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(min(4, os.cpu_count() or 1))))
+_hash_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+
+class HashStats:
+    """Updated from the event loop thread only"""
+    def __init__(self):
+        self.pending = 0
+        self.completed = 0
+        # [minute, hashes completed in it], oldest first
+        self._minutes = deque()
+
+    def record(self):
+        self.completed += 1
+        minute = int(time.time() // 60)
+        if self._minutes and self._minutes[-1][0] == minute:
+            self._minutes[-1][1] += 1
+        else:
+            self._minutes.append([minute, 1])
+
+    @property
+    def last_hour(self) -> int:
+        cutoff = int(time.time() // 60) - 60
+        while self._minutes and self._minutes[0][0] <= cutoff:
+            self._minutes.popleft()
+        return sum(count for _, count in self._minutes)
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.pending - BCRYPT_WORKERS)
+
+hash_stats = HashStats()
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return policy.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return policy.hash(password)
+
+async def _run_hash(function, *args):
+    hash_stats.pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, function, *args)
+    finally:
+        hash_stats.pending -= 1
+        hash_stats.record()
+
+async def verify_password_async(plain_password, hashed_password):
+    return await _run_hash(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await _run_hash(get_password_hash, password)
+
+async def calibrate_password_hashing():
+    """Pick the hash cost for this hardware before the first login needs it"""
+    await asyncio.get_running_loop().run_in_executor(_hash_executor, policy.calibrate)
+
+# Rehashes still running, by email; the loop only keeps weak references to tasks
+_rehashes = {}
+
+async def _rehash(user: User, password: str):
+    try:
+        hashed_password = await get_password_hash_async(password)
+        users_collection = await get_collection("users")
+        # Skipped if the password changed in the meantime
+        result = await users_collection.update_one(
+            {"_id": user.id, "hashed_password": user.hashed_password},
+            {"$set": {"hashed_password": hashed_password}}
+        )
+        if result.modified_count:
+            await bump("users")
+    except Exception as e:
+        print(f"Error rehashing password for {user.email}: {e}")
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+    return issue(data, expires_delta or timedelta(minutes=15))
 
 async def get_user_by_email(email: str):
     try:
+        key = email.lower()
+        user = user_cache.get("users", key)
+        if user is not None:
+            return user
         users_collection = await get_collection("users")
-        user_data = await users_collection.find_one({"email": email, "is_active": True})
+        user_data = await users_collection.find_one({"email": email, "is_active": True}, collation=EMAIL_COLLATION)
         if user_data:
-            # Convert MongoDB _id to id for Pydantic
-            if "_id" in user_data:
-                user_data["id"] = user_data["_id"]
-            return User(**user_data)
+            # Stored users were validated on the way in
+            user = User.from_db(user_data)
+            user_cache.set("users", key, user)
+            return user
         return None
     except Exception as e:
         print(f"Error getting user by email: {e}")
@@ -49,29 +121,65 @@ async def authenticate_user(email: str, password: str):
     user = await get_user_by_email(email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return False
+    # Hashes from an older scheme or cost are upgraded while we have the
+    # password, after the response
+    if policy.needs_update(user.hashed_password) and user.email not in _rehashes:
+        _rehashes[user.email] = asyncio.create_task(_rehash(user, password))
+        _rehashes[user.email].add_done_callback(lambda _: _rehashes.pop(user.email, None))
     return user
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await user_from_token(credentials.credentials)
+
+async def user_from_token(token: str):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        # Signature, expiry and revocation; recently seen tokens skip the decode
+        payload = verify(token)
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
         token_data = TokenData(email=email)
-    except JWTError:
+    except TokenError:
         raise credentials_exception
     user = await get_user_by_email(email=token_data.email)
     if user is None:
         raise credentials_exception
     return user
 
+async def get_optional_user(credentials: HTTPAuthorizationCredentials = Depends(optional_security)):
+    """Current user when a valid bearer token is sent, otherwise None"""
+    if credentials is None:
+        return None
+    try:
+        return await get_current_user(credentials)
+    except HTTPException:
+        return None
+
+async def get_stream_user(
+    token: Optional[str] = Query(None),
+    credentials: HTTPAuthorizationCredentials = Depends(optional_security)
+):
+    """
+    Authenticate streaming clients. Browsers' EventSource can't set headers,
+    so the token may also arrive as a ?token= query parameter.
+    """
+    if credentials is not None:
+        return await user_from_token(credentials.credentials)
+    if token:
+        return await user_from_token(token)
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Not authenticated",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
 async def get_current_admin_user(current_user: User = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(
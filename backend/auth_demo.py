@@ -1,11 +1,12 @@
 """
 Demo authentication module using in-memory database
 """
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from models import User, UserRole
+from passwords import policy
 from typing import Optional
+import asyncio
 import os
 
 # Demo database
@@ -25,13 +26,14 @@ SECRET_KEY = os.getenv("SECRET_KEY", "TtaxEE1DHteKFhfisxsjMyjjbg1GeDa4sUj8Jvt_wa
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return policy.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return policy.hash(password)
+
+def _rehash(user_data: dict, password: str):
+    user_data["hashed_password"] = get_password_hash(password)
 
 async def get_user_by_email(email: str) -> Optional[dict]:
     return demo_users.get(email)
@@ -46,6 +48,9 @@ async def authenticate_user(email: str, password: str):
     # For other users, use bcrypt
     if not verify_password(password, user_data["hashed_password"]):
         return False
+    # Upgrade hashes below the current policy off the request path
+    if policy.needs_update(user_data["hashed_password"]):
+        asyncio.get_running_loop().run_in_executor(None, _rehash, user_data, password)
     return User(**user_data)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -0,0 +1,230 @@
+"""
+End-to-end API benchmark.
+
+Drives the full application (main_original.app with its middleware and
+lifespan) in-process through httpx's ASGI transport, so results measure the
+server and not a network. Each scenario is run with --concurrency clients
+for --requests requests and reports throughput and p50/p95/p99 latency; a
+separate sequential pass under tracemalloc reports memory allocated per
+request. Results are written as JSON (--output) and can be compared with a
+previous run (--baseline).
+
+Scenarios: list, search, detail, login, order, dashboard.
+
+Backends: --backend mock (default) uses mongomock-motor (pip install
+mongomock-motor), --backend mongo uses MONGODB_URL (a throwaway database,
+it is cleared). Admission control is disabled so the rate limiter does not
+turn the benchmark into a 429 benchmark.
+
+Run from the backend directory:
+    python benchmarks/bench_api.py --products 2000 --orders 5000 --output results.json
+    python benchmarks/bench_api.py --scenarios list,detail --baseline results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ["ADMISSION_ENABLED"] = "false"
+os.environ.setdefault("STRIPE_SECRET_KEY", "sk_test_benchmark")
+
+import httpx
+import database
+from dataset import seed_dataset, BENCH_PASSWORD
+from generate_data import ADMIN_EMAIL
+
+SCENARIOS = ("list", "search", "detail", "login", "order", "dashboard")
+# bcrypt makes logins ~1000x slower than reads; run fewer of them
+REQUEST_SCALE = {"login": 0.05}
+
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+class Scenario:
+    """Builds the request for the i-th iteration of a scenario"""
+    def __init__(self, name: str, data: dict, tokens: dict, rng: random.Random):
+        self.name = name
+        self.data = data
+        self.tokens = tokens
+        self.rng = rng
+
+    def request(self):
+        rng = self.rng
+        if self.name == "list":
+            category = rng.choice(self.data["categories"])
+            return "GET", "/api/products/", {"params": {"category": category, "page": rng.randint(1, 3), "size": 20}}
+        if self.name == "search":
+            return "GET", "/api/products/", {"params": {"search": rng.choice(self.data["search_terms"]), "size": 20}}
+        if self.name == "detail":
+            return "GET", f"/api/products/{rng.choice(self.data['product_ids'])}", {}
+        if self.name == "login":
+            return "POST", "/api/auth/login", {"json": {"email": rng.choice(self.data["user_emails"]), "password": BENCH_PASSWORD}}
+        if self.name == "order":
+            items = [
+                {"product_id": product_id, "name": "", "price": 0, "image": "", "quantity": rng.randint(1, 3), "category": ""}
+                for product_id in rng.sample(self.data["product_ids"], rng.randint(1, 5))
+            ]
+            return "POST", "/api/orders/", {
+                "json": {
+                    "items": items,
+                    "delivery_address": {"street": "1 Main St", "city": "Springfield", "state": "IL", "zip_code": "62701"},
+                    "payment_method": "card"
+                },
+                "headers": {"Authorization": f"Bearer {self.tokens['user']}", "Idempotency-Key": str(uuid.uuid4())}
+            }
+        if self.name == "dashboard":
+            return "GET", "/api/admin/dashboard", {"headers": {"Authorization": f"Bearer {self.tokens['admin']}"}}
+        raise ValueError(f"Unknown scenario: {self.name}")
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, requests: int, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            method, url, kwargs = scenario.request()
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3)
+    }
+
+async def measure_allocations(client: httpx.AsyncClient, scenario: Scenario, requests: int) -> dict:
+    """Sequential requests under tracemalloc: bytes allocated and peak per request"""
+    tracemalloc.start()
+    allocated = 0
+    peak = 0
+    for _ in range(requests):
+        method, url, kwargs = scenario.request()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        await client.request(method, url, **kwargs)
+        _, request_peak = tracemalloc.get_traced_memory()
+        allocated += request_peak - before
+        peak = max(peak, request_peak - before)
+    tracemalloc.stop()
+    return {
+        "alloc_bytes_per_request": allocated // max(1, requests),
+        "alloc_peak_bytes": peak
+    }
+
+async def login(client: httpx.AsyncClient, email: str) -> str:
+    response = await client.post("/api/auth/login", json={"email": email, "password": BENCH_PASSWORD})
+    response.raise_for_status()
+    return response.json()["data"]["access_token"]
+
+def compare(results: dict, baseline: dict):
+    print("\nchange vs baseline (throughput, p99):")
+    for name, result in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        throughput = (result["throughput_rps"] / previous["throughput_rps"] - 1) * 100 if previous["throughput_rps"] else 0
+        p99 = (result["p99_ms"] / previous["p99_ms"] - 1) * 100 if previous["p99_ms"] else 0
+        print(f"  {name:<10} {throughput:+7.1f}% rps  {p99:+7.1f}% p99")
+
+async def main(args):
+    if args.backend == "mock":
+        from mongomock_motor import AsyncMongoMockClient
+        database.client = AsyncMongoMockClient()
+    else:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        database.client = AsyncIOMotorClient(database.MONGODB_URL)
+
+    import main_original
+    app = main_original.app
+
+    seed_start = time.perf_counter()
+    data = await seed_dataset(await database.get_database(), products=args.products, orders=args.orders,
+                              users=args.users, seed=args.seed)
+    seed_seconds = time.perf_counter() - seed_start
+
+    scenario_names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    results = {
+        "meta": {
+            "backend": args.backend,
+            "products": args.products,
+            "orders": args.orders,
+            "users": args.users,
+            "seed": args.seed,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed_seconds": round(seed_seconds, 2),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        },
+        "scenarios": {}
+    }
+
+    async with main_original.lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            tokens = {}
+            if {"order", "dashboard"} & set(scenario_names):
+                tokens["user"] = await login(client, data["user_emails"][0])
+                tokens["admin"] = await login(client, ADMIN_EMAIL)
+
+            rng = random.Random(args.seed)
+            for name in scenario_names:
+                scenario = Scenario(name, data, tokens, rng)
+                requests = max(1, int(args.requests * REQUEST_SCALE.get(name, 1)))
+                await run_scenario(client, scenario, max(1, requests // 10), args.concurrency)  # warm up
+                result = await run_scenario(client, scenario, requests, args.concurrency)
+                result.update(await measure_allocations(client, scenario, max(1, min(requests, args.alloc_requests))))
+                results["scenarios"][name] = result
+                print(f"{name:<10} {result['throughput_rps']:>9.1f} rps  p50 {result['p50_ms']:>8.2f} ms  "
+                      f"p95 {result['p95_ms']:>8.2f} ms  p99 {result['p99_ms']:>8.2f} ms  "
+                      f"{result['alloc_bytes_per_request'] / 1024:>8.1f} KiB/req  errors {result['errors']}")
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+        print(f"\nresults written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            compare(results, json.load(baseline))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=("mock", "mongo"), default="mock")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--alloc-requests", type=int, default=100, help="requests in the tracemalloc pass")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare with a previous JSON result")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,90 @@
+"""
+Checkout load test: orders per second on a single worker.
+
+Calls checkout.place_order concurrently on one event loop against the
+database at MONGODB_URL (use a throwaway database, it is cleared). Pass
+--mock to run against mongomock-motor instead (pip install mongomock-motor).
+
+Run from the backend directory:
+    python benchmarks/bench_checkout.py --orders 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from models import User, OrderCreate, OrderItem, UserAddress
+from checkout import place_order
+
+ADDRESS = UserAddress(street="1 Main St", city="Springfield", state="IL", zip_code="62701")
+
+async def seed_products(count: int):
+    products_collection = await database.get_collection("products")
+    await products_collection.delete_many({})
+    await products_collection.insert_many([
+        {
+            "_id": f"bench-product-{i}",
+            "name": f"Product {i}",
+            "price": round(random.uniform(1, 20), 2),
+            "image": "/placeholder.svg",
+            "category": "Bench",
+            "stock_count": 10 ** 9,
+            "is_active": True,
+        }
+        for i in range(count)
+    ])
+
+def random_order(product_count: int) -> OrderCreate:
+    items = [
+        OrderItem(product_id=f"bench-product-{random.randrange(product_count)}", name="", price=0,
+                  image="", quantity=random.randint(1, 3), category="")
+        for _ in range(random.randint(1, 6))
+    ]
+    return OrderCreate(items=items, delivery_address=ADDRESS, payment_method="card")
+
+async def main(args):
+    if args.mock:
+        from mongomock_motor import AsyncMongoMockClient
+        database.client = AsyncMongoMockClient()
+    else:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        database.client = AsyncIOMotorClient(database.MONGODB_URL)
+
+    random.seed(args.seed)
+    await seed_products(args.products)
+    for name in ("orders", "payment_transactions"):
+        await (await database.get_collection(name)).delete_many({})
+
+    user = User(name="Bench", email="bench@example.com", hashed_password="x")
+    orders = [random_order(args.products) for _ in range(args.orders)]
+    queue = asyncio.Queue()
+    for order in orders:
+        queue.put_nowait(order)
+
+    async def worker():
+        while not queue.empty():
+            order = queue.get_nowait()
+            await place_order(user, order, idempotency_key=str(uuid.uuid4()))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    print(f"transactions: {await database.supports_transactions()}")
+    print(f"{args.orders} orders in {elapsed:.2f}s -> {args.orders / elapsed:.0f} orders/s "
+          f"(concurrency {args.concurrency})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mock", action="store_true")
+    asyncio.run(main(parser.parse_args()))
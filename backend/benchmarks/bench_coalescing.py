@@ -0,0 +1,81 @@
+"""
+Thundering-herd test for single-flight coalescing of catalog reads.
+
+Fires waves of identical concurrent product listing and category requests,
+the way a promotion going live does, and reports how many database fetches
+were actually issued (the coalescing ratio) and the wave latency. Runs
+against the database at MONGODB_URL (use a throwaway database, products
+and categories are replaced) or mongomock-motor with --mock.
+
+Run from the backend directory:
+    python benchmarks/bench_coalescing.py --clients 2000 --waves 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from cache import catalog_cache
+from routers.products import get_products
+from routers.categories import get_categories
+from singleflight import product_flights, category_flights
+from bench_models import PRODUCT_DOC
+
+async def seed(count: int):
+    products_collection = await database.get_collection("products")
+    await products_collection.delete_many({})
+    await products_collection.insert_many([
+        {**PRODUCT_DOC, "_id": f"bench-product-{i}", "name": f"Product {i}", "category": f"Category {i % 10}"}
+        for i in range(count)
+    ])
+    categories_collection = await database.get_collection("categories")
+    await categories_collection.delete_many({})
+    await categories_collection.insert_many([
+        {"_id": f"bench-category-{i}", "name": f"Category {i}", "icon": "x", "color": "green",
+         "description": "", "is_active": True}
+        for i in range(10)
+    ])
+
+async def main(args):
+    if args.mock:
+        from mongomock_motor import AsyncMongoMockClient
+        database.client = AsyncMongoMockClient()
+    else:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        database.client = AsyncIOMotorClient(database.MONGODB_URL)
+    await seed(args.products)
+
+    wave_times = []
+    for _ in range(args.waves):
+        # Every wave starts cold, as right after a catalog change
+        catalog_cache.invalidate("products", "categories")
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            get_products(page=1, size=20, category="Category 3", search=None, in_stock=None)
+            if i % 2 else get_categories()
+            for i in range(args.clients)
+        ))
+        wave_times.append(time.perf_counter() - start)
+
+    requests = args.clients * args.waves
+    print(f"{requests} requests in {args.waves} waves of {args.clients}")
+    for name, flights in (("products", product_flights), ("categories", category_flights)):
+        stats = flights.snapshot()
+        print(f"{name}: {stats['calls']} calls, {stats['executions']} database fetches, "
+              f"coalescing ratio {stats['coalescing_ratio']:.4f}")
+    wave_times.sort()
+    print(f"wave latency: p50 {wave_times[len(wave_times) // 2] * 1e3:.1f} ms, "
+          f"max {wave_times[-1] * 1e3:.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--waves", type=int, default=20)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--mock", action="store_true", help="use mongomock-motor instead of MONGODB_URL")
+    asyncio.run(main(parser.parse_args()))
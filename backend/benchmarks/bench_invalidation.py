@@ -0,0 +1,107 @@
+"""
+Cross-worker invalidation test: propagation latency between processes.
+
+Starts N worker processes, each with its own Motor client and the mongo
+invalidation bus, then bumps a namespace M times from this process and
+reports how long each bump took to reach the workers (from the sent_at
+timestamp, so millisecond resolution) and whether every worker saw every
+bump. Needs a MongoDB server at MONGODB_URL; capped collections and
+tailable cursors are not available in mongomock.
+
+Run from the backend directory:
+    python benchmarks/bench_invalidation.py --workers 4 --bumps 200
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ["INVALIDATION_BUS"] = "mongo"
+
+NAMESPACE = "bench"
+
+def worker(bumps: int, ready, results, timeout: float):
+    import database
+    import invalidation
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def run():
+        database.client = AsyncIOMotorClient(database.MONGODB_URL)
+        latencies = []
+        done = asyncio.Event()
+
+        def received():
+            latencies.append(invalidation._backend.last_latency)
+            if len(latencies) == bumps:
+                done.set()
+
+        invalidation.on_bump(NAMESPACE, received)
+        await invalidation.start()
+        await asyncio.sleep(0.5)  # let the tailable cursor open
+        ready.put(os.getpid())
+        try:
+            await asyncio.wait_for(done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        await invalidation.stop()
+        results.put(latencies)
+
+    asyncio.run(run())
+
+async def publish(bumps: int, interval: float):
+    import database
+    import invalidation
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    database.client = AsyncIOMotorClient(database.MONGODB_URL)
+    await invalidation.start()
+    start = time.perf_counter()
+    for _ in range(bumps):
+        await invalidation.bump(NAMESPACE)
+        await asyncio.sleep(interval)
+    elapsed = time.perf_counter() - start
+    await invalidation.stop()
+    return elapsed
+
+def main(args):
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(args.bumps, ready, results, args.timeout))
+        for _ in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.get(timeout=30)
+
+    elapsed = asyncio.run(publish(args.bumps, args.interval))
+    latencies = []
+    complete = 0
+    for _ in processes:
+        received = results.get(timeout=args.timeout + 30)
+        complete += len(received) == args.bumps
+        latencies.extend(received)
+    for process in processes:
+        process.join()
+
+    print(f"{args.bumps} bumps in {elapsed:.2f}s to {args.workers} workers, "
+          f"{complete}/{args.workers} received every bump")
+    if latencies:
+        latencies.sort()
+        print(f"propagation: p50 {latencies[len(latencies) // 2] * 1e3:.0f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1e3:.0f} ms, "
+              f"max {latencies[-1] * 1e3:.0f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--bumps", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between bumps")
+    parser.add_argument("--timeout", type=float, default=30)
+    main(parser.parse_args())
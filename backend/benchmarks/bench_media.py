@@ -0,0 +1,142 @@
+"""
+Media serving benchmark: MediaFiles against Starlette's StaticFiles.
+
+Writes a small (2 KiB), medium (100 KiB) and large (4 MiB) file, plus a
+gzip variant of the medium one, to a temporary directory and mounts it
+twice on one app: /static with StaticFiles and /media with MediaFiles.
+Each scenario fires --requests requests from --concurrency clients at both
+mounts and reports throughput and p50/p99 latency:
+    small, medium, large - plain GETs
+    gzip                 - medium file with Accept-Encoding: gzip
+    revalidate           - If-None-Match with the current ETag (304)
+    range                - first 64 KiB of the large file (StaticFiles has
+                           no Range support and sends the whole file)
+
+By default requests go through httpx's in-process ASGI transport; --server
+runs uvicorn on a local port so the numbers include real sockets.
+
+Run from the backend directory:
+    python benchmarks/bench_media.py --requests 2000
+    python benchmarks/bench_media.py --server --requests 2000
+"""
+import argparse
+import asyncio
+import gzip
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.staticfiles import StaticFiles
+from media_files import MediaFiles
+
+FILES = {"small.txt": 2 * 1024, "medium.txt": 100 * 1024, "large.bin": 4 * 1024 * 1024}
+SCENARIOS = ("small", "medium", "large", "gzip", "revalidate", "range")
+
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+def write_files(directory: str):
+    for name, size in FILES.items():
+        with open(os.path.join(directory, name), "wb") as output:
+            output.write((b"grocery media " * (size // 14 + 1))[:size])
+    with open(os.path.join(directory, "medium.txt"), "rb") as source:
+        with open(os.path.join(directory, "medium.txt.gz"), "wb") as output:
+            output.write(gzip.compress(source.read()))
+
+def request_for(scenario: str, etags: dict):
+    identity = {"accept-encoding": "identity"}
+    if scenario in ("small", "medium", "large"):
+        return {"small": "small.txt", "medium": "medium.txt", "large": "large.bin"}[scenario], identity
+    if scenario == "gzip":
+        return "medium.txt", {"accept-encoding": "gzip"}
+    if scenario == "revalidate":
+        return "small.txt", {**identity, "if-none-match": etags["small.txt"]}
+    if scenario == "range":
+        return "large.bin", {**identity, "range": "bytes=0-65535"}
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+async def run(client: httpx.AsyncClient, url: str, headers: dict, requests: int, concurrency: int) -> dict:
+    latencies = []
+    statuses = set()
+    transferred = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, transferred
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            response = await client.get(url, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            statuses.add(response.status_code)
+            transferred += len(response.content)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": requests / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "bytes": transferred // requests,
+        "status": ",".join(str(status) for status in sorted(statuses))
+    }
+
+def start_server(app) -> str:
+    import uvicorn
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+async def main(args):
+    directory = tempfile.mkdtemp(prefix="bench-media-")
+    write_files(directory)
+    app = Starlette(routes=[
+        Mount("/static", StaticFiles(directory=directory)),
+        Mount("/media", MediaFiles(directory)),
+    ])
+
+    if args.server:
+        client = httpx.AsyncClient(base_url=start_server(app), limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+    async with client:
+        scenario_names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+        print(f"{'scenario':<11} {'mount':<7} {'rps':>9} {'p50 ms':>8} {'p99 ms':>8} {'bytes':>9}  status")
+        for name in scenario_names:
+            for mount in ("static", "media"):
+                etags = {}
+                for file_name in FILES:
+                    response = await client.get(f"/{mount}/{file_name}", headers={"accept-encoding": "identity"})
+                    etags[file_name] = response.headers["etag"]
+                path, headers = request_for(name, etags)
+                url = f"/{mount}/{path}"
+                await run(client, url, headers, max(1, args.requests // 10), args.concurrency)  # warm up
+                result = await run(client, url, headers, args.requests, args.concurrency)
+                print(f"{name:<11} {mount:<7} {result['rps']:>9.1f} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+                      f"{result['bytes']:>9}  {result['status']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--server", action="store_true", help="serve over a local uvicorn socket")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,124 @@
+"""
+Micro-benchmark of per-request model overhead for users, products and orders.
+
+Compares building models through the normal constructor (what the API used
+to do for every read) with ``from_db``, the read-side load used for
+documents coming out of MongoDB, and with an unvalidated model_construct
+load that rebuilds nested models the same way (the "trusted" column). Only
+users have a check worth skipping (email validation); for products and
+orders from_db is plain validation, since the trusted load is no faster.
+
+Run from the backend directory:
+    python benchmarks/bench_models.py
+"""
+import os
+import sys
+import timeit
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import User, Product, Order, NutritionFacts, OrderItem, UserAddress, UserPreferences, OrderStatus, UserRole
+
+NOW = datetime.utcnow()
+
+USER_DOC = {
+    "_id": str(uuid.uuid4()),
+    "name": "Jane Shopper",
+    "email": "jane@example.com",
+    "phone": "+1234567890",
+    "role": "customer",
+    "address": {"street": "1 Main St", "city": "Springfield", "state": "IL", "zip_code": "62701"},
+    "preferences": {"notifications": True, "marketing": False, "dark_mode": True},
+    "hashed_password": "$2b$12$" + "x" * 53,
+    "is_verified": True,
+    "is_active": True,
+    "created_at": NOW,
+    "updated_at": NOW,
+}
+
+PRODUCT_DOC = {
+    "_id": str(uuid.uuid4()),
+    "name": "Fresh Organic Apples",
+    "price": 4.99,
+    "original_price": 5.99,
+    "image": "/placeholder.svg?height=300&width=300",
+    "images": ["/placeholder.svg?height=300&width=300"] * 3,
+    "rating": 4.8,
+    "review_count": 124,
+    "category": "Fruits",
+    "category_id": str(uuid.uuid4()),
+    "brand": "Nature's Best",
+    "in_stock": True,
+    "stock_count": 24,
+    "description": "Premium quality organic apples",
+    "features": ["Organic", "Locally sourced", "Crisp"],
+    "nutrition_facts": {"calories": 95, "carbs": "25g", "fiber": "4g", "sugar": "19g", "protein": "0.5g", "fat": "0.3g"},
+    "tags": ["organic", "fresh", "fruit"],
+    "weight": "1 lb",
+    "origin": "Washington",
+    "sku": "APL-ORG-001",
+    "is_active": True,
+    "created_at": NOW,
+    "updated_at": NOW,
+}
+
+ORDER_DOC = {
+    "_id": str(uuid.uuid4()),
+    "user_id": USER_DOC["_id"],
+    "items": [
+        {"product_id": str(uuid.uuid4()), "name": f"Item {i}", "price": 2.5, "image": "/placeholder.svg", "quantity": 2, "category": "Fruits"}
+        for i in range(8)
+    ],
+    "total_price": 45.99,
+    "subtotal": 40.0,
+    "tax": 4.0,
+    "delivery_fee": 1.99,
+    "status": "pending",
+    "delivery_address": USER_DOC["address"],
+    "payment_method": "stripe",
+    "delivery_option": "standard",
+    "is_active": True,
+    "created_at": NOW,
+    "updated_at": NOW,
+}
+
+def construct_user(doc):
+    return User.model_construct(**{
+        **doc,
+        "address": UserAddress.model_construct(**doc["address"]),
+        "preferences": UserPreferences.model_construct(**doc["preferences"]),
+        "role": UserRole(doc["role"]),
+    })
+
+def construct_product(doc):
+    return Product.model_construct(**{**doc, "nutrition_facts": NutritionFacts.model_construct(**doc["nutrition_facts"])})
+
+def construct_order(doc):
+    return Order.model_construct(**{
+        **doc,
+        "items": [OrderItem.model_construct(**item) for item in doc["items"]],
+        "delivery_address": UserAddress.model_construct(**doc["delivery_address"]),
+        "status": OrderStatus(doc["status"]),
+    })
+
+CASES = [
+    ("user", User, USER_DOC, construct_user),
+    ("product", Product, PRODUCT_DOC, construct_product),
+    ("order", Order, ORDER_DOC, construct_order),
+]
+
+def run(number: int = 20000):
+    print(f"{'model':<10}{'validate (us)':>16}{'from_db (us)':>16}{'trusted (us)':>16}{'from_db speedup':>17}")
+    for name, model_cls, doc, construct in CASES:
+        validated = timeit.timeit(lambda: model_cls(**doc), number=number)
+        loaded = timeit.timeit(lambda: model_cls.from_db(doc), number=number)
+        trusted = timeit.timeit(lambda: construct(doc), number=number)
+        print(
+            f"{name:<10}{validated / number * 1e6:>16.2f}{loaded / number * 1e6:>16.2f}"
+            f"{trusted / number * 1e6:>16.2f}{validated / loaded:>16.1f}x"
+        )
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,71 @@
+"""
+Password hashing calibration and throughput.
+
+Calibrates the hashing policy for --target-ms on this machine, as the app
+does at startup, and reports the chosen cost, the time of one hash, and
+throughput with 1 thread and with one thread per core (bcrypt and argon2
+release the GIL, as auth's hashing pool relies on). Throughput per core
+is the number of logins per second one core can absorb; a login storm of
+N users needs N / that core-seconds.
+
+Run from the backend directory:
+    python benchmarks/bench_passwords.py
+    python benchmarks/bench_passwords.py --scheme argon2 --target-ms 100
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import passwords
+
+def throughput(policy: passwords.HashPolicy, seconds: float, threads: int) -> float:
+    """Hashes per second with `threads` hashing concurrently"""
+    deadline = time.perf_counter() + seconds
+    counts = [0] * threads
+
+    def work(index: int):
+        while time.perf_counter() < deadline:
+            policy.hash(passwords.PROBE_PASSWORD)
+            counts[index] += 1
+
+    workers = [threading.Thread(target=work, args=(index,)) for index in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+def elapsed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+def run(args):
+    cores = os.cpu_count() or 1
+    start = time.perf_counter()
+    policy = passwords.HashPolicy(args.scheme, args.target_ms)
+    policy.calibrate()
+    calibration = time.perf_counter() - start
+
+    single = passwords._time_hash(policy.context)
+    hashed = policy.hash(passwords.PROBE_PASSWORD)
+    verify = min(elapsed(lambda: policy.verify(passwords.PROBE_PASSWORD, hashed)) for _ in range(3))
+    print(f"calibration took {calibration:.2f}s, one hash {single * 1000:.1f} ms, "
+          f"one verify {verify * 1000:.1f} ms (target {args.target_ms:.0f} ms)")
+
+    print(f"{'threads':>7} {'hashes/s':>10} {'hashes/s/core':>14}")
+    for threads in sorted({1, cores}):
+        rate = throughput(policy, args.seconds, threads)
+        print(f"{threads:>7} {rate:>10.1f} {rate / min(threads, cores):>14.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scheme", choices=passwords.SCHEMES, default=passwords.PASSWORD_HASH_SCHEME)
+    parser.add_argument("--target-ms", type=float, default=passwords.PASSWORD_HASH_TARGET_MS)
+    parser.add_argument("--seconds", type=float, default=5.0, help="duration of each throughput run")
+    run(parser.parse_args())
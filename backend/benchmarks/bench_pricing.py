@@ -0,0 +1,40 @@
+"""
+Cost of pricing a cart with compiled rules (no database access).
+
+Run from the backend directory:
+    python benchmarks/bench_pricing.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pricing import PricingRules
+
+TAX_ZONES = [{"state": state, "rate": 0.05 + i / 1000} for i, state in enumerate(["CA", "NY", "TX", "IL", "WA"])]
+TAX_ZONES += [{"state": "CA", "zip_prefix": f"9{i}", "rate": 0.09} for i in range(10)]
+DELIVERY_TIERS = [
+    {"delivery_option": "standard", "min_subtotal": 0, "fee": 5.99},
+    {"delivery_option": "standard", "min_subtotal": 50, "fee": 0},
+    {"delivery_option": "express", "min_subtotal": 0, "fee": 12.99},
+]
+PROMOTIONS = [
+    {"code": f"CODE{i}", "kind": "percent", "value": 10, "category_ids": [f"cat-{i % 5}"]} for i in range(50)
+] + [{"kind": "fixed", "value": 2, "min_subtotal": 25}]
+
+LINES = [
+    {"product_id": f"p{i}", "category_id": f"cat-{i % 5}", "price": 3.49, "original_price": 3.99, "quantity": 2}
+    for i in range(20)
+]
+
+def run(number: int = 20000):
+    rules = PricingRules(TAX_ZONES, DELIVERY_TIERS, PROMOTIONS)
+    elapsed = timeit.timeit(
+        lambda: rules.quote(LINES, "CA", "94105", "standard", "CODE3"),
+        number=number
+    )
+    print(f"20-line cart with coupon: {elapsed / number * 1e6:.1f} us/quote")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,74 @@
+"""
+Load test for the order pub/sub hub: idle subscribers per worker.
+
+Opens N subscriptions, each with a task waiting on it the way an SSE or
+WebSocket handler does, then reports memory per subscriber, the time to
+fan one broadcast out to all of them and per-order publish latency.
+
+Run from the backend directory:
+    python benchmarks/bench_pubsub.py --subscribers 10000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pubsub import Hub, order_channel
+
+BROADCAST = "admin:orders"
+
+async def main(args):
+    hub = Hub()
+    received = 0
+    all_received = asyncio.Event()
+
+    async def listener(subscription):
+        nonlocal received
+        while True:
+            message = await subscription.get(timeout=3600)
+            if message is not None:
+                received += 1
+                if received == args.subscribers:
+                    all_received.set()
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    subscriptions = [hub.subscribe(order_channel(str(i)), BROADCAST) for i in range(args.subscribers)]
+    tasks = [asyncio.create_task(listener(subscription)) for subscription in subscriptions]
+    await asyncio.sleep(0.1)  # let every listener park on its queue
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{args.subscribers} idle subscribers: {(after - before) / args.subscribers:.0f} bytes each "
+          f"({(after - before) / 1e6:.1f} MB)")
+
+    start = time.perf_counter()
+    hub.dispatch(BROADCAST, {"type": "status_changed", "seq": 1})
+    dispatched = time.perf_counter()
+    await all_received.wait()
+    done = time.perf_counter()
+    print(f"broadcast: dispatch {(dispatched - start) * 1e3:.1f} ms, "
+          f"all delivered after {(done - start) * 1e3:.1f} ms")
+
+    latencies = []
+    for i in range(args.messages):
+        subscription_index = i % args.subscribers
+        start = time.perf_counter()
+        hub.dispatch(order_channel(str(subscription_index)), {"type": "status_changed", "seq": i})
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0)
+    latencies.sort()
+    print(f"per-order publish: p50 {latencies[len(latencies) // 2] * 1e6:.1f} us, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.1f} us")
+
+    for task in tasks:
+        task.cancel()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=10000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,69 @@
+"""
+Serialization cost of a 100-item product page.
+
+"before" runs FastAPI's generic response path for an untyped
+PaginatedResponse wrapping raw MongoDB documents; "after" builds the typed
+ProductPage and renders it with its compiled serializer via ModelResponse.
+
+Run from the backend directory:
+    python benchmarks/bench_serialization.py
+"""
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from models import PaginatedResponse, ProductPage
+from responses import ModelResponse
+from bench_models import PRODUCT_DOC
+
+PAGE_SIZE = 100
+
+def make_page():
+    docs = []
+    for i in range(PAGE_SIZE):
+        doc = dict(PRODUCT_DOC)
+        doc["_id"] = str(uuid.uuid4())
+        doc["name"] = f"Product {i}"
+        docs.append(doc)
+    return docs
+
+async def before(docs, field):
+    content = await serialize_response(
+        field=field,
+        response_content=PaginatedResponse(
+            success=True, data=docs, page=1, size=PAGE_SIZE, total=PAGE_SIZE, pages=1
+        ),
+    )
+    return JSONResponse(content).body
+
+async def after(docs):
+    return ModelResponse(ProductPage(
+        success=True, data=docs, page=1, size=PAGE_SIZE, total=PAGE_SIZE, pages=1
+    )).body
+
+async def timed(coro_factory, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await coro_factory()
+    return (time.perf_counter() - start) / rounds
+
+async def main(rounds: int):
+    docs = make_page()
+    field = create_response_field(name="Response", type_=PaginatedResponse)
+    before_s = await timed(lambda: before(docs, field), rounds)
+    after_s = await timed(lambda: after(docs), rounds)
+    print(f"100-item page, {rounds} rounds")
+    print(f"  before (untyped, generic encoder): {before_s * 1e3:8.3f} ms/page")
+    print(f"  after  (ProductPage, compiled):    {after_s * 1e3:8.3f} ms/page")
+    print(f"  speedup: {before_s / after_s:.1f}x")
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
@@ -0,0 +1,120 @@
+"""
+Concurrent sign-up stress test: registration throughput and uniqueness.
+
+Fires --signups registrations through routers.auth.register_user from
+--concurrency concurrent clients on one event loop, drawn from only
+--emails distinct addresses in random capitalisations, so most attempts
+race another one for the same address. Afterwards every address must
+have exactly one account, and every other attempt must have been refused
+with 400; the script exits non-zero if not.
+
+Runs against the database at MONGODB_URL (use a throwaway database, its
+users are dropped). Pass --mock to run against mongomock-motor instead;
+mongomock ignores index collations, so there addresses are only varied
+in the exact same case. Passwords are hashed with BCRYPT_ROUNDS
+(--rounds, 4 by default) so the numbers show the registration path, not
+bcrypt; pass the production cost to see the end-to-end rate.
+
+Run from the backend directory:
+    python benchmarks/bench_signup.py --signups 5000 --emails 1000 --concurrency 100
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+def capitalised(email: str, rng: random.Random) -> str:
+    local, domain = email.split("@")
+    return "".join(char.upper() if rng.random() < 0.5 else char for char in local) + "@" + domain
+
+async def main(args):
+    import database
+    from fastapi import HTTPException
+    from indexes import ensure_indexes
+    from models import UserCreate
+    from routers.auth import register_user
+
+    if args.mock:
+        from mongomock_motor import AsyncMongoMockClient
+        database.client = AsyncMongoMockClient()
+    else:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        database.client = AsyncIOMotorClient(database.MONGODB_URL)
+
+    users_collection = await database.get_collection("users")
+    await users_collection.drop()
+    await ensure_indexes()
+
+    rng = random.Random(args.seed)
+    addresses = [f"shopper{index}@bench.example.com" for index in range(args.emails)]
+    attempts = []
+    for _ in range(args.signups):
+        email = rng.choice(addresses)
+        attempts.append(email if args.mock else capitalised(email, rng))
+    queue = asyncio.Queue()
+    for email in attempts:
+        queue.put_nowait(email)
+
+    latencies = []
+    outcomes = {"created": 0, "duplicate": 0, "error": 0}
+
+    async def worker():
+        while not queue.empty():
+            email = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                await register_user(UserCreate(name="Bench Shopper", email=email, password="bench-password"))
+                outcomes["created"] += 1
+            except HTTPException as e:
+                if e.status_code == 400:
+                    outcomes["duplicate"] += 1
+                else:
+                    outcomes["error"] += 1
+                    print(f"{email}: {e.status_code} {e.detail}")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    accounts = {}
+    async for user in users_collection.find({}, {"email": 1}):
+        key = user["email"].lower()
+        accounts[key] = accounts.get(key, 0) + 1
+    duplicated = {email: count for email, count in accounts.items() if count > 1}
+    expected = len(set(email.lower() for email in attempts))
+
+    latencies.sort()
+    print(f"{args.signups} sign-ups for {expected} addresses in {elapsed:.2f}s -> "
+          f"{args.signups / elapsed:.0f} attempts/s, {outcomes['created'] / elapsed:.0f} accounts/s "
+          f"(concurrency {args.concurrency}, bcrypt rounds {os.environ['BCRYPT_ROUNDS']})")
+    print(f"p50 {percentile(latencies, 0.50) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+    print(f"created {outcomes['created']}, refused as duplicate {outcomes['duplicate']}, errors {outcomes['error']}")
+    print(f"accounts {sum(accounts.values())}, addresses with more than one account {len(duplicated)}")
+
+    if duplicated or outcomes["error"] or outcomes["created"] != expected or len(accounts) != expected:
+        print("FAILED: registrations were not unique per address")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--signups", type=int, default=5000)
+    parser.add_argument("--emails", type=int, default=1000, help="distinct addresses the sign-ups are drawn from")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=4, help="bcrypt rounds for the new accounts")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mock", action="store_true")
+    arguments = parser.parse_args()
+    # Read when the password policy is imported
+    os.environ["BCRYPT_ROUNDS"] = str(arguments.rounds)
+    os.environ["PASSWORD_HASH_SCHEME"] = "bcrypt"
+    asyncio.run(main(arguments))
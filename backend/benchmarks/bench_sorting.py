@@ -0,0 +1,104 @@
+"""
+Sorted listing benchmark: index coverage and keyset vs skip paging.
+
+Generates a catalog of --products products with generate_data.py, creates
+the declared indexes and explains every sort mode the listing endpoints
+offer, over the whole catalog and within one category, for the first page
+and for a page --depth rows in. Each plan is checked for a blocking SORT
+stage (an in-memory sort); the run exits non-zero if any plan has one.
+For deep pages it also compares keys examined and time taken by the keyset
+cursor against skip().
+
+Needs a MongoDB server at MONGODB_URL (a throwaway database, it is
+cleared); mongomock has no query planner to explain.
+
+Run from the backend directory:
+    python benchmarks/bench_sorting.py --products 200000 --depth 10000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from generate_data import generate
+from indexes import ensure_indexes
+from sorting import SORT_MODES, after, sort_spec, encode_cursor, decode_cursor
+
+PAGE_SIZE = 20
+
+def plan_stages(plan) -> list:
+    """Every stage name in an explain() plan tree"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
+
+async def explain(collection, query: dict, mode: str, skip: int = 0) -> dict:
+    cursor = collection.find(query).sort(sort_spec(mode)).skip(skip).limit(PAGE_SIZE)
+    start = time.perf_counter()
+    await cursor.to_list(length=PAGE_SIZE)
+    elapsed = time.perf_counter() - start
+    plan = await collection.find(query).sort(sort_spec(mode)).skip(skip).limit(PAGE_SIZE).explain()
+    stats = plan.get("executionStats", {})
+    stages = plan_stages(plan["queryPlanner"]["winningPlan"])
+    return {
+        "sort_stage": "SORT" in stages,
+        "index": next((stage for stage in ("IXSCAN", "SORT_MERGE") if stage in stages), "-"),
+        "keys": stats.get("totalKeysExamined", 0),
+        "docs": stats.get("totalDocsExamined", 0),
+        "ms": elapsed * 1000
+    }
+
+async def main(args):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    database.client = AsyncIOMotorClient(database.MONGODB_URL)
+    db = await database.get_database()
+
+    seed_start = time.perf_counter()
+    await generate(db, products=args.products, orders=0, users=1, seed=args.seed)
+    await ensure_indexes()
+    print(f"seeded {args.products} products in {time.perf_counter() - seed_start:.1f}s\n")
+
+    collection = db.products
+    category_id = (await collection.find_one({"is_active": True}, {"category_id": 1}))["category_id"]
+    scopes = {"catalog": {"is_active": True}, "category": {"is_active": True, "category_id": category_id}}
+
+    failures = 0
+    print(f"{'mode':<12} {'scope':<9} {'page':<14} {'plan':<10} {'keys':>9} {'docs':>9} {'ms':>9}")
+    for mode in SORT_MODES:
+        for scope, query in scopes.items():
+            rows = [("first", await explain(collection, query, mode))]
+
+            # The row a client reaches after `depth` rows, as a cursor would carry it
+            boundary = await collection.find(query).sort(sort_spec(mode)).skip(args.depth - 1).limit(1).to_list(length=1)
+            if boundary:
+                _, value, last_id = decode_cursor(encode_cursor(mode, boundary[0]))
+                rows.append((f"skip {args.depth}", await explain(collection, query, mode, skip=args.depth)))
+                rows.append((f"keyset {args.depth}", await explain(collection, after(query, mode, (value, last_id)), mode)))
+
+            for page, result in rows:
+                failures += result["sort_stage"]
+                plan = "SORT" if result["sort_stage"] else result["index"]
+                print(f"{mode:<12} {scope:<9} {page:<14} {plan:<10} {result['keys']:>9} {result['docs']:>9} {result['ms']:>9.2f}")
+
+    if failures:
+        print(f"\n{failures} plan(s) sort in memory")
+        sys.exit(1)
+    print("\nno plan sorts in memory")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=200000)
+    parser.add_argument("--depth", type=int, default=10000, help="rows before the deep page")
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(main(parser.parse_args()))
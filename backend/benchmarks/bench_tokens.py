@@ -0,0 +1,77 @@
+"""
+Cost of verifying an access token per request (no database access).
+
+Compares a plain python-jose decode with tokens.verify() for HS256, RS256
+and ES256 keys, on a cache miss (first sight of a token) and a cache hit
+(every later request with it), with --revoked other tokens in the
+revocation list. Also reports the Bloom filter's memory and its measured
+false positive rate.
+
+Run from the backend directory:
+    python benchmarks/bench_tokens.py --revoked 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+import uuid
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from jose import jwt
+import tokens
+
+def write_keys(directory: str):
+    keys = {
+        "rsa": rsa.generate_private_key(public_exponent=65537, key_size=2048),
+        "ec": ec.generate_private_key(ec.SECP256R1()),
+    }
+    for kid, key in keys.items():
+        with open(os.path.join(directory, f"{kid}.pem"), "wb") as output:
+            output.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                           serialization.NoEncryption()))
+
+def per_call(fn, number: int) -> float:
+    return timeit.timeit(fn, number=number) / number * 1e6
+
+def run(args):
+    directory = tempfile.mkdtemp(prefix="bench-keys-")
+    write_keys(directory)
+
+    revoked = [uuid.uuid4().hex for _ in range(args.revoked)]
+    tokens.revocations._rebuild(set(revoked))
+
+    print(f"{'key':<7} {'jose decode':>12} {'verify miss':>12} {'verify hit':>11}   (us/token)")
+    for kid in ("hs", "rsa", "ec"):
+        ring = tokens.KeyRing(directory, signing_kid=kid)
+        tokens.keyring = ring
+        key = ring.signing
+        token = tokens.issue({"sub": "bench@grocery.com"}, timedelta(minutes=30))
+
+        decode = per_call(lambda: jwt.decode(token, key.verifying_key, algorithms=[key.algorithm]), args.number)
+
+        def miss():
+            tokens.claims_cache.clear()
+            tokens.verify(token)
+        verify_miss = per_call(miss, args.number)
+
+        tokens.verify(token)
+        verify_hit = per_call(lambda: tokens.verify(token), args.number * 10)
+        print(f"{key.algorithm:<7} {decode:>12.1f} {verify_miss:>12.1f} {verify_hit:>11.2f}")
+
+    bloom = tokens.revocations._bloom
+    probes = [uuid.uuid4().hex for _ in range(100000)]
+    false_positives = sum(probe in bloom for probe in probes)
+    check = per_call(lambda: tokens.revocations.is_revoked(probes[0]), args.number * 10)
+    print(f"\nrevocation list: {args.revoked} ids, bloom {len(bloom._bits) / 1024:.0f} KiB, "
+          f"{bloom.hashes} hashes, false positives {false_positives / len(probes):.2%}, {check:.2f} us/check")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--revoked", type=int, default=100000, help="revoked token ids in the list")
+    parser.add_argument("--number", type=int, default=2000, help="iterations per measurement")
+    run(parser.parse_args())
@@ -0,0 +1,29 @@
+"""
+Seeded benchmark dataset, built with generate_data.py.
+
+seed_dataset(db, products=N, orders=M, users=U, seed=S) drops and fills the
+categories, products, users and orders collections; the same seed always
+produces the same documents. Every user, including the admin
+(admin@grocery.com), has the password BENCH_PASSWORD. Stock is topped up
+afterwards so order scenarios never run out.
+"""
+from generate_data import generate, NOUNS
+from category_counts import reconcile_product_counts
+
+BENCH_PASSWORD = "bench-password"
+
+async def seed_dataset(db, products: int = 1000, orders: int = 1000, users: int = 100, seed: int = 42) -> dict:
+    for name in ("payment_transactions", "order_events"):
+        await db[name].delete_many({})
+    generator = await generate(db, products=products, orders=orders, users=users, seed=seed,
+                               password=BENCH_PASSWORD, concurrency=1)
+    await db.products.update_many({"is_active": True}, {"$set": {"stock_count": 10 ** 9, "in_stock": True}})
+    await reconcile_product_counts(db)
+
+    categories = await db.categories.distinct("name")
+    return {
+        "categories": sorted(categories),
+        "product_ids": await db.products.distinct("_id", {"is_active": True}),
+        "user_emails": [generator.user_email(i) for i in range(users)],
+        "search_terms": [noun.lower() for noun in NOUNS]
+    }
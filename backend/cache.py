@@ -0,0 +1,56 @@
+"""
+In-process response cache with namespace versions.
+
+Entries are stored under (namespace, version, key). Invalidating a namespace
+just bumps its version, so every entry written before the bump becomes
+unreachable in O(1) and ages out through the TTL / size bound.
+"""
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+import os
+import time
+
+class VersionedCache:
+    def __init__(self, ttl_seconds: float = 30.0, max_entries: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._versions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, namespace: str) -> int:
+        return self._versions.get(namespace, 0)
+
+    def get(self, namespace: str, key: Hashable) -> Optional[Any]:
+        entry_key = (namespace, self.version(namespace), key)
+        entry = self._entries.get(entry_key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[entry_key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(entry_key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, namespace: str, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        entry_key = (namespace, self.version(namespace), key)
+        expires_at = time.monotonic() + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+        self._entries[entry_key] = (expires_at, value)
+        self._entries.move_to_end(entry_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, *namespaces: str):
+        for namespace in namespaces:
+            self._versions[namespace] = self.version(namespace) + 1
+
+# Shared cache for catalog reads (categories, products)
+catalog_cache = VersionedCache()
+
+# Authenticated users by email, in front of auth.get_user_by_email
+user_cache = VersionedCache(
+    ttl_seconds=float(os.getenv("USER_CACHE_SECONDS", "30")),
+    max_entries=10000
+)
@@ -0,0 +1,375 @@
+"""
+Server-side shopping carts.
+
+Hot carts live in memory and every change adjusts total_price/total_items
+incrementally. Changes are written behind to MongoDB every
+CART_WRITE_BEHIND_SECONDS as positional updates ($inc on "items.$" plus the
+totals, $push/$pull for added/removed lines) rather than rewriting the
+document. This assumes each cart is served by one worker (sticky sessions
+or a single worker): the in-memory copy is never refreshed from MongoDB.
+
+When several workers may serve the same cart, set
+CART_WRITE_BEHIND_SECONDS=0. Every request then loads the cart from
+MongoDB, and each change is written as the whole cart in one update
+conditional on the document's version. A write that lost a race with
+another worker reloads the cart, re-applies its changed lines on top and
+tries again, so concurrent changes to different lines are all kept and
+the totals always match the items.
+
+Abandoned carts are removed by a TTL index on expires_at.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from database import get_collection
+from models import Cart
+from typing import Optional
+import asyncio
+import os
+import uuid
+
+CART_TTL_DAYS = int(os.getenv("CART_TTL_DAYS", "14"))
+CART_CACHE_SIZE = int(os.getenv("CART_CACHE_SIZE", "10000"))
+CART_WRITE_BEHIND_SECONDS = float(os.getenv("CART_WRITE_BEHIND_SECONDS", "1.0"))
+CART_WRITE_ATTEMPTS = 5
+
+def user_cart_id(user_id: str) -> str:
+    return f"user:{user_id}"
+
+class CartState:
+    """
+    In-memory cart. `persisted` mirrors what MongoDB holds per product as
+    (quantity, price), so a flush can send only the difference.
+    """
+    __slots__ = ("id", "user_id", "items", "total_price", "total_items", "created_at", "persisted", "stored", "dirty",
+                 "version", "lock")
+
+    def __init__(self, cart_id: str, user_id: Optional[str] = None, document: Optional[dict] = None):
+        self.id = cart_id
+        self.user_id = user_id
+        self.items = {}
+        self.total_price = 0.0
+        self.total_items = 0
+        self.created_at = datetime.utcnow()
+        self.persisted = {}
+        self.stored = document is not None
+        self.dirty = set()
+        # Bumped by every write; carts from before versioning count as 0
+        self.version = 0
+        self.lock = asyncio.Lock()
+        if document:
+            self.version = document.get("version") or 0
+            self.user_id = document.get("user_id")
+            self.created_at = document.get("created_at", self.created_at)
+            for item in document.get("items", []):
+                self.items[item["product_id"]] = dict(item)
+                self.persisted[item["product_id"]] = (item["quantity"], item["price"])
+            self.total_price = document.get("total_price", 0.0)
+            self.total_items = document.get("total_items", 0)
+
+    def set_quantity(self, product: dict, quantity: int):
+        product_id = product["_id"] if "_id" in product else product["product_id"]
+        line = self.items.get(product_id)
+        if line is None:
+            if quantity <= 0:
+                return
+            line = {
+                "product_id": product_id,
+                "name": product["name"],
+                "price": product["price"],
+                "image": product["image"],
+                "quantity": 0,
+                "category": product["category"]
+            }
+            self.items[product_id] = line
+        delta = quantity - line["quantity"]
+        self.total_items += delta
+        self.total_price += delta * line["price"]
+        if quantity <= 0:
+            del self.items[product_id]
+        else:
+            line["quantity"] = quantity
+        self.dirty.add(product_id)
+
+    def add(self, product: dict, quantity: int):
+        product_id = product["_id"] if "_id" in product else product["product_id"]
+        current = self.items.get(product_id, {}).get("quantity", 0)
+        self.set_quantity(product, current + quantity)
+
+    def remove(self, product_id: str):
+        line = self.items.get(product_id)
+        if line:
+            self.set_quantity(line, 0)
+
+    def clear(self):
+        for product_id in list(self.items):
+            self.remove(product_id)
+
+    def to_dict(self) -> dict:
+        return Cart(
+            id=self.id,
+            user_id=self.user_id,
+            items=list(self.items.values()),
+            total_price=round(self.total_price, 2),
+            total_items=self.total_items,
+            created_at=self.created_at,
+            expires_at=datetime.utcnow() + timedelta(days=CART_TTL_DAYS)
+        ).dict(by_alias=True)
+
+    def pending_operations(self):
+        """
+        Translate changes since the last flush into positional updates.
+        Returns the operations and the line state they bring MongoDB to.
+        """
+        now = datetime.utcnow()
+        operations = []
+        snapshot = {}
+        if not self.stored:
+            operations.append(UpdateOne(
+                {"_id": self.id},
+                {"$setOnInsert": {
+                    "user_id": self.user_id, "items": [], "total_price": 0.0, "total_items": 0,
+                    "created_at": self.created_at, "is_active": True
+                }},
+                upsert=True
+            ))
+        for product_id in self.dirty:
+            before = self.persisted.get(product_id)
+            line = self.items.get(product_id)
+            after = (line["quantity"], line["price"]) if line else None
+            snapshot[product_id] = after
+            if before == after:
+                continue
+            if before and (after is None or after[1] != before[1]):
+                operations.append(UpdateOne(
+                    {"_id": self.id},
+                    {"$pull": {"items": {"product_id": product_id}},
+                     "$inc": {"total_items": -before[0], "total_price": -before[0] * before[1]}}
+                ))
+                before = None
+            if after is None:
+                continue
+            if before is None:
+                operations.append(UpdateOne(
+                    {"_id": self.id},
+                    {"$push": {"items": dict(line)},
+                     "$inc": {"total_items": after[0], "total_price": after[0] * after[1]}}
+                ))
+            else:
+                delta = after[0] - before[0]
+                operations.append(UpdateOne(
+                    {"_id": self.id, "items.product_id": product_id},
+                    {"$inc": {"items.$.quantity": delta, "total_items": delta, "total_price": delta * after[1]}}
+                ))
+        operations.append(UpdateOne(
+            {"_id": self.id},
+            {"$set": {"updated_at": now, "expires_at": now + timedelta(days=CART_TTL_DAYS)}, "$inc": {"version": 1}}
+        ))
+        return operations, snapshot
+
+    def rebase(self, document: Optional[dict]):
+        """
+        Adopt a newer stored cart, keeping this cart's unwritten lines on
+        top of it (the last writer wins per line)
+        """
+        changed = {product_id: self.items.get(product_id) for product_id in self.dirty}
+        fresh = CartState(self.id, self.user_id, document)
+        for product_id, line in changed.items():
+            if line is not None:
+                fresh.set_quantity(line, line["quantity"])
+            elif product_id in fresh.items:
+                fresh.remove(product_id)
+        for name in ("user_id", "items", "total_price", "total_items", "created_at", "persisted", "stored",
+                     "dirty", "version"):
+            setattr(self, name, getattr(fresh, name))
+
+    def replacement(self) -> dict:
+        """The whole cart as one update, for version-checked writes"""
+        now = datetime.utcnow()
+        items = list(self.items.values())
+        return {
+            "$set": {
+                "user_id": self.user_id,
+                "items": items,
+                "total_items": sum(line["quantity"] for line in items),
+                "total_price": sum(line["quantity"] * line["price"] for line in items),
+                "created_at": self.created_at,
+                "is_active": True,
+                "updated_at": now,
+                "expires_at": now + timedelta(days=CART_TTL_DAYS)
+            },
+            "$inc": {"version": 1}
+        }
+
+    def mark_flushed(self, snapshot: dict):
+        for product_id, state in snapshot.items():
+            if state is None:
+                self.persisted.pop(product_id, None)
+            else:
+                self.persisted[product_id] = state
+            # Lines changed again while the write was in flight stay dirty
+            line = self.items.get(product_id)
+            if state == ((line["quantity"], line["price"]) if line else None):
+                self.dirty.discard(product_id)
+        self.stored = True
+
+class CartStore:
+    def __init__(self, capacity: int = CART_CACHE_SIZE, flush_interval: float = CART_WRITE_BEHIND_SECONDS):
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self._carts: "OrderedDict[str, CartState]" = OrderedDict()
+        self._loading = {}
+        self._dirty = set()
+        self._flusher: Optional[asyncio.Task] = None
+
+    @property
+    def write_through(self) -> bool:
+        return self.flush_interval <= 0
+
+    async def get(self, cart_id: str, user_id: Optional[str] = None, create: bool = True) -> Optional[CartState]:
+        """
+        The cart with this id. An id that was never stored returns None
+        unless `create` is set, so made-up ids cost no memory or documents.
+        """
+        if self.write_through:
+            # Another worker may have changed it since this one last looked
+            carts_collection = await get_collection("carts")
+            document = await carts_collection.find_one({"_id": cart_id})
+            if document is None and not create:
+                return None
+            return CartState(cart_id, user_id, document)
+        cart = self._carts.get(cart_id)
+        if cart is not None:
+            self._carts.move_to_end(cart_id)
+            return cart
+        # Concurrent misses for the same cart share one load
+        key = (cart_id, create)
+        if key not in self._loading:
+            self._loading[key] = asyncio.ensure_future(self._load(cart_id, user_id, create))
+        try:
+            return await asyncio.shield(self._loading[key])
+        finally:
+            self._loading.pop(key, None)
+
+    async def _load(self, cart_id: str, user_id: Optional[str], create: bool) -> Optional[CartState]:
+        carts_collection = await get_collection("carts")
+        document = await carts_collection.find_one({"_id": cart_id})
+        cart = self._carts.get(cart_id)
+        if cart is None:
+            if document is None and not create:
+                return None
+            cart = CartState(cart_id, user_id, document)
+        self._carts[cart_id] = cart
+        await self._evict()
+        return cart
+
+    async def _evict(self):
+        while len(self._carts) > self.capacity:
+            cart_id, cart = next(iter(self._carts.items()))
+            if cart.dirty:
+                try:
+                    await self.flush_cart(cart)
+                except Exception as e:
+                    # Keep it cached and dirty; the periodic flush retries
+                    print(f"Error flushing cart {cart_id} for eviction: {e}")
+                    self._carts.move_to_end(cart_id)
+                    break
+            self._carts.pop(cart_id, None)
+
+    async def changed(self, cart: CartState):
+        """Record a mutation; written through immediately when write-behind is off"""
+        if self.write_through:
+            await self._write_versioned(cart)
+        else:
+            self._dirty.add(cart.id)
+
+    async def _write_versioned(self, cart: CartState):
+        carts_collection = await get_collection("carts")
+        for _ in range(CART_WRITE_ATTEMPTS):
+            version = cart.version
+            # Carts stored before versioning have no version field
+            expected = version if version else {"$in": [None, 0]}
+            try:
+                result = await carts_collection.update_one(
+                    {"_id": cart.id, "version": expected}, cart.replacement(), upsert=not cart.stored
+                )
+                written = result.matched_count or result.upserted_id is not None
+            except DuplicateKeyError:
+                # Another worker created the cart first
+                written = False
+            if written:
+                cart.version = version + 1
+                cart.stored = True
+                cart.persisted = {product_id: (line["quantity"], line["price"]) for product_id, line in cart.items.items()}
+                cart.dirty.clear()
+                return
+            cart.rebase(await carts_collection.find_one({"_id": cart.id}))
+        raise RuntimeError(f"Cart {cart.id} kept changing, giving up after {CART_WRITE_ATTEMPTS} attempts")
+
+    async def flush_cart(self, cart: CartState):
+        async with cart.lock:
+            self._dirty.discard(cart.id)
+            if not cart.stored and not cart.items:
+                # Emptied before it was ever written, nothing to store
+                cart.dirty.clear()
+                return
+            operations, snapshot = cart.pending_operations()
+            try:
+                carts_collection = await get_collection("carts")
+                await carts_collection.bulk_write(operations, ordered=True)
+            except Exception:
+                self._dirty.add(cart.id)
+                raise
+            cart.mark_flushed(snapshot)
+            if cart.dirty:
+                self._dirty.add(cart.id)
+
+    async def flush(self):
+        for cart_id in list(self._dirty):
+            cart = self._carts.get(cart_id)
+            if cart is not None:
+                try:
+                    await self.flush_cart(cart)
+                except Exception as e:
+                    print(f"Error flushing cart {cart_id}: {e}")
+
+    async def delete(self, cart_id: str):
+        self._carts.pop(cart_id, None)
+        self._dirty.discard(cart_id)
+        carts_collection = await get_collection("carts")
+        await carts_collection.delete_one({"_id": cart_id})
+
+    async def merge(self, anonymous_cart_id: str, user_id: str) -> CartState:
+        """Fold an anonymous cart into the user's cart and drop it"""
+        target = await self.get(user_cart_id(user_id), user_id)
+        source = await self.get(anonymous_cart_id, create=False)
+        if source is None:
+            return target
+        if source.user_id is None and source.items:
+            for line in list(source.items.values()):
+                target.add(line, line["quantity"])
+            await self.changed(target)
+        if source.user_id is None:
+            await self.delete(anonymous_cart_id)
+        return target
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self.flush_interval > 0 and self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+def new_cart_id() -> str:
+    return str(uuid.uuid4())
+
+cart_store = CartStore()
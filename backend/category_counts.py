@@ -0,0 +1,59 @@
+"""
+Denormalized Category.product_count maintenance.
+
+Product writes adjust the owning category with an atomic $inc so reads never
+have to count; reconcile_product_counts() rebuilds every counter from a
+single $group aggregation when they need to be brought back in line.
+"""
+from pymongo import UpdateOne
+from database import get_collection
+from datetime import datetime
+
+async def adjust_product_count(category_id: str, delta: int):
+    if not category_id or not delta:
+        return
+    categories_collection = await get_collection("categories")
+    await categories_collection.update_one(
+        {"_id": category_id},
+        {"$inc": {"product_count": delta}}
+    )
+
+async def move_product_count(old_category_id: str, new_category_id: str):
+    if old_category_id == new_category_id:
+        return
+    await adjust_product_count(old_category_id, -1)
+    await adjust_product_count(new_category_id, 1)
+
+async def reconcile_product_counts(db=None):
+    """
+    Recompute every category's product_count from the active products.
+    Returns the number of categories whose stored count was changed.
+    """
+    if db is None:
+        products_collection = await get_collection("products")
+        categories_collection = await get_collection("categories")
+    else:
+        products_collection = db.products
+        categories_collection = db.categories
+
+    pipeline = [
+        {"$match": {"is_active": True}},
+        {"$group": {"_id": "$category_id", "count": {"$sum": 1}}}
+    ]
+    counts = {
+        row["_id"]: row["count"]
+        async for row in products_collection.aggregate(pipeline)
+    }
+
+    operations = []
+    async for category in categories_collection.find({}, {"product_count": 1}):
+        count = counts.get(category["_id"], 0)
+        if category.get("product_count") != count:
+            operations.append(UpdateOne(
+                {"_id": category["_id"]},
+                {"$set": {"product_count": count, "updated_at": datetime.utcnow()}}
+            ))
+
+    if operations:
+        await categories_collection.bulk_write(operations, ordered=False)
+    return len(operations)
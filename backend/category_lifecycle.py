@@ -0,0 +1,104 @@
+"""
+Category lifecycle: propagate category deletes and renames to products.
+
+Products duplicate the category name and hold its id, so a category change
+has to be pushed down to them. Small categories are handled inline with a
+single update_many; large ones are processed in _id-ordered chunks by a
+background job whose progress is recorded in the category_jobs collection.
+"""
+from models import CategoryJob, JobStatus
+from database import get_collection
+from invalidation import bump
+from facets import facet_index
+from datetime import datetime
+import os
+
+CASCADE_CHUNK_SIZE = int(os.getenv("CATEGORY_CASCADE_CHUNK_SIZE", "1000"))
+
+def _product_changes(job: CategoryJob) -> dict:
+    if job.action == "delete":
+        return {"is_active": False}
+    return {"category": job.changes["name"]}
+
+def _product_filter(job: CategoryJob) -> dict:
+    query = {"category_id": job.category_id}
+    if job.action == "delete":
+        query["is_active"] = True
+    return query
+
+async def _save_progress(job: CategoryJob, **fields):
+    for key, value in fields.items():
+        setattr(job, key, value)
+    job.updated_at = datetime.utcnow()
+    jobs_collection = await get_collection("category_jobs")
+    await jobs_collection.update_one(
+        {"_id": job.id},
+        {"$set": {**fields, "updated_at": job.updated_at}}
+    )
+
+async def create_job(category_id: str, action: str, changes: dict = None) -> CategoryJob:
+    products_collection = await get_collection("products")
+    jobs_collection = await get_collection("category_jobs")
+
+    job = CategoryJob(category_id=category_id, action=action, changes=changes or {})
+    job.total = await products_collection.count_documents(_product_filter(job))
+    await jobs_collection.insert_one(job.dict(by_alias=True))
+    return job
+
+def runs_inline(job: CategoryJob) -> bool:
+    return job.total <= CASCADE_CHUNK_SIZE
+
+async def run_job(job: CategoryJob) -> CategoryJob:
+    """
+    Apply the job to every product of the category and record the outcome.
+    """
+    products_collection = await get_collection("products")
+    categories_collection = await get_collection("categories")
+    changes = {**_product_changes(job), "updated_at": datetime.utcnow()}
+    query = _product_filter(job)
+
+    try:
+        await _save_progress(job, status=JobStatus.RUNNING)
+
+        if runs_inline(job):
+            result = await products_collection.update_many(query, {"$set": changes})
+            processed = result.modified_count
+        else:
+            processed = 0
+            last_id = None
+            while True:
+                chunk_query = dict(query)
+                if last_id is not None:
+                    chunk_query["_id"] = {"$gt": last_id}
+                ids = [
+                    doc["_id"] async for doc in products_collection.find(chunk_query, {"_id": 1})
+                    .sort("_id", 1).limit(CASCADE_CHUNK_SIZE)
+                ]
+                if not ids:
+                    break
+                result = await products_collection.update_many(
+                    {"_id": {"$in": ids}},
+                    {"$set": changes}
+                )
+                processed += result.modified_count
+                last_id = ids[-1]
+                await _save_progress(job, processed=processed)
+
+        if job.action == "delete":
+            await categories_collection.update_one(
+                {"_id": job.category_id},
+                {"$set": {"product_count": 0}}
+            )
+
+        await _save_progress(job, status=JobStatus.COMPLETED, processed=processed)
+    except Exception as e:
+        await _save_progress(job, status=JobStatus.FAILED, error=str(e))
+    finally:
+        facet_index.mark_stale()
+        await bump("categories", "products")
+
+    return job
+
+async def get_job(job_id: str):
+    jobs_collection = await get_collection("category_jobs")
+    return await jobs_collection.find_one({"_id": job_id})
@@ -0,0 +1,227 @@
+"""
+Checkout: turn a client order request into a stored order.
+
+Prices come from the products collection, never from the client, and
+totals from the pricing engine. All referenced products are loaded with
+one $in query, and the stock
+decrements, the order and its pending payment record are written in a
+single transaction when the deployment supports one, retried when it
+conflicts with a concurrent checkout. Without transactions, a failure
+part way undoes the writes already made.
+"""
+from pymongo.errors import DuplicateKeyError
+from models import Order, OrderCreate, OrderItem, PaymentTransaction, PaymentStatus, QuoteRequest, User
+from database import get_collection, run_transaction
+from cache import catalog_cache
+from pricing import get_rules, PricingError
+from order_workflow import record_event
+from typing import Optional, Tuple
+
+PRODUCT_FIELDS = {
+    "name": 1, "price": 1, "original_price": 1, "image": 1,
+    "category": 1, "category_id": 1, "stock_count": 1
+}
+
+class CheckoutError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class _OutOfStock(Exception):
+    def __init__(self, product_id: str):
+        self.product_id = product_id
+
+def _line(product: dict, quantity: int) -> dict:
+    return {
+        "product_id": product["_id"],
+        "category_id": product.get("category_id"),
+        "price": product["price"],
+        "original_price": product.get("original_price"),
+        "quantity": quantity
+    }
+
+def _requested_quantities(items) -> dict:
+    quantities = {}
+    for item in items:
+        if item.quantity < 1:
+            raise CheckoutError(400, f"Invalid quantity for product {item.product_id}")
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    if not quantities:
+        raise CheckoutError(400, "Order has no items")
+    return quantities
+
+async def load_products(product_ids, use_cache: bool = False) -> dict:
+    """
+    Fetch active products by id with one $in query. Quotes may serve rows
+    from the catalog cache; checkout always reads fresh stock.
+    """
+    products = {}
+    missing = list(product_ids)
+    if use_cache:
+        missing = []
+        for product_id in product_ids:
+            product = catalog_cache.get("products", ("pricing", product_id))
+            if product is None:
+                missing.append(product_id)
+            else:
+                products[product_id] = product
+    if missing:
+        products_collection = await get_collection("products")
+        async for product in products_collection.find(
+            {"_id": {"$in": missing}, "is_active": True},
+            PRODUCT_FIELDS
+        ):
+            products[product["_id"]] = product
+            if use_cache:
+                catalog_cache.set("products", ("pricing", product["_id"]), product)
+    return products
+
+async def quote(request: QuoteRequest) -> dict:
+    quantities = _requested_quantities(request.items)
+    products = await load_products(list(quantities), use_cache=True)
+    lines = []
+    for product_id, quantity in quantities.items():
+        if product_id not in products:
+            raise CheckoutError(400, f"Product {product_id} is not available")
+        lines.append(_line(products[product_id], quantity))
+
+    rules = await get_rules()
+    try:
+        return rules.quote(lines, request.state, request.zip_code, request.delivery_option, request.coupon_code)
+    except PricingError as e:
+        raise CheckoutError(400, str(e))
+
+async def _find_existing(user_id: str, idempotency_key: Optional[str]):
+    if not idempotency_key:
+        return None
+    orders_collection = await get_collection("orders")
+    return await orders_collection.find_one({"user_id": user_id, "idempotency_key": idempotency_key})
+
+async def price_items(order_data: OrderCreate) -> Tuple[list, list, dict]:
+    """
+    Build authoritative order items from the catalog. Returns the items,
+    their pricing lines and the requested quantity per product id.
+    """
+    quantities = _requested_quantities(order_data.items)
+    products = await load_products(list(quantities))
+
+    items = []
+    lines = []
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if not product:
+            raise CheckoutError(400, f"Product {product_id} is not available")
+        if product.get("stock_count", 0) < quantity:
+            raise CheckoutError(409, f"Not enough stock for {product['name']}")
+        items.append(OrderItem(
+            product_id=product_id,
+            name=product["name"],
+            price=product["price"],
+            image=product["image"],
+            quantity=quantity,
+            category=product["category"]
+        ))
+        lines.append(_line(product, quantity))
+    return items, lines, quantities
+
+async def place_order(user: User, order_data: OrderCreate, idempotency_key: Optional[str] = None) -> Tuple[dict, bool]:
+    """
+    Create an order for the user. Returns (order document, created); created
+    is False when the idempotency key matched an order placed earlier.
+    """
+    existing = await _find_existing(user.id, idempotency_key)
+    if existing:
+        return existing, False
+
+    items, lines, quantities = await price_items(order_data)
+    rules = await get_rules()
+    try:
+        totals = rules.quote(
+            lines,
+            order_data.delivery_address.state,
+            order_data.delivery_address.zip_code,
+            order_data.delivery_option,
+            order_data.coupon_code
+        )
+    except PricingError as e:
+        raise CheckoutError(400, str(e))
+
+    order = Order(
+        user_id=user.id,
+        items=items,
+        delivery_address=order_data.delivery_address,
+        payment_method=order_data.payment_method,
+        delivery_option=order_data.delivery_option,
+        notes=order_data.notes,
+        coupon_code=order_data.coupon_code,
+        idempotency_key=idempotency_key,
+        subtotal=totals["subtotal"],
+        discount=totals["discount"],
+        tax=totals["tax"],
+        delivery_fee=totals["delivery_fee"],
+        total_price=totals["total_price"],
+        event_seq=1,
+        stock_reserved=True
+    )
+    payment = PaymentTransaction(
+        user_id=user.id,
+        order_id=order.id,
+        amount=order.total_price,
+        payment_status=PaymentStatus.PENDING,
+        metadata={"payment_method": order.payment_method}
+    )
+    order.payment_id = payment.id
+    order_dict = order.dict(by_alias=True)
+
+    products_collection = await get_collection("products")
+    orders_collection = await get_collection("orders")
+    transactions_collection = await get_collection("payment_transactions")
+
+    decremented = []
+    order_inserted = False
+    in_transaction = False
+
+    async def write(session):
+        nonlocal in_transaction, order_inserted
+        in_transaction = session is not None
+        # A retried transaction starts over
+        decremented.clear()
+        for product_id, quantity in quantities.items():
+            result = await products_collection.update_one(
+                {"_id": product_id, "is_active": True, "stock_count": {"$gte": quantity}},
+                {"$inc": {"stock_count": -quantity}},
+                session=session
+            )
+            if result.modified_count != 1:
+                raise _OutOfStock(product_id)
+            decremented.append(product_id)
+
+        await orders_collection.insert_one(order_dict, session=session)
+        order_inserted = True
+        await transactions_collection.insert_one(payment.dict(by_alias=True), session=session)
+
+    try:
+        await run_transaction(write)
+    except BaseException as e:
+        # Without a transaction whatever was already applied must be undone
+        if not in_transaction:
+            if order_inserted:
+                await orders_collection.delete_one({"_id": order.id})
+            for product_id in decremented:
+                await products_collection.update_one(
+                    {"_id": product_id},
+                    {"$inc": {"stock_count": quantities[product_id]}}
+                )
+        if isinstance(e, DuplicateKeyError):
+            # A concurrent retry with the same key won the race
+            existing = await _find_existing(user.id, idempotency_key)
+            if existing:
+                return existing, False
+            raise
+        if isinstance(e, _OutOfStock):
+            raise CheckoutError(409, f"Not enough stock for product {e.product_id}")
+        raise
+
+    await record_event(order.id, "created", {"status": order.status.value}, actor=user.id, sequence=1)
+    return order_dict, True
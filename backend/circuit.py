@@ -0,0 +1,86 @@
+"""
+Circuit breaker for calls to external services.
+
+After FAILURE_THRESHOLD consecutive failures the circuit opens and calls
+fail fast with CircuitOpenError for RESET_SECONDS. Then a single trial call
+is let through (half-open); success closes the circuit, failure opens it
+again.
+
+Only errors that say the service itself is failing count: connection
+errors, timeouts and 5xx responses (see is_outage). Anything else, such as
+a declined card or another 4xx from Stripe, is re-raised without being
+recorded.
+"""
+from typing import Awaitable, Callable, TypeVar
+import asyncio
+import os
+import stripe
+import time
+
+FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+T = TypeVar("T")
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+OUTAGE_ERRORS = (ConnectionError, TimeoutError, asyncio.TimeoutError, stripe.APIConnectionError)
+
+def is_outage(error: Exception) -> bool:
+    if isinstance(error, OUTAGE_ERRORS):
+        return True
+    status = getattr(error, "http_status", None)
+    return isinstance(status, int) and status >= 500
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_seconds: float = RESET_SECONDS,
+        is_failure: Callable[[Exception], bool] = is_outage
+    ):
+        self.name = name
+        self.is_failure = is_failure
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    async def call(self, function: Callable[[], Awaitable[T]]) -> T:
+        state = self.state
+        if state == self.OPEN or (state == self.HALF_OPEN and self._trial_running):
+            raise CircuitOpenError(self.name, max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at)))
+        self._trial_running = state == self.HALF_OPEN
+        try:
+            result = await function()
+        except Exception as e:
+            if not self.is_failure(e):
+                raise
+            self.failures += 1
+            if state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            raise
+        finally:
+            self._trial_running = False
+        self.failures = 0
+        self.opened_at = None
+        return result
+
+stripe_circuit = CircuitBreaker("stripe")
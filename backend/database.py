@@ -1,22 +1,45 @@
 import motor.motor_asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, OperationFailure
+import asyncio
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017/grocery_db")
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+MONGODB_TIMEOUT_MS = int(os.getenv("MONGODB_TIMEOUT_MS", "5000"))
 
 client: AsyncIOMotorClient = None
+_supports_transactions = None
 
 async def get_database():
     return client.grocery_db
 
 async def connect_to_mongo():
+    """
+    Create the Motor client and check the server answers. A failed ping is
+    logged, not raised: the client keeps reconnecting in the background and
+    the readiness probe reports the worker as not ready until it succeeds.
+    """
     global client
-    # Use demo database for quick deployment
-    print("Using demo in-memory database for quick deployment")
-    return True
+    if client is not None:
+        # Already configured, e.g. a mongomock client in benchmarks
+        return True
+    client = AsyncIOMotorClient(
+        MONGODB_URL,
+        maxPoolSize=MONGODB_MAX_POOL_SIZE,
+        serverSelectionTimeoutMS=MONGODB_TIMEOUT_MS
+    )
+    try:
+        await client.admin.command("ping")
+        print("Connected to MongoDB")
+        return True
+    except Exception as e:
+        print(f"Could not reach MongoDB: {e}")
+        return False
     
 async def close_mongo_connection():
     global client
@@ -26,4 +49,104 @@ async def close_mongo_connection():
 # Database collections
 async def get_collection(collection_name: str):
     db = await get_database()
-    return db[collection_name]
\ No newline at end of file
+    return db[collection_name]
+
+# Server error code when another client created the collection first
+NAMESPACE_EXISTS = 48
+# Backoff between attempts to (re)open a capped collection's tail
+TAIL_RETRY_MIN_SECONDS = 0.5
+TAIL_RETRY_MAX_SECONDS = 30.0
+
+async def get_capped_collection(collection_name: str, size_bytes: int):
+    """
+    Create a capped collection unless it already exists and return it. Losing
+    the creation race to another worker counts as success.
+    """
+    db = await get_database()
+    try:
+        await db.create_collection(collection_name, capped=True, size=size_bytes)
+    except CollectionInvalid:
+        pass
+    except OperationFailure as e:
+        if e.code != NAMESPACE_EXISTS:
+            raise
+    return db[collection_name]
+
+async def tail_capped_collection(collection_name: str, size_bytes: int, label: str):
+    """
+    Yield every entry inserted into a capped collection from now on, in
+    insertion order, for as long as the caller iterates. Failures, including
+    the database being unreachable at boot, are logged and retried with
+    backoff, so callers never need a fallback.
+
+    Entries are followed by position, not by _id: ObjectIds come from each
+    writer's clock and counter, so an entry from another worker can sort
+    below one already read. A reopened cursor reads the collection in
+    natural (insertion) order and skips up to the last entry seen. If that
+    entry was overwritten in the meantime everything left is newer; the
+    skip then also ends after as many entries as the collection held, so a
+    lost position never mutes the tail.
+    """
+    last_id = None
+    delay = TAIL_RETRY_MIN_SECONDS
+    while True:
+        try:
+            collection = await get_capped_collection(collection_name, size_bytes)
+            if last_id is None:
+                # Start after the newest entry; older ones predate this worker
+                newest = await collection.find_one({}, sort=[("$natural", -1)])
+                if newest is None:
+                    # A tailable cursor on an empty capped collection dies at once
+                    result = await collection.insert_one({"origin": None})
+                    newest = {"_id": result.inserted_id}
+                last_id = newest["_id"]
+            skipping = await collection.find_one({"_id": last_id}, {"_id": 1}) is not None
+            skip_limit = await collection.estimated_document_count() if skipping else 0
+            skipped = 0
+            cursor = collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+            while cursor.alive:
+                async for entry in cursor:
+                    delay = TAIL_RETRY_MIN_SECONDS
+                    if skipping:
+                        skipped += 1
+                        if entry["_id"] == last_id:
+                            skipping = False
+                            continue
+                        if skipped <= skip_limit:
+                            continue
+                        skipping = False
+                    last_id = entry["_id"]
+                    yield entry
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"{label} error, retrying in {delay:.1f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, TAIL_RETRY_MAX_SECONDS)
+            continue
+        # The cursor died without an error, e.g. the collection was dropped
+        await asyncio.sleep(TAIL_RETRY_MIN_SECONDS)
+
+async def supports_transactions() -> bool:
+    """Multi-document transactions need a replica set or sharded cluster"""
+    global _supports_transactions
+    if _supports_transactions is None:
+        try:
+            hello = await client.admin.command("hello")
+            _supports_transactions = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except Exception:
+            _supports_transactions = False
+    return _supports_transactions
+
+async def run_transaction(callback):
+    """
+    Await callback(session) inside a transaction and return its result, or
+    callback(None) when the deployment can't run one. Callers pass the
+    session as `session=` to every operation. The whole callback is re-run
+    on TransientTransactionError (e.g. a write conflict with a concurrent
+    transaction), so it must not keep state from a failed attempt.
+    """
+    if client is None or not await supports_transactions():
+        return await callback(None)
+    async with await client.start_session() as session:
+        return await session.with_transaction(callback)
@@ -0,0 +1,209 @@
+"""
+In-memory facet index for catalog browsing.
+
+Every active product gets a slot number; for each facet value (a brand, an
+origin, a tag, a price bucket, ...) the index keeps a bitset of the slots
+that have it, stored as a Python int so AND / OR / popcount run in C over
+the whole catalog at once. A query intersects the selected values (OR
+within a facet, AND across facets) and counts every value of every facet
+against the other facets' filters, so the counts say what each click would
+return.
+
+The index is loaded from MongoDB on first use. Product writes in this
+worker update it directly (upsert / remove); writes in other workers arrive
+as "products" bumps on the invalidation bus and trigger a reload, at most
+once per FACET_MIN_RELOAD_SECONDS. It is also reloaded every
+FACET_REFRESH_SECONDS to pick up direct database edits.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+from database import get_collection
+from invalidation import on_bump
+import asyncio
+import os
+import time
+
+FACET_REFRESH_SECONDS = float(os.getenv("FACET_REFRESH_SECONDS", "300"))
+FACET_MIN_RELOAD_SECONDS = float(os.getenv("FACET_MIN_RELOAD_SECONDS", "5"))
+
+# (label, lower bound inclusive, upper bound exclusive)
+PRICE_BUCKETS = [("0-2", 0, 2), ("2-5", 2, 5), ("5-10", 5, 10), ("10-20", 10, 20), ("20-50", 20, 50), ("50+", 50, None)]
+# Bands overlap: "4+" holds every product rated 4 or more
+RATING_BANDS = [("4.5+", 4.5), ("4+", 4.0), ("3+", 3.0), ("2+", 2.0), ("1+", 1.0)]
+
+FACETS = ("category_id", "brand", "origin", "tags", "price", "rating", "in_stock")
+PROJECTION = {"category_id": 1, "brand": 1, "origin": 1, "tags": 1, "price": 1, "rating": 1, "in_stock": 1}
+
+def price_bucket(price: float) -> Optional[str]:
+    for label, low, high in PRICE_BUCKETS:
+        if price >= low and (high is None or price < high):
+            return label
+    return None
+
+def facet_values(product: dict) -> List[Tuple[str, str]]:
+    values = []
+    for facet in ("category_id", "brand", "origin"):
+        if product.get(facet):
+            values.append((facet, product[facet]))
+    for tag in set(product.get("tags") or ()):
+        values.append(("tags", tag))
+    bucket = price_bucket(product.get("price") or 0)
+    if bucket:
+        values.append(("price", bucket))
+    rating = product.get("rating") or 0
+    for label, minimum in RATING_BANDS:
+        if rating >= minimum:
+            values.append(("rating", label))
+    values.append(("in_stock", "true" if product.get("in_stock", True) else "false"))
+    return values
+
+def iter_slots(bits: int) -> Iterable[int]:
+    """Set bit positions in ascending order"""
+    # bin() runs in C; scanning its reversed string beats shifting a huge int
+    digits = bin(bits)[:1:-1]
+    position = digits.find("1")
+    while position != -1:
+        yield position
+        position = digits.find("1", position + 1)
+
+def _bits_from_slots(slots: List[int], size: int) -> int:
+    buffer = bytearray((size + 7) // 8)
+    for slot in slots:
+        buffer[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(buffer, "little")
+
+class FacetIndex:
+    def __init__(self):
+        self._slots: Dict[str, int] = {}
+        self._ids: List[Optional[str]] = []
+        self._values: List[List[Tuple[str, str]]] = []
+        self._free: List[int] = []
+        self._all = 0
+        self._bits: Dict[str, Dict[str, int]] = {facet: {} for facet in FACETS}
+        self._loaded_at = float("-inf")
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def upsert(self, product: dict):
+        """Add or re-index an active product; inactive products are removed"""
+        if not product.get("is_active", True):
+            self.remove(product["_id"])
+            return
+        slot = self._slots.get(product["_id"])
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+                self._ids[slot] = product["_id"]
+            else:
+                slot = len(self._ids)
+                self._ids.append(product["_id"])
+                self._values.append([])
+            self._slots[product["_id"]] = slot
+        else:
+            self._clear_slot(slot)
+        bit = 1 << slot
+        values = facet_values(product)
+        for facet, value in values:
+            facet_bits = self._bits[facet]
+            facet_bits[value] = facet_bits.get(value, 0) | bit
+        self._values[slot] = values
+        self._all |= bit
+
+    def remove(self, product_id: str):
+        slot = self._slots.pop(product_id, None)
+        if slot is None:
+            return
+        self._clear_slot(slot)
+        self._all &= ~(1 << slot)
+        self._ids[slot] = None
+        self._free.append(slot)
+
+    def _clear_slot(self, slot: int):
+        mask = ~(1 << slot)
+        for facet, value in self._values[slot]:
+            facet_bits = self._bits[facet]
+            remaining = facet_bits[value] & mask
+            if remaining:
+                facet_bits[value] = remaining
+            else:
+                del facet_bits[value]
+        self._values[slot] = []
+
+    def mark_stale(self):
+        self._stale = True
+
+    async def load(self):
+        """
+        Rebuild from the database. Setting bits one by one on a growing int
+        is quadratic, so slots are collected per value first and each bitset
+        is built once from a bytearray.
+        """
+        products_collection = await get_collection("products")
+        ids, values, postings = [], [], {}
+        async for product in products_collection.find({"is_active": True}, PROJECTION):
+            slot = len(ids)
+            ids.append(product["_id"])
+            product_values = facet_values(product)
+            values.append(product_values)
+            for key in product_values:
+                postings.setdefault(key, []).append(slot)
+
+        bits = {facet: {} for facet in FACETS}
+        for (facet, value), slots in postings.items():
+            bits[facet][value] = _bits_from_slots(slots, len(ids))
+        self._slots = {product_id: slot for slot, product_id in enumerate(ids)}
+        self._ids, self._values, self._free = ids, values, []
+        self._all = (1 << len(ids)) - 1
+        self._bits = bits
+        self._loaded_at = time.monotonic()
+        self._stale = False
+
+    async def ensure_loaded(self):
+        age = time.monotonic() - self._loaded_at
+        if (self._stale and age >= FACET_MIN_RELOAD_SECONDS) or age >= FACET_REFRESH_SECONDS:
+            async with self._lock:
+                age = time.monotonic() - self._loaded_at
+                if (self._stale and age >= FACET_MIN_RELOAD_SECONDS) or age >= FACET_REFRESH_SECONDS:
+                    await self.load()
+
+    def _match(self, facet: str, values: Iterable[str]) -> int:
+        bits = 0
+        for value in values:
+            bits |= self._bits[facet].get(value, 0)
+        return bits
+
+    def query(self, filters: Dict[str, List[str]], offset: int = 0, limit: int = 20) -> dict:
+        """
+        `filters` maps facet -> selected values. Returns the matching product
+        ids for the page, the total and per-facet value counts.
+        """
+        selected = {facet: self._match(facet, values) for facet, values in filters.items() if values}
+        matched = self._all
+        for bits in selected.values():
+            matched &= bits
+
+        counts = {}
+        for facet in FACETS:
+            # Counts for a facet ignore its own selection, so sibling values stay clickable
+            base = self._all
+            for other, bits in selected.items():
+                if other != facet:
+                    base &= bits
+            counts[facet] = {
+                value: count for value, bits in self._bits[facet].items()
+                if (count := (bits & base).bit_count())
+            }
+
+        ids = []
+        for position, slot in enumerate(iter_slots(matched)):
+            if position >= offset + limit:
+                break
+            if position >= offset:
+                ids.append(self._ids[slot])
+        return {"ids": ids, "total": matched.bit_count(), "facets": counts}
+
+facet_index = FacetIndex()
+
+on_bump("products", facet_index.mark_stale, remote_only=True)
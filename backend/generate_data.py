@@ -0,0 +1,429 @@
+"""
+Generate a large synthetic dataset for reproducing production-scale
+performance problems locally.
+
+    python generate_data.py --products 1000000 --orders 10000000 --users 500000 --processes 4
+
+Documents follow the schemas in models.py (the first document of each kind
+is validated against its model). Distributions:
+    product popularity - Zipfian (--product-skew), so a few products appear
+                         in most orders, like a real catalog
+    customers          - Zipfian (--user-skew): repeat customers order more
+    order times        - spread over --days with yearly (December peak),
+                         weekly (weekend) and daily (lunch / evening) cycles
+Output is deterministic for a given --seed: every batch has its own random
+generator and ids are derived from the seed, so the result does not depend
+on --processes or --concurrency. All users share one password, hashed once;
+admin@grocery.com is an admin with the same password.
+
+Writes are unordered insert_many batches with --concurrency batches in
+flight per process. The target collections are dropped first, indexes are
+created after loading and category product counts reconciled at the end.
+"""
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from itertools import accumulate
+from math import cos, gcd, pi
+from models import Category, Product, discount_pct, User, Order, OrderStatus, UserRole
+from auth import get_password_hash
+from database import MONGODB_URL
+from indexes import ensure_indexes
+from category_counts import reconcile_product_counts
+import argparse
+import asyncio
+import multiprocessing
+import random
+import time
+import uuid
+
+BATCH_SIZE = 5000
+ADMIN_EMAIL = "admin@grocery.com"
+DEFAULT_PASSWORD = "password123"
+COLLECTIONS = ("categories", "products", "users", "orders")
+# Order history ends here rather than at "now", so output is reproducible
+HISTORY_END = datetime(2026, 1, 1)
+EPOCH = datetime(1970, 1, 1)
+
+CATEGORIES = [
+    ("Fruits", "🍎"), ("Vegetables", "🥕"), ("Dairy", "🥛"), ("Bakery", "🍞"),
+    ("Meat", "🥩"), ("Seafood", "🐟"), ("Beverages", "🧃"), ("Snacks", "🍿"),
+    ("Pantry", "🥫"), ("Frozen", "🧊"), ("Household", "🧽"), ("Baby", "🍼"),
+]
+ADJECTIVES = ["Organic", "Fresh", "Premium", "Local", "Crunchy", "Sweet", "Wild", "Smoked",
+              "Classic", "Golden", "Roasted", "Creamy", "Spicy", "Whole", "Natural", "Farmhouse"]
+NOUNS = ["Apples", "Carrots", "Milk", "Bread", "Chicken", "Juice", "Chips", "Rice", "Cheese",
+         "Berries", "Spinach", "Yogurt", "Bagels", "Salmon", "Coffee", "Almonds", "Pasta",
+         "Tomatoes", "Butter", "Honey", "Oats", "Beans", "Peppers", "Granola", "Tea"]
+BRANDS = ["Green Valley", "Farm Fresh", "Sunrise", "Harvest Co", "Blue Ridge", "Meadow",
+          "Orchard", "Golden Fields", "Prairie", "Coastal", "Nature's Best", "Hilltop"]
+ORIGINS = ["California", "Vermont", "Oregon", "Florida", "Mexico", "Canada", "Italy",
+           "Washington", "Texas", "Local Farm", "Chile", "New Zealand"]
+TAGS = ["organic", "gluten-free", "vegan", "local", "fresh", "sugar-free", "high-protein",
+        "seasonal", "non-gmo", "keto", "fair-trade", "family-size"]
+FIRST_NAMES = ["Alex", "Sam", "Jordan", "Taylor", "Morgan", "Casey", "Riley", "Jamie",
+               "Avery", "Quinn", "Drew", "Robin", "Skyler", "Reese", "Parker", "Rowan"]
+LAST_NAMES = ["Smith", "Garcia", "Chen", "Johnson", "Patel", "Kim", "Brown", "Nguyen",
+              "Lopez", "Miller", "Davis", "Wilson", "Khan", "Martin", "Lee", "Clark"]
+CITIES = [("Los Angeles", "CA", "90"), ("San Francisco", "CA", "94"), ("New York", "NY", "10"),
+          ("Austin", "TX", "78"), ("Dallas", "TX", "75"), ("Chicago", "IL", "60"),
+          ("Seattle", "WA", "98"), ("Miami", "FL", "33"), ("Denver", "CO", "80"), ("Boston", "MA", "02")]
+DELIVERY_OPTIONS = (("standard", 0.8), ("express", 0.2))
+PAYMENT_METHODS = (("card", 0.85), ("cash", 0.15))
+
+# Relative order volume by hour of day, Monday..Sunday, and around the year
+HOURLY = [0.1, 0.05, 0.03, 0.03, 0.05, 0.1, 0.3, 0.6, 0.8, 0.9, 1.0, 1.2,
+          1.4, 1.2, 1.0, 1.0, 1.1, 1.4, 1.6, 1.5, 1.2, 0.8, 0.5, 0.25]
+WEEKDAY = [0.95, 0.9, 0.9, 0.95, 1.05, 1.3, 1.25]
+YEARLY_AMPLITUDE = 0.25
+PEAK_INTENSITY = max(HOURLY) * max(WEEKDAY) * (1 + YEARLY_AMPLITUDE)
+
+def stable_id(seed: int, kind: str, index: int) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_OID, f"{seed}:{kind}:{index}"))
+
+def batch_rng(seed: int, kind: str, batch: int) -> random.Random:
+    return random.Random(f"{seed}:{kind}:{batch}")
+
+class ZipfSampler:
+    """
+    Draws indices 0..n-1 with P(rank k) ~ 1/k^skew. Ranks are spread over the
+    index space by a fixed permutation so popular items are not all the
+    first ones generated.
+    """
+    def __init__(self, n: int, skew: float):
+        self.n = n
+        self.cumulative = list(accumulate(1.0 / (rank ** skew) for rank in range(1, n + 1)))
+        self.total = self.cumulative[-1]
+        self.stride = next(p for p in (7919, 104729, 1299709, 15485863) if gcd(p, n) == 1) if n > 1 else 1
+
+    def sample(self, rng: random.Random) -> int:
+        rank = bisect_left(self.cumulative, rng.random() * self.total)
+        return (min(rank, self.n - 1) * self.stride) % self.n
+
+class SeasonalClock:
+    """Order timestamps between `start` and `end` following HOURLY/WEEKDAY/yearly cycles"""
+    def __init__(self, start: datetime, end: datetime):
+        self.start = (start - EPOCH).total_seconds()
+        self.span = (end - EPOCH).total_seconds() - self.start
+
+    @staticmethod
+    def intensity(timestamp: float) -> float:
+        days = timestamp / 86400
+        day_of_year = days % 365.25
+        weekday = (int(days) + 3) % 7  # 1970-01-01 was a Thursday
+        hour = int(timestamp % 86400 // 3600)
+        yearly = 1 + YEARLY_AMPLITUDE * cos(2 * pi * (day_of_year - 355) / 365.25)
+        return HOURLY[hour] * WEEKDAY[weekday] * yearly
+
+    def sample(self, rng: random.Random) -> datetime:
+        # Rejection sampling against the peak intensity
+        while True:
+            timestamp = self.start + rng.random() * self.span
+            if rng.random() * PEAK_INTENSITY <= self.intensity(timestamp):
+                return EPOCH + timedelta(seconds=timestamp)
+
+def _weighted(rng: random.Random, options) -> str:
+    roll = rng.random()
+    for value, weight in options:
+        roll -= weight
+        if roll < 0:
+            return value
+    return options[-1][0]
+
+class Generator:
+    """Builds documents; everything an order needs about a product derives from its index"""
+    def __init__(self, seed: int, products: int, users: int, days: int, product_skew: float,
+                 user_skew: float, hashed_password: str, end: datetime):
+        self.seed = seed
+        self.products = products
+        self.users = users
+        self.hashed_password = hashed_password
+        self.end = end
+        self.clock = SeasonalClock(end - timedelta(days=days), end)
+        self.product_sampler = ZipfSampler(products, product_skew) if products else None
+        self.user_sampler = ZipfSampler(users, user_skew) if users else None
+        self.category_ids = [stable_id(seed, "category", i) for i in range(len(CATEGORIES))]
+
+    # Deterministic per-product attributes, cheap enough to recompute per order item
+    def product_id(self, index: int) -> str:
+        return stable_id(self.seed, "product", index)
+
+    def product_name(self, index: int) -> str:
+        return f"{ADJECTIVES[index % len(ADJECTIVES)]} {NOUNS[index // len(ADJECTIVES) % len(NOUNS)]} #{index}"
+
+    def product_price(self, index: int) -> float:
+        return round(0.99 + (index * 7919 % 4900) / 100, 2)
+
+    def product_category(self, index: int) -> int:
+        return (index * 31 + index // len(CATEGORIES)) % len(CATEGORIES)
+
+    def user_id(self, index: int) -> str:
+        return stable_id(self.seed, "user", index)
+
+    def user_email(self, index: int) -> str:
+        return f"user{index}@example.com"
+
+    def address(self, rng: random.Random) -> dict:
+        city, state, zip_prefix = rng.choice(CITIES)
+        return {
+            "street": f"{rng.randint(1, 9999)} {rng.choice(LAST_NAMES)} St",
+            "city": city,
+            "state": state,
+            "zip_code": f"{zip_prefix}{rng.randint(100, 999)}"
+        }
+
+    def category_docs(self) -> list:
+        now = self.end
+        return [
+            {
+                "_id": self.category_ids[i], "created_at": now, "updated_at": now, "is_active": True,
+                "name": name, "icon": icon, "color": "bg-green-100 text-green-800",
+                "description": f"{name} department", "product_count": 0
+            }
+            for i, (name, icon) in enumerate(CATEGORIES)
+        ]
+
+    def product_doc(self, rng: random.Random, index: int) -> dict:
+        price = self.product_price(index)
+        category = self.product_category(index)
+        created_at = self.clock.sample(rng)
+        stock = 0 if rng.random() < 0.03 else rng.randint(5, 500)
+        is_active = rng.random() > 0.01
+        original_price = round(price * rng.uniform(1.1, 1.4), 2) if rng.random() < 0.15 else None
+        return {
+            "_id": self.product_id(index), "created_at": created_at, "updated_at": created_at,
+            "is_active": is_active,
+            "name": self.product_name(index),
+            "price": price,
+            "original_price": original_price,
+            "discount_pct": discount_pct(price, original_price),
+            "image": "/placeholder.svg",
+            "images": [],
+            "rating": round(min(5.0, max(1.0, rng.gauss(4.2, 0.5))), 1),
+            "review_count": min(20000, int(rng.paretovariate(1.2)) - 1),
+            "category": CATEGORIES[category][0],
+            "category_id": self.category_ids[category],
+            "brand": rng.choice(BRANDS),
+            "in_stock": stock > 0,
+            "stock_count": stock,
+            "description": f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS).lower()} from {rng.choice(ORIGINS)}.",
+            "features": rng.sample(["Fresh", "Quality checked", "Sustainably sourced", "Award winning"], 2),
+            "nutrition_facts": {
+                "calories": rng.randint(0, 600), "carbs": f"{rng.randint(0, 60)}g",
+                "fiber": f"{rng.randint(0, 12)}g", "sugar": f"{rng.randint(0, 40)}g",
+                "protein": f"{rng.randint(0, 35)}g", "fat": f"{rng.randint(0, 30)}g"
+            },
+            "tags": rng.sample(TAGS, rng.randint(1, 3)),
+            "weight": f"{rng.randint(1, 64)} oz",
+            "origin": rng.choice(ORIGINS),
+            "sku": f"SKU-{index:08d}"
+        }
+
+    def user_doc(self, rng: random.Random, index: int) -> dict:
+        created_at = self.clock.sample(rng)
+        return {
+            "_id": self.user_id(index), "created_at": created_at, "updated_at": created_at, "is_active": True,
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "email": self.user_email(index),
+            "phone": f"+1555{rng.randint(0, 9999999):07d}",
+            "role": UserRole.CUSTOMER.value,
+            "address": self.address(rng),
+            "preferences": {"notifications": True, "marketing": rng.random() < 0.3, "dark_mode": rng.random() < 0.2},
+            "hashed_password": self.hashed_password,
+            "is_verified": rng.random() < 0.9,
+            "avatar": None
+        }
+
+    def admin_doc(self) -> dict:
+        return {
+            "_id": stable_id(self.seed, "admin", 0), "created_at": self.end, "updated_at": self.end,
+            "is_active": True, "name": "Admin User", "email": ADMIN_EMAIL, "phone": "+1234567890",
+            "role": UserRole.ADMIN.value, "address": None,
+            "preferences": {"notifications": True, "marketing": False, "dark_mode": False},
+            "hashed_password": self.hashed_password, "is_verified": True, "avatar": None
+        }
+
+    def order_doc(self, rng: random.Random, index: int) -> dict:
+        items = {}
+        for _ in range(min(self.products, 1 + int(rng.expovariate(0.35)))):
+            product = self.product_sampler.sample(rng)
+            if product not in items:
+                items[product] = {
+                    "product_id": self.product_id(product),
+                    "name": self.product_name(product),
+                    "price": self.product_price(product),
+                    "image": "/placeholder.svg",
+                    "quantity": 1 + int(rng.expovariate(0.8)),
+                    "category": CATEGORIES[self.product_category(product)][0]
+                }
+        items = list(items.values())
+        subtotal = round(sum(item["price"] * item["quantity"] for item in items), 2)
+        delivery_option = _weighted(rng, DELIVERY_OPTIONS)
+        delivery_fee = 9.99 if delivery_option == "express" else (0.0 if subtotal >= 50 else 5.99)
+        tax = round(subtotal * 0.1, 2)
+        created_at = self.clock.sample(rng)
+        age = self.end - created_at
+        if age > timedelta(days=3):
+            status = OrderStatus.CANCELLED if rng.random() < 0.06 else OrderStatus.DELIVERED
+        else:
+            status = rng.choice(list(OrderStatus))
+        return {
+            "_id": stable_id(self.seed, "order", index), "created_at": created_at,
+            "updated_at": created_at + timedelta(hours=rng.randint(0, 48)) if age > timedelta(days=2) else created_at,
+            "is_active": True,
+            "user_id": self.user_id(self.user_sampler.sample(rng)),
+            "items": items,
+            "total_price": round(subtotal + tax + delivery_fee, 2),
+            "subtotal": subtotal,
+            "tax": tax,
+            "delivery_fee": delivery_fee,
+            "status": status.value,
+            "delivery_address": self.address(rng),
+            "payment_method": _weighted(rng, PAYMENT_METHODS),
+            "payment_id": None,
+            "delivery_option": delivery_option,
+            "notes": None,
+            "discount": 0.0,
+            "coupon_code": None,
+            "idempotency_key": None,
+            "event_seq": 0
+        }
+
+    def batch(self, kind: str, batch: int, count: int) -> list:
+        rng = batch_rng(self.seed, kind, batch)
+        build = {"products": self.product_doc, "users": self.user_doc, "orders": self.order_doc}[kind]
+        first = batch * BATCH_SIZE
+        return [build(rng, index) for index in range(first, min(first + BATCH_SIZE, count))]
+
+MODELS = {"categories": Category, "products": Product, "users": User, "orders": Order}
+
+def validate_samples(generator: Generator, counts: dict):
+    """Fail fast if the generated documents drifted from models.py"""
+    Category.model_validate(generator.category_docs()[0])
+    User.model_validate(generator.admin_doc())
+    for kind in ("products", "users", "orders"):
+        if counts[kind]:
+            MODELS[kind].model_validate(generator.batch(kind, 0, 1)[0])
+
+async def write_batches(db, generator: Generator, counts: dict, worker: int, workers: int, concurrency: int) -> dict:
+    """Insert this worker's share of batches (batch % workers == worker)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    written = {kind: 0 for kind in counts}
+    errors = []
+    tasks = []
+
+    async def insert(kind, documents):
+        try:
+            await db[kind].insert_many(documents, ordered=False)
+            written[kind] += len(documents)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            semaphore.release()
+
+    # Products and users first, orders reference them
+    for kind in ("products", "users", "orders"):
+        batches = (counts[kind] + BATCH_SIZE - 1) // BATCH_SIZE
+        for batch in range(worker, batches, workers):
+            await semaphore.acquire()
+            if errors:
+                break
+            # The next batch is generated while earlier ones are being written
+            tasks.append(asyncio.create_task(insert(kind, generator.batch(kind, batch, counts[kind]))))
+        await asyncio.gather(*tasks)
+        tasks.clear()
+        if errors:
+            raise errors[0]
+    return written
+
+def _worker_process(arguments):
+    settings, worker = arguments
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def run():
+        client = AsyncIOMotorClient(settings["mongodb_url"])
+        try:
+            generator = Generator(**settings["generator"])
+            return await write_batches(client.grocery_db, generator, settings["counts"], worker,
+                                       settings["processes"], settings["concurrency"])
+        finally:
+            client.close()
+
+    return asyncio.run(run())
+
+async def generate(db, products: int = 1000, orders: int = 1000, users: int = 100, seed: int = 42,
+                   days: int = 365, product_skew: float = 1.1, user_skew: float = 0.8,
+                   password: str = DEFAULT_PASSWORD, concurrency: int = 4, processes: int = 1,
+                   mongodb_url: str = MONGODB_URL) -> Generator:
+    """
+    Drop and regenerate the catalog, users and orders in `db`. With
+    processes > 1 the batches are split over worker processes, each with
+    its own client to `mongodb_url` (which must point at `db`).
+    """
+    counts = {"products": products, "users": users, "orders": orders}
+    end = HISTORY_END
+    settings = {
+        "generator": {
+            "seed": seed, "products": products, "users": users, "days": days,
+            "product_skew": product_skew, "user_skew": user_skew,
+            "hashed_password": get_password_hash(password), "end": end
+        },
+        "counts": counts, "processes": processes, "concurrency": concurrency, "mongodb_url": mongodb_url
+    }
+    generator = Generator(**settings["generator"])
+    validate_samples(generator, counts)
+
+    for name in COLLECTIONS:
+        await db[name].drop()
+    await db.categories.insert_many(generator.category_docs())
+    await db.users.insert_one(generator.admin_doc())
+
+    if processes > 1:
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(processes) as pool:
+            results = await asyncio.get_running_loop().run_in_executor(
+                None, pool.map, _worker_process, [(settings, worker) for worker in range(processes)]
+            )
+        written = {kind: sum(result[kind] for result in results) for kind in counts}
+    else:
+        written = await write_batches(db, generator, counts, 0, 1, concurrency)
+
+    if written != counts:
+        raise RuntimeError(f"Wrote {written}, expected {counts}")
+    return generator
+
+async def main(args):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    import database
+    database.client = AsyncIOMotorClient(MONGODB_URL)
+    db = await database.get_database()
+
+    start = time.perf_counter()
+    await generate(
+        db, products=args.products, orders=args.orders, users=args.users, seed=args.seed,
+        days=args.days, product_skew=args.product_skew, user_skew=args.user_skew,
+        password=args.password, concurrency=args.concurrency, processes=args.processes
+    )
+    loaded = time.perf_counter() - start
+    total = args.products + args.orders + args.users
+    print(f"Inserted {args.products} products, {args.users} users and {args.orders} orders "
+          f"in {loaded:.1f}s ({total / loaded:.0f} documents/s)")
+
+    await ensure_indexes()
+    await reconcile_product_counts(db)
+    print(f"Indexes and category counts done in {time.perf_counter() - start - loaded:.1f}s")
+    print(f"Users: user<N>@example.com and {ADMIN_EMAIL}, password: {args.password}")
+    database.client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--orders", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--days", type=int, default=365, help="length of the order history")
+    parser.add_argument("--product-skew", type=float, default=1.1, help="Zipf exponent of product popularity")
+    parser.add_argument("--user-skew", type=float, default=0.8, help="Zipf exponent of orders per user")
+    parser.add_argument("--password", default=DEFAULT_PASSWORD)
+    parser.add_argument("--concurrency", type=int, default=4, help="insert_many batches in flight per process")
+    parser.add_argument("--processes", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,103 @@
+"""
+Liveness and readiness probes.
+
+Liveness only says the process is serving requests. Readiness checks the
+dependencies a request needs:
+    database   - ping round trip under HEALTH_MAX_PING_MS
+    pool       - connections left in the MongoDB pool
+    indexes    - every declared index exists; unique ones back correctness
+    event_loop - lag under HEALTH_MAX_LOOP_LAG_MS
+    stripe     - circuit breaker state; an open circuit marks the worker
+                 degraded but keeps it ready, since every worker shares the
+                 same Stripe and draining them all would not help
+The result is cached for HEALTH_CACHE_SECONDS and concurrent probes share
+one check, so probes never add load to the database.
+
+Draining makes readiness fail at once while the worker keeps serving, so
+the load balancer moves traffic away before shutdown. It is switched on for
+every worker on the host by creating HEALTH_DRAIN_FILE, since a request
+reaches only one worker and could not drain the rest.
+"""
+from circuit import stripe_circuit, CircuitBreaker
+from metrics import pool_listener
+import database
+import ratelimit
+import asyncio
+import os
+import time
+
+HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", "2"))
+HEALTH_MAX_PING_MS = float(os.getenv("HEALTH_MAX_PING_MS", "500"))
+HEALTH_MAX_LOOP_LAG_MS = float(os.getenv("HEALTH_MAX_LOOP_LAG_MS", "500"))
+HEALTH_DRAIN_FILE = os.getenv("HEALTH_DRAIN_FILE", "/tmp/grocery-api.drain")
+
+_cached = None
+_cached_at = 0.0
+_lock = asyncio.Lock()
+
+def is_draining() -> bool:
+    return os.path.exists(HEALTH_DRAIN_FILE)
+
+async def _check_database() -> dict:
+    if database.client is None:
+        return {"ok": False, "error": "not connected"}
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(database.client.admin.command("ping"), HEALTH_MAX_PING_MS / 1000)
+    except asyncio.TimeoutError:
+        return {"ok": False, "error": f"ping slower than {HEALTH_MAX_PING_MS:.0f}ms"}
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    return {"ok": True, "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+def _check_pool() -> dict:
+    max_size = getattr(getattr(getattr(database.client, "options", None), "pool_options", None), "max_pool_size", None)
+    if not isinstance(max_size, int):
+        max_size = database.MONGODB_MAX_POOL_SIZE
+    available = max_size - pool_listener.checked_out
+    return {
+        "ok": available > 0 or pool_listener.waiting == 0,
+        "checked_out": pool_listener.checked_out,
+        "waiting": pool_listener.waiting,
+        "max_size": max_size
+    }
+
+def _check_indexes() -> dict:
+    from indexes import index_builder
+    return {"ok": index_builder.ready, "missing": sorted(index_builder.missing)}
+
+def _check_event_loop() -> dict:
+    lag_ms = ratelimit.stats.loop_lag * 1000
+    return {"ok": lag_ms <= HEALTH_MAX_LOOP_LAG_MS, "lag_ms": round(lag_ms, 1)}
+
+def _check_stripe() -> dict:
+    state = stripe_circuit.state
+    return {"ok": state != CircuitBreaker.OPEN, "circuit": state}
+
+async def _run_checks(require_database: bool) -> dict:
+    checks = {"event_loop": _check_event_loop(), "stripe": _check_stripe()}
+    if require_database:
+        checks["database"] = await _check_database()
+        checks["pool"] = _check_pool()
+        checks["indexes"] = _check_indexes()
+    ready = all(checks[name]["ok"] for name in checks if name != "stripe")
+    return {
+        "status": ("degraded" if not checks["stripe"]["ok"] else "ready") if ready else "not_ready",
+        "ready": ready,
+        "checks": checks
+    }
+
+async def readiness(require_database: bool = True) -> dict:
+    global _cached, _cached_at
+    if is_draining():
+        return {"status": "draining", "ready": False, "checks": {}}
+    if _cached is None or time.monotonic() - _cached_at >= HEALTH_CACHE_SECONDS:
+        async with _lock:
+            # Another probe may have refreshed the result while we waited
+            if _cached is None or time.monotonic() - _cached_at >= HEALTH_CACHE_SECONDS:
+                _cached = await _run_checks(require_database)
+                _cached_at = time.monotonic()
+    return _cached
+
+def liveness() -> dict:
+    return {"status": "alive", "draining": is_draining()}
@@ -0,0 +1,248 @@
+"""
+Product image uploads and resized derivatives.
+
+Uploads are streamed to disk in chunks (never held in memory whole) while
+being hashed, then checked with Pillow and stored once under their content
+hash in MEDIA_DIR/originals, so uploading the same file twice stores it
+once. Decoding and resizing are CPU bound and run in a process pool, off
+the event loop and outside the GIL.
+
+Derivatives are named {hash}-{width}.{format} and are generated on first
+request for one of the IMAGE_WIDTHS, in WebP, AVIF (when this Pillow build
+has an encoder) or JPEG. They are written to MEDIA_DIR/derivatives and
+kept under an LRU disk budget of MEDIA_CACHE_BYTES; evicted files are
+regenerated on demand. A name always maps to the same bytes, so responses
+are cacheable forever.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from typing import Optional, Tuple
+from singleflight import image_flights
+import aiofiles
+import aiofiles.os
+import asyncio
+import hashlib
+import os
+import re
+import uuid
+
+MEDIA_DIR = os.getenv("MEDIA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "media"))
+MEDIA_MAX_UPLOAD_BYTES = int(os.getenv("MEDIA_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+MEDIA_MAX_PIXELS = int(os.getenv("MEDIA_MAX_PIXELS", str(40_000_000)))
+MEDIA_CACHE_BYTES = int(os.getenv("MEDIA_CACHE_BYTES", str(512 * 1024 * 1024)))
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+IMAGE_WIDTHS = tuple(sorted(int(width) for width in os.getenv("IMAGE_WIDTHS", "160,320,640,1024,1600").split(",")))
+
+ORIGINALS_DIR = os.path.join(MEDIA_DIR, "originals")
+DERIVATIVES_DIR = os.path.join(MEDIA_DIR, "derivatives")
+
+CHUNK_SIZE = 64 * 1024
+# Pillow format name -> stored extension
+UPLOAD_FORMATS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+# extension -> (Pillow format, save options, media type)
+OUTPUT_FORMATS = {
+    "avif": ("AVIF", {"quality": 60}, "image/avif"),
+    "webp": ("WEBP", {"quality": 80, "method": 4}, "image/webp"),
+    "jpg": ("JPEG", {"quality": 85, "optimize": True, "progressive": True}, "image/jpeg"),
+}
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+DERIVATIVE_NAME = re.compile(r"^([0-9a-f]{32})-(\d+)\.([a-z]+)$")
+
+class ImageError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+# Run in worker processes; module-level so they can be pickled
+
+def _inspect(path: str, max_pixels: int) -> Tuple[str, int, int]:
+    from PIL import Image
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    with Image.open(path) as image:
+        image.verify()
+    with Image.open(path) as image:
+        return image.format, image.width, image.height
+
+def _render(source: str, destination: str, width: int, extension: str):
+    from PIL import Image, ImageOps
+    image_format, options, _ = OUTPUT_FORMATS[extension]
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        if image_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        image.save(destination, format=image_format, **options)
+
+def _supported_outputs() -> Tuple[str, ...]:
+    """Output extensions this Pillow build can encode, preferred first"""
+    from PIL import Image
+    Image.init()
+    return tuple(extension for extension, (image_format, _, _) in OUTPUT_FORMATS.items() if image_format in Image.SAVE)
+
+class DiskLRU:
+    """Byte budget over the files of one directory, least recently served evicted first"""
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._loaded = False
+
+    def load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and DERIVATIVE_NAME.match(entry.name):
+                stat = entry.stat()
+                entries.append((stat.st_atime, entry.name, stat.st_size))
+        self._files.clear()
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+        self.size = sum(self._files.values())
+        self._loaded = True
+
+    def touch(self, name: str) -> bool:
+        if not self._loaded:
+            self.load()
+        if name not in self._files:
+            return False
+        self._files.move_to_end(name)
+        return True
+
+    def add(self, name: str, size: int):
+        self.size += size - self._files.get(name, 0)
+        self._files[name] = size
+        self._files.move_to_end(name)
+        while self.size > self.max_bytes and len(self._files) > 1:
+            evicted, evicted_size = self._files.popitem(last=False)
+            self.size -= evicted_size
+            try:
+                os.unlink(os.path.join(self.directory, evicted))
+            except FileNotFoundError:
+                pass
+
+    def discard(self, name: str):
+        size = self._files.pop(name, None)
+        if size is not None:
+            self.size -= size
+
+class ImageStore:
+    def __init__(self):
+        self.outputs = _supported_outputs()
+        self.derivatives = DiskLRU(DERIVATIVES_DIR, MEDIA_CACHE_BYTES)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=MEDIA_WORKERS)
+        return self._pool
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor(), fn, *args)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def original_path(self, digest: str) -> Optional[str]:
+        for extension in UPLOAD_FORMATS.values():
+            path = os.path.join(ORIGINALS_DIR, f"{digest}.{extension}")
+            if os.path.exists(path):
+                return path
+        return None
+
+    async def save_upload(self, upload) -> dict:
+        """Stream an UploadFile to disk; returns the stored image's description"""
+        os.makedirs(ORIGINALS_DIR, exist_ok=True)
+        temporary = os.path.join(ORIGINALS_DIR, f".upload-{uuid.uuid4().hex}")
+        digest = hashlib.sha256()
+        received = 0
+        try:
+            async with aiofiles.open(temporary, "wb") as output:
+                while chunk := await upload.read(CHUNK_SIZE):
+                    received += len(chunk)
+                    if received > MEDIA_MAX_UPLOAD_BYTES:
+                        raise ImageError(413, f"Image larger than {MEDIA_MAX_UPLOAD_BYTES} bytes")
+                    digest.update(chunk)
+                    await output.write(chunk)
+            if not received:
+                raise ImageError(400, "Empty upload")
+
+            try:
+                image_format, width, height = await self._run(_inspect, temporary, MEDIA_MAX_PIXELS)
+            except Exception:
+                raise ImageError(400, "Not a readable image")
+            if image_format not in UPLOAD_FORMATS:
+                raise ImageError(415, f"Unsupported image format {image_format}")
+
+            name = digest.hexdigest()[:32]
+            path = os.path.join(ORIGINALS_DIR, f"{name}.{UPLOAD_FORMATS[image_format]}")
+            # Same content, same name: a re-upload just drops the copy
+            if await aiofiles.os.path.exists(path):
+                await aiofiles.os.remove(temporary)
+            else:
+                await aiofiles.os.replace(temporary, path)
+        except BaseException:
+            if await aiofiles.os.path.exists(temporary):
+                await aiofiles.os.remove(temporary)
+            raise
+        return self.describe(name, width, height, received)
+
+    def describe(self, digest: str, width: int, height: int, size: int) -> dict:
+        # Sizes past the original's width would only repeat it
+        widths = [candidate for candidate in IMAGE_WIDTHS if candidate <= width] or [IMAGE_WIDTHS[0]]
+        preferred = self.outputs[0]
+        return {
+            "id": digest,
+            "width": width,
+            "height": height,
+            "bytes": size,
+            "url": image_url(digest, widths[-1], preferred),
+            "srcset": {
+                extension: ", ".join(f"{image_url(digest, candidate, extension)} {candidate}w" for candidate in widths)
+                for extension in self.outputs
+            }
+        }
+
+    async def derivative(self, name: str) -> Tuple[str, str]:
+        """Path and media type of a derivative, generating it if needed"""
+        match = DERIVATIVE_NAME.match(name)
+        if not match:
+            raise ImageError(404, "Image not found")
+        digest, width, extension = match.group(1), int(match.group(2)), match.group(3)
+        if width not in IMAGE_WIDTHS or extension not in self.outputs:
+            raise ImageError(404, "Image not found")
+
+        path = os.path.join(DERIVATIVES_DIR, name)
+        if self.derivatives.touch(name) and os.path.exists(path):
+            return path, OUTPUT_FORMATS[extension][2]
+        self.derivatives.discard(name)
+        # Concurrent first requests for one size share a single render
+        await image_flights.do(name, lambda: self._generate(digest, width, extension, path))
+        return path, OUTPUT_FORMATS[extension][2]
+
+    async def _generate(self, digest: str, width: int, extension: str, path: str):
+        source = self.original_path(digest)
+        if source is None:
+            raise ImageError(404, "Image not found")
+        os.makedirs(DERIVATIVES_DIR, exist_ok=True)
+        temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            await self._run(_render, source, temporary, width, extension)
+            await aiofiles.os.replace(temporary, path)
+        except BaseException:
+            if await aiofiles.os.path.exists(temporary):
+                await aiofiles.os.remove(temporary)
+            raise
+        self.derivatives.add(os.path.basename(path), (await aiofiles.os.stat(path)).st_size)
+
+def image_url(digest: str, width: int, extension: str) -> str:
+    return f"/api/media/images/{digest}-{width}.{extension}"
+
+image_store = ImageStore()
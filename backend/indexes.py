@@ -0,0 +1,117 @@
+"""
+Index declarations, created at startup by IndexBuilder.
+"""
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.collation import Collation
+from database import get_collection
+import asyncio
+import database
+import os
+import sorting
+
+INDEX_RETRY_SECONDS = float(os.getenv("INDEX_RETRY_SECONDS", "5"))
+
+# Emails compare case-insensitively; lookups pass this to use the index
+EMAIL_COLLATION = Collation(locale="en", strength=2)
+
+INDEXES = {
+    # One account per address however it is capitalised; registration
+    # relies on it instead of checking first
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True, collation=EMAIL_COLLATION, name="email_unique"),
+    ],
+    # One pair per listing sort mode, see sorting.py
+    "products": sorting.INDEXES,
+    "orders": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)]),
+        # Recommendation updates read orders after a (created_at, _id) watermark
+        IndexModel([("created_at", ASCENDING), ("_id", ASCENDING)]),
+        # Retried checkouts with the same key resolve to the original order
+        IndexModel(
+            [("user_id", ASCENDING), ("idempotency_key", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"idempotency_key": {"$type": "string"}},
+            name="user_idempotency_key_unique"
+        ),
+    ],
+    # Abandoned carts are dropped once expires_at passes
+    "carts": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "order_events": [
+        IndexModel([("order_id", ASCENDING), ("seq", ASCENDING)], unique=True),
+    ],
+    # Revoked token ids are only needed until the token would have expired
+    "revoked_tokens": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    # Sessions idle past REFRESH_TOKEN_EXPIRE_DAYS, see sessions.py
+    "sessions": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "product_recommendations": [
+        IndexModel([("seq", ASCENDING)]),
+    ],
+    "payment_transactions": [
+        IndexModel([("order_id", ASCENDING)]),
+    ],
+}
+
+async def ensure_indexes(collection_names=None) -> list:
+    """Create the declared indexes; returns the collections that failed"""
+    failed = []
+    for collection_name in collection_names or list(INDEXES):
+        try:
+            collection = await get_collection(collection_name)
+            await collection.create_indexes(INDEXES[collection_name])
+        except Exception as e:
+            print(f"Error creating indexes for {collection_name}: {e}")
+            failed.append(collection_name)
+    return failed
+
+class IndexBuilder:
+    """
+    Creates the indexes in the background once MongoDB answers, retrying
+    every INDEX_RETRY_SECONDS until all exist. Unique indexes back
+    correctness (one account per email, one order per idempotency key), so
+    readiness fails until `ready`. Callbacks registered with on_ready (data
+    backfills) run once after that; their failures are logged.
+    """
+    def __init__(self):
+        self.missing = set(INDEXES)
+        self.ready = False
+        self._callbacks = []
+        self._task = None
+
+    def on_ready(self, callback):
+        if callback not in self._callbacks:
+            self._callbacks.append(callback)
+
+    async def _run(self):
+        while True:
+            try:
+                # Wait for the server first instead of timing out once per collection
+                await database.client.admin.command("ping")
+                self.missing = set(await ensure_indexes(sorted(self.missing)))
+            except Exception as e:
+                print(f"Waiting for MongoDB to create indexes: {e}")
+            if not self.missing:
+                self.ready = True
+                break
+            await asyncio.sleep(INDEX_RETRY_SECONDS)
+        for callback in self._callbacks:
+            try:
+                await callback()
+            except Exception as e:
+                print(f"Error in {callback.__name__} after creating indexes: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+index_builder = IndexBuilder()
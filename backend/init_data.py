@@ -5,6 +5,7 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from models import Product, Category, User, NutritionFacts, UserRole
 from auth import get_password_hash
 from database import MONGODB_URL
+from category_counts import reconcile_product_counts
 import asyncio
 
 async def init_database():
@@ -260,12 +261,7 @@ async def init_database():
     await db.users.insert_one(admin_user.dict(by_alias=True))
     
     # Update category product counts
-    for category_name, category_id in category_map.items():
-        count = await db.products.count_documents({"category_id": category_id, "is_active": True})
-        await db.categories.update_one(
-            {"_id": category_id},
-            {"$set": {"product_count": count}}
-        )
+    await reconcile_product_counts(db)
     
     print("Database initialized with sample data!")
     print("Admin credentials:")
@@ -2,20 +2,19 @@
 Initialize the database with sample data
 """
 from motor.motor_asyncio import AsyncIOMotorClient
-from passlib.context import CryptContext
 import asyncio
 import uuid
 from datetime import datetime
 import os
 from dotenv import load_dotenv
+from category_counts import reconcile_product_counts
+from passwords import policy
 
 load_dotenv()
 
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017/grocery_db")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return policy.hash(password)
 
 async def init_database():
     """Initialize database with sample data"""
@@ -327,12 +326,7 @@ async def init_database():
     await db.users.insert_one(admin_user)
     
     # Update category product counts
-    for category_name, category_id in category_map.items():
-        count = await db.products.count_documents({"category_id": category_id, "is_active": True})
-        await db.categories.update_one(
-            {"_id": category_id},
-            {"$set": {"product_count": count}}
-        )
+    await reconcile_product_counts(db)
     
     print("Database initialized with sample data!")
     print("Admin credentials:")
@@ -0,0 +1,124 @@
+"""
+Cross-worker cache invalidation bus.
+
+Mutating handlers call `await bump("products", ...)` instead of touching a
+cache directly. The bump is applied to this worker's caches right away and
+broadcast to the other workers, which apply it when they receive it.
+
+Backends:
+    mongo - a capped "invalidations" collection read with a tailable
+            await cursor (works on standalone servers, unlike change streams)
+    local - in-process only, for single-worker deployments
+INVALIDATION_BUS picks one; "auto" (default) uses mongo whenever a database
+client is configured.
+"""
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+from cache import catalog_cache, user_cache
+import database
+import asyncio
+import os
+import uuid
+
+INVALIDATION_BUS = os.getenv("INVALIDATION_BUS", "auto")
+CAPPED_COLLECTION = "invalidations"
+CAPPED_SIZE_BYTES = 1024 * 1024
+
+# Namespaces backed by a cache; other namespaces only reach listeners
+CACHES = {
+    "categories": catalog_cache,
+    "products": catalog_cache,
+    "users": user_cache,
+}
+
+WORKER_ID = str(uuid.uuid4())
+
+_listeners: Dict[str, List[Tuple[Callable[[], None], bool]]] = {}
+_backend = None
+
+def on_bump(namespace: str, callback: Callable[[], None], remote_only: bool = False):
+    """
+    Run `callback` in every worker whenever `namespace` is bumped. With
+    remote_only, skip bumps issued by this worker (for state that the
+    writing worker already updated itself).
+    """
+    _listeners.setdefault(namespace, []).append((callback, remote_only))
+
+def apply(namespaces, remote: bool = False):
+    for namespace in namespaces:
+        if namespace in CACHES:
+            CACHES[namespace].invalidate(namespace)
+        for callback, remote_only in _listeners.get(namespace, ()):
+            if remote_only and not remote:
+                continue
+            try:
+                callback()
+            except Exception as e:
+                print(f"Invalidation listener for {namespace} failed: {e}")
+
+class LocalBus:
+    async def publish(self, namespaces):
+        pass
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+class CappedCollectionBus:
+    """
+    Bumps are inserted into a capped collection; every worker tails it and
+    applies bumps issued by other workers. The tail keeps retrying while
+    the database is unreachable, at boot or later, so a worker never drops
+    out of the bus for good.
+    """
+    def __init__(self):
+        self._task = None
+        self._collection = None
+        self.received = 0
+        self.last_latency = None
+
+    async def publish(self, namespaces):
+        if self._collection is None:
+            self._collection = await database.get_capped_collection(CAPPED_COLLECTION, CAPPED_SIZE_BYTES)
+        await self._collection.insert_one({
+            "origin": WORKER_ID,
+            "namespaces": list(namespaces),
+            "sent_at": datetime.utcnow()
+        })
+
+    async def _tail(self):
+        async for message in database.tail_capped_collection(CAPPED_COLLECTION, CAPPED_SIZE_BYTES, "Invalidation bus"):
+            if message.get("origin") in (WORKER_ID, None):
+                continue
+            self.received += 1
+            self.last_latency = (datetime.utcnow() - message["sent_at"]).total_seconds()
+            apply(message["namespaces"], remote=True)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._tail())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+async def bump(*namespaces: str):
+    """Invalidate `namespaces` here and on every other worker"""
+    apply(namespaces)
+    if _backend is not None:
+        try:
+            await _backend.publish(namespaces)
+        except Exception as e:
+            print(f"Error broadcasting invalidation of {namespaces}: {e}")
+
+async def start():
+    global _backend
+    use_mongo = INVALIDATION_BUS == "mongo" or (INVALIDATION_BUS == "auto" and database.client is not None)
+    _backend = CappedCollectionBus() if use_mongo else LocalBus()
+    await _backend.start()
+
+async def stop():
+    if _backend is not None:
+        await _backend.stop()
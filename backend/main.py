@@ -1,16 +1,26 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from ratelimit import loop_lag_monitor
+import health
 from routers import auth_demo
 from demo_database import demo_db
 import os
 from pydantic import BaseModel
 from typing import Optional
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_lag_monitor.start()
+    yield
+    await loop_lag_monitor.stop()
+
 app = FastAPI(
     title="Grocery Ecommerce API - Demo Version",
     description="Demo Backend API for Grocery Ecommerce Application",
-    version="1.0.0-demo"
+    version="1.0.0-demo",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -29,9 +39,19 @@ app.include_router(auth_demo.router, prefix="/api/auth", tags=["Authentication"]
 async def root():
     return {"message": "Grocery Ecommerce Demo API is running", "version": "demo"}
 
+@app.get("/health/live")
+async def liveness_check():
+    return health.liveness()
+
+@app.get("/health/ready")
+async def readiness_check():
+    # The demo serves from memory, there is no database to check
+    result = await health.readiness(require_database=False)
+    return JSONResponse(status_code=200 if result["ready"] else 503, content=result)
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "message": "Demo API is running"}
+    return await readiness_check()
 
 # Demo products endpoint
 @app.get("/api/products")
@@ -1,9 +1,23 @@
 from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from contextlib import asynccontextmanager
 from database import connect_to_mongo, close_mongo_connection
-from routers import auth, products, categories, orders, payments, admin
+from indexes import index_builder
+from sorting import backfill_discounts
+from carts import cart_store
+from recommendations import related_index
+from images import image_store
+from media_files import media_files
+from tokens import revocations
+from order_workflow import restock_retrier
+from auth import calibrate_password_hashing
+import invalidation
+import pubsub
+from ratelimit import AdmissionMiddleware, loop_lag_monitor
+from metrics import MetricsMiddleware, registry
+import health
+from routers import auth, products, categories, orders, payments, admin, cart, media
 from models import ApiResponse
 import os
 from dotenv import load_dotenv
@@ -14,8 +28,28 @@ load_dotenv()
 async def lifespan(app: FastAPI):
     # Startup
     await connect_to_mongo()
+    # Runs once MongoDB answers; a failed backfill is logged, not fatal
+    index_builder.on_ready(backfill_discounts)
+    index_builder.start()
+    await calibrate_password_hashing()
+    await invalidation.start()
+    await pubsub.start()
+    cart_store.start()
+    loop_lag_monitor.start()
+    related_index.start()
+    revocations.start()
+    restock_retrier.start()
     yield
     # Shutdown
+    await index_builder.stop()
+    await restock_retrier.stop()
+    await revocations.stop()
+    await related_index.stop()
+    image_store.shutdown()
+    await loop_lag_monitor.stop()
+    await cart_store.stop()
+    await pubsub.stop()
+    await invalidation.stop()
     await close_mongo_connection()
 
 app = FastAPI(
@@ -25,6 +59,9 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Rate limiting and load shedding, inside CORS so rejections carry CORS headers
+app.add_middleware(AdmissionMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -34,21 +71,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request metrics, outermost so shed and rejected requests are counted too
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(products.router, prefix="/api/products", tags=["Products"])
 app.include_router(categories.router, prefix="/api/categories", tags=["Categories"])
 app.include_router(orders.router, prefix="/api/orders", tags=["Orders"])
+app.include_router(cart.router, prefix="/api/cart", tags=["Cart"])
 app.include_router(payments.router, prefix="/api/payments", tags=["Payments"])
 app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
+app.include_router(media.router, prefix="/api/media", tags=["Media"])
+
+# Catalog media from CATALOG_MEDIA_DIR
+app.mount("/media", media_files, name="media")
 
 @app.get("/")
 async def root():
     return {"message": "Grocery Ecommerce API is running"}
 
+@app.get("/health/live")
+async def liveness_check():
+    return health.liveness()
+
+@app.get("/health/ready")
+async def readiness_check():
+    result = await health.readiness()
+    return JSONResponse(status_code=200 if result["ready"] else 503, content=result)
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "message": "API is running"}
+    return await readiness_check()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
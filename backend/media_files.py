@@ -0,0 +1,310 @@
+"""
+Static media serving: conditional requests, ranges, precompressed variants.
+
+MediaFiles is an ASGI app mounted at /media that serves the files under
+CATALOG_MEDIA_DIR. Compared with Starlette's StaticFiles it:
+    - keeps file metadata (size, mtime, ETag, media type, precompressed
+      variants) in an LRU for MEDIA_STAT_CACHE_SECONDS, so a hot file costs
+      no stat() calls and no thread hop before the response starts; misses
+      (404s) are cached too
+    - answers If-None-Match / If-Modified-Since with 304
+    - serves single byte ranges (Range, If-Range) with 206 / 416
+    - serves file.br / file.gz instead of file when the client accepts that
+      encoding
+    - hands the file to the server instead of copying it through Python when
+      the server offers the ASGI zero-copy extension
+      ("http.response.zerocopysend", i.e. sendfile) or "pathsend". Servers
+      without either (uvicorn) get the file read with pread in one worker
+      thread hop per 256 KiB.
+send_file() is the same path for single files chosen by a route handler.
+"""
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+from starlette.responses import Response
+import anyio
+import mimetypes
+import os
+import stat
+import time
+
+CATALOG_MEDIA_DIR = os.getenv(
+    "CATALOG_MEDIA_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "public")
+)
+MEDIA_CACHE_CONTROL = os.getenv("MEDIA_CACHE_CONTROL", "public, max-age=3600")
+MEDIA_STAT_CACHE_SECONDS = float(os.getenv("MEDIA_STAT_CACHE_SECONDS", "10"))
+MEDIA_STAT_CACHE_ENTRIES = int(os.getenv("MEDIA_STAT_CACHE_ENTRIES", "10000"))
+
+READ_CHUNK = 256 * 1024
+# Preferred first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+mimetypes.add_type("image/svg+xml", ".svg")
+
+class FileInfo:
+    __slots__ = ("path", "size", "mtime", "etag", "last_modified", "media_type", "variants")
+
+    def __init__(self, path: str, stat_result: os.stat_result, media_type: str, suffix: str = ""):
+        self.path = path
+        self.size = stat_result.st_size
+        self.mtime = int(stat_result.st_mtime)
+        self.etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}{suffix}"'
+        self.last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        self.media_type = media_type
+        self.variants: Dict[str, "FileInfo"] = {}
+
+def _stat_regular(path: str) -> Optional[os.stat_result]:
+    try:
+        stat_result = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        return None
+    return stat_result if stat.S_ISREG(stat_result.st_mode) else None
+
+def load_file_info(path: str, media_type: Optional[str] = None, variants: bool = True) -> Optional[FileInfo]:
+    """Stat a file and, with `variants`, its precompressed siblings"""
+    stat_result = _stat_regular(path)
+    if stat_result is None:
+        return None
+    media_type = media_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+    info = FileInfo(path, stat_result, media_type)
+    for encoding, extension in ENCODINGS if variants else ():
+        variant = _stat_regular(path + extension)
+        if variant is not None:
+            info.variants[encoding] = FileInfo(path + extension, variant, media_type, f"-{encoding}")
+    return info
+
+class StatCache:
+    """LRU of FileInfo (or None for missing files) by path, with a TTL"""
+    def __init__(self, ttl_seconds: float = MEDIA_STAT_CACHE_SECONDS, max_entries: int = MEDIA_STAT_CACHE_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Optional[FileInfo]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Tuple[bool, Optional[FileInfo]]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, entry[1]
+
+    def set(self, key: str, info: Optional[FileInfo]):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, info)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+def _etag_matches(header: str, etag: str) -> bool:
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+def _not_modified(scope, info: FileInfo) -> bool:
+    if_none_match = _header(scope, b"if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, info.etag)
+    if_modified_since = _header(scope, b"if-modified-since")
+    if if_modified_since:
+        try:
+            return info.mtime <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+class _Unsatisfiable(Exception):
+    pass
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    (first, last) byte of a single "bytes=" range; None means serve the
+    whole file (no usable range, or several ranges, which we do not split)
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash:
+        return None
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise _Unsatisfiable()
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise _Unsatisfiable()
+    return start, min(end, size - 1)
+
+def _choose_variant(scope, info: FileInfo) -> Tuple[FileInfo, Optional[str]]:
+    if info.variants:
+        accept_encoding = _header(scope, b"accept-encoding") or ""
+        accepted = {
+            part.split(";")[0].strip() for part in accept_encoding.split(",")
+            if not part.replace(" ", "").endswith(";q=0")
+        }
+        for encoding, _ in ENCODINGS:
+            if encoding in accepted and encoding in info.variants:
+                return info.variants[encoding], encoding
+    return info, None
+
+async def _send_body(scope, send, file, offset: int, count: int, whole: bool):
+    extensions = scope.get("extensions") or {}
+    if "http.response.zerocopysend" in extensions:
+        await send({"type": "http.response.zerocopysend", "file": file, "offset": offset, "count": count})
+        return
+    if whole and "http.response.pathsend" in extensions:
+        await send({"type": "http.response.pathsend", "path": file.name})
+        return
+    descriptor = file.fileno()
+    remaining = count
+    position = offset
+    while True:
+        chunk = await anyio.to_thread.run_sync(os.pread, descriptor, min(READ_CHUNK, remaining), position)
+        remaining -= len(chunk)
+        position += len(chunk)
+        # A file truncated under us ends the body early rather than hanging
+        more_body = remaining > 0 and bool(chunk)
+        await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+        if not more_body:
+            break
+
+async def send_file(scope, send, info: FileInfo, cache_control: str = MEDIA_CACHE_CONTROL,
+                    extra_headers: Optional[List[Tuple[bytes, bytes]]] = None):
+    """Respond to a GET/HEAD with `info`, honouring validators, ranges and encodings"""
+    selected, encoding = _choose_variant(scope, info)
+    headers = [
+        (b"etag", selected.etag.encode()),
+        (b"last-modified", selected.last_modified.encode()),
+        (b"cache-control", cache_control.encode()),
+        (b"accept-ranges", b"bytes"),
+    ]
+    if info.variants:
+        headers.append((b"vary", b"Accept-Encoding"))
+    if extra_headers:
+        headers.extend(extra_headers)
+
+    if _not_modified(scope, selected):
+        await send({"type": "http.response.start", "status": 304, "headers": headers})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    headers.append((b"content-type", selected.media_type.encode()))
+    if encoding:
+        headers.append((b"content-encoding", encoding.encode()))
+
+    status, first, last = 200, 0, selected.size - 1
+    range_header = _header(scope, b"range")
+    if_range = _header(scope, b"if-range")
+    if range_header and selected.size and (if_range is None or if_range.strip() == selected.etag):
+        try:
+            requested = parse_range(range_header, selected.size)
+        except _Unsatisfiable:
+            headers.append((b"content-range", f"bytes */{selected.size}".encode()))
+            headers.append((b"content-length", b"0"))
+            await send({"type": "http.response.start", "status": 416, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        if requested is not None:
+            status, (first, last) = 206, requested
+            headers.append((b"content-range", f"bytes {first}-{last}/{selected.size}".encode()))
+
+    count = last - first + 1 if selected.size else 0
+    headers.append((b"content-length", str(count).encode()))
+    if scope["method"] == "HEAD" or count == 0:
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": b""})
+        return
+    # Opened before the headers go out, so a file deleted since it was
+    # cached is still a clean 404
+    try:
+        file = open(selected.path, "rb", buffering=0)
+    except OSError:
+        await _send_status(send, 404, b"Not Found")
+        return
+    with file:
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await _send_body(scope, send, file, first, count, whole=status == 200)
+
+class FileInfoResponse(Response):
+    """Route-level response for a file looked up with load_file_info()"""
+    def __init__(self, info: FileInfo, cache_control: str = MEDIA_CACHE_CONTROL,
+                 headers: Optional[Dict[str, str]] = None):
+        # Headers are built per request in send_file; nothing to render here
+        self.status_code = 200
+        self.background = None
+        self.info = info
+        self.cache_control = cache_control
+        self.extra_headers = [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()]
+
+    async def __call__(self, scope, receive, send):
+        await send_file(scope, send, self.info, self.cache_control, self.extra_headers)
+
+async def _send_status(send, status: int, body: bytes, headers: Optional[List[Tuple[bytes, bytes]]] = None):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"text/plain; charset=utf-8"), (b"content-length", str(len(body)).encode())] + (headers or [])
+    })
+    await send({"type": "http.response.body", "body": body})
+
+class MediaFiles:
+    def __init__(self, directory: str = CATALOG_MEDIA_DIR, cache_control: str = MEDIA_CACHE_CONTROL,
+                 stat_cache: Optional[StatCache] = None):
+        self.directory = os.path.realpath(directory)
+        self.cache_control = cache_control
+        self.stat_cache = stat_cache or StatCache()
+
+    def _lookup(self, relative: str) -> Optional[FileInfo]:
+        full_path = os.path.realpath(os.path.join(self.directory, relative))
+        # Symlinks and ".." must not lead out of the media directory
+        if os.path.commonpath([full_path, self.directory]) != self.directory:
+            return None
+        return load_file_info(full_path)
+
+    async def __call__(self, scope, receive, send):
+        assert scope["type"] == "http"
+        if scope["method"] not in ("GET", "HEAD"):
+            await _send_status(send, 405, b"Method Not Allowed", [(b"allow", b"GET, HEAD")])
+            return
+
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        relative = os.path.normpath(path.lstrip("/")) if path.strip("/") else ""
+        if not relative or relative.startswith(".."):
+            await _send_status(send, 404, b"Not Found")
+            return
+
+        found, info = self.stat_cache.get(relative)
+        if not found:
+            info = await anyio.to_thread.run_sync(self._lookup, relative)
+            self.stat_cache.set(relative, info)
+        if info is None:
+            await _send_status(send, 404, b"Not Found")
+            return
+        await send_file(scope, send, info, self.cache_control)
+
+media_files = MediaFiles()
@@ -0,0 +1,305 @@
+"""
+Prometheus metrics, exposed at /metrics in the text exposition format.
+
+Request metrics are recorded by MetricsMiddleware. Series are keyed by
+(method, route template) rather than the raw path, so cardinality is fixed
+by the routing table; the label sets for every route are registered on the
+first request. Request-path counters are plain ints mutated from the event
+loop thread only, so they need no locks. Everything else (event loop lag,
+MongoDB pool, bcrypt pool, caches, admission control) is read from the
+owning module when /metrics is scraped.
+"""
+from bisect import bisect_left
+from pymongo import monitoring
+from typing import Callable, Dict, Iterable, Tuple
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: Dict[tuple, float] = {}
+
+    def register(self, *labels):
+        self.values.setdefault(labels, 0)
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, _labels(self.labelnames, labels), value
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, labels: tuple, value: float):
+        self.values[labels] = value
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [count per bucket (non-cumulative) ..., +Inf count, sum]
+        self.values: Dict[tuple, list] = {}
+
+    def register(self, *labels):
+        self.values.setdefault(labels, [0] * (len(self.buckets) + 1) + [0.0])
+
+    def observe(self, labels: tuple, value: float):
+        series = self.values.get(labels)
+        if series is None:
+            self.register(*labels)
+            series = self.values[labels]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        for labels, series in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                yield f"{self.name}_bucket", _labels(self.labelnames, labels, f'le="{bound}"'), cumulative
+            yield f"{self.name}_count", _labels(self.labelnames, labels), cumulative
+            yield f"{self.name}_sum", _labels(self.labelnames, labels), series[-1]
+
+class Collected:
+    """Series computed at scrape time by `collect`, yielding (labels, value)"""
+    def __init__(self, name: str, documentation: str, kind: str, labelnames: Tuple[str, ...],
+                 collect: Callable[[], Iterable[Tuple[tuple, float]]]):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = labelnames
+        self.collect = collect
+
+    def samples(self):
+        for labels, value in self.collect():
+            yield self.name, _labels(self.labelnames, labels), value
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> bytes:
+        lines = []
+        for metric in self.metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                print(f"Error collecting metric {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{labels} {value}")
+        return ("\n".join(lines) + "\n").encode()
+
+registry = Registry()
+
+ROUTE_LABELS = ("method", "route")
+
+requests_total = registry.add(Counter(
+    "http_requests_total", "HTTP requests by route and status code", ("method", "route", "status")))
+request_duration = registry.add(Histogram(
+    "http_request_duration_seconds", "Time to the end of the response body", ROUTE_LABELS, LATENCY_BUCKETS))
+response_size = registry.add(Histogram(
+    "http_response_size_bytes", "Response body size", ROUTE_LABELS, SIZE_BUCKETS))
+in_flight = registry.add(Gauge(
+    "http_requests_in_flight", "Requests currently being served"))
+in_flight.register()
+
+class PoolListener(monitoring.ConnectionPoolListener):
+    """
+    Connection pool events. These arrive on the driver's threads, so this is
+    the one place counters are guarded by a lock.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.checkout_failures = 0
+
+    def _add(self, field: str, amount: int):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def connection_created(self, event):
+        self._add("open", 1)
+
+    def connection_closed(self, event):
+        self._add("open", -1)
+
+    def connection_check_out_started(self, event):
+        self._add("waiting", 1)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.checked_out += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        self._add("checked_out", -1)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+# Applies to every MongoClient created after this module is imported
+pool_listener = PoolListener()
+monitoring.register(pool_listener)
+
+def _pool_stats():
+    yield ("open",), pool_listener.open
+    yield ("checked_out",), pool_listener.checked_out
+    yield ("waiting",), pool_listener.waiting
+
+def _loop_lag():
+    import ratelimit
+    yield (), ratelimit.stats.loop_lag
+
+def _bcrypt():
+    import auth
+    yield ("queued",), auth.hash_stats.queue_depth
+    yield ("running",), min(auth.hash_stats.pending, auth.BCRYPT_WORKERS)
+
+def _bcrypt_completed():
+    import auth
+    yield (), auth.hash_stats.completed
+
+def _bcrypt_last_hour():
+    import auth
+    yield (), auth.hash_stats.last_hour
+
+def _sessions():
+    import sessions
+    yield ("created",), sessions.stats.created
+    yield ("refreshed",), sessions.stats.refreshed
+    yield ("rejected",), sessions.stats.rejected
+    yield ("reuse_detected",), sessions.stats.reuse_detected
+
+def _cache(attribute: str):
+    def collect():
+        from cache import catalog_cache, user_cache
+        from media_files import media_files
+        from tokens import claims_cache
+        yield ("catalog",), getattr(catalog_cache, attribute)
+        yield ("users",), getattr(user_cache, attribute)
+        yield ("media_stat",), getattr(media_files.stat_cache, attribute)
+        yield ("token_claims",), getattr(claims_cache, attribute)
+    return collect
+
+def _coalescing():
+    from singleflight import product_flights, category_flights, image_flights
+    for flights in (product_flights, category_flights, image_flights):
+        yield (flights.name, "calls"), flights.calls
+        yield (flights.name, "executions"), flights.executions
+
+def _admission():
+    import ratelimit
+    yield ("admitted",), ratelimit.stats.admitted
+    for reason, count in ratelimit.stats.rejected.items():
+        yield (f"rejected_{reason}",), count
+
+registry.add(Collected("event_loop_lag_seconds", "How late a 100ms timer fires", "gauge", (), _loop_lag))
+registry.add(Collected("mongodb_pool_connections", "MongoDB connection pool state", "gauge", ("state",), _pool_stats))
+registry.add(Collected("mongodb_pool_checkout_failures_total", "Failed connection checkouts", "counter", (),
+                       lambda: [((), pool_listener.checkout_failures)]))
+registry.add(Collected("bcrypt_operations", "Password hashes queued and running", "gauge", ("state",), _bcrypt))
+registry.add(Collected("bcrypt_operations_total", "Password hashes completed", "counter", (), _bcrypt_completed))
+registry.add(Collected("bcrypt_operations_last_hour", "Password hashes completed in the last hour", "gauge", (),
+                       _bcrypt_last_hour))
+registry.add(Collected("auth_sessions_total", "Logins, token refreshes and refused refreshes", "counter", ("event",),
+                       _sessions))
+registry.add(Collected("cache_hits_total", "Cache hits", "counter", ("cache",), _cache("hits")))
+registry.add(Collected("cache_misses_total", "Cache misses", "counter", ("cache",), _cache("misses")))
+registry.add(Collected("singleflight_total", "Coalesced catalog reads", "counter", ("group", "kind"), _coalescing))
+registry.add(Collected("admission_requests_total", "Admission control decisions", "counter", ("decision",), _admission))
+
+class MetricsMiddleware:
+    """ASGI middleware recording request metrics; add it outermost"""
+    def __init__(self, app):
+        self.app = app
+        self._routes = None
+
+    def _route_templates(self, app) -> dict:
+        routes = {}
+        for route in getattr(app, "routes", ()):
+            endpoint = getattr(route, "endpoint", None)
+            if endpoint is None:
+                continue
+            routes[endpoint] = route.path
+            for method in getattr(route, "methods", None) or ():
+                request_duration.register(method, route.path)
+                response_size.register(method, route.path)
+        return routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if self._routes is None:
+            self._routes = self._route_templates(scope.get("app"))
+
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        in_flight.values[()] += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.values[()] -= 1
+            # The router stores the matched endpoint in the scope
+            labels = (scope["method"], self._routes.get(scope.get("endpoint"), "unmatched"))
+            request_duration.observe(labels, time.perf_counter() - start)
+            response_size.observe(labels, size)
+            requests_total.inc((*labels, str(status)))
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field, EmailStr
-from typing import Optional, List, Dict, Any
+from pydantic import BaseModel, Field, EmailStr, model_validator
+from typing import Optional, List, Dict, Any, Generic, TypeVar
 from datetime import datetime
 from enum import Enum
 import uuid
@@ -23,6 +23,12 @@ class PaymentStatus(str, Enum):
     FAILED = "failed"
     EXPIRED = "expired"
 
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
 # Base Models
 class BaseDBModel(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), alias="_id")
@@ -33,6 +39,18 @@ class BaseDBModel(BaseModel):
     class Config:
         populate_by_name = True
 
+    @classmethod
+    def from_db(cls, document: dict):
+        """
+        Load a document read from MongoDB. Stored documents were validated on
+        the way in, so subclasses may relax expensive checks here; inbound
+        payloads must go through the normal constructor. Models without such
+        checks (products, orders) keep plain validation: model_construct is
+        no faster once their nested models are rebuilt, see
+        benchmarks/bench_models.py.
+        """
+        return cls.model_validate(document)
+
 # Product Models
 class NutritionFacts(BaseModel):
     calories: int
@@ -42,6 +60,12 @@ class NutritionFacts(BaseModel):
     protein: str
     fat: str
 
+def discount_pct(price: Optional[float], original_price: Optional[float]) -> float:
+    """Percent off original_price, stored so listings can sort on it"""
+    if not price or not original_price or original_price <= price:
+        return 0.0
+    return round((original_price - price) / original_price * 100, 2)
+
 class Product(BaseDBModel):
     name: str
     price: float
@@ -62,6 +86,13 @@ class Product(BaseDBModel):
     weight: str
     origin: str
     sku: str
+    # Derived from price and original_price, see discount_pct()
+    discount_pct: float = 0.0
+
+    @model_validator(mode="after")
+    def _derive_discount(self):
+        self.discount_pct = discount_pct(self.price, self.original_price)
+        return self
 
 class ProductCreate(BaseModel):
     name: str
@@ -121,6 +152,15 @@ class CategoryUpdate(BaseModel):
     color: Optional[str] = None
     description: Optional[str] = None
 
+class CategoryJob(BaseDBModel):
+    category_id: str
+    action: str  # "delete" or "rename"
+    changes: Dict[str, Any] = {}
+    status: JobStatus = JobStatus.QUEUED
+    total: int = 0
+    processed: int = 0
+    error: Optional[str] = None
+
 # User Models
 class UserAddress(BaseModel):
     street: str
@@ -144,6 +184,15 @@ class User(BaseDBModel):
     is_verified: bool = False
     avatar: Optional[str] = None
 
+    @classmethod
+    def from_db(cls, document: dict):
+        return StoredUser.model_validate(document)
+
+class StoredUser(User):
+    # Read-side user: emails were normalised by EmailStr on registration,
+    # re-running email-validator on every authenticated request is wasted work
+    email: str
+
 class UserCreate(BaseModel):
     name: str
     email: EmailStr
@@ -171,10 +220,18 @@ class CartItem(BaseModel):
     category: str
 
 class Cart(BaseDBModel):
-    user_id: str
+    user_id: Optional[str] = None  # None for anonymous carts
     items: List[CartItem] = []
     total_price: float = 0.0
     total_items: int = 0
+    expires_at: Optional[datetime] = None
+
+class CartLineCreate(BaseModel):
+    product_id: str
+    quantity: int = Field(1, ge=1)
+
+class CartLineUpdate(BaseModel):
+    quantity: int = Field(..., ge=0)
 
 # Order Models
 class OrderItem(BaseModel):
@@ -198,6 +255,12 @@ class Order(BaseDBModel):
     payment_id: Optional[str] = None
     delivery_option: str = "standard"
     notes: Optional[str] = None
+    discount: float = 0.0
+    coupon_code: Optional[str] = None
+    idempotency_key: Optional[str] = None
+    event_seq: int = 0  # sequence number of the latest order event
+    # Set by checkouts that took the order's stock; only those give it back
+    stock_reserved: bool = False
 
 class OrderCreate(BaseModel):
     items: List[OrderItem]
@@ -205,6 +268,18 @@ class OrderCreate(BaseModel):
     payment_method: str
     delivery_option: str = "standard"
     notes: Optional[str] = None
+    coupon_code: Optional[str] = None
+
+class QuoteItem(BaseModel):
+    product_id: str
+    quantity: int = Field(..., ge=1)
+
+class QuoteRequest(BaseModel):
+    items: List[QuoteItem]
+    state: Optional[str] = None
+    zip_code: Optional[str] = None
+    delivery_option: str = "standard"
+    coupon_code: Optional[str] = None
 
 class OrderUpdate(BaseModel):
     status: Optional[OrderStatus] = None
@@ -214,7 +289,7 @@ class OrderUpdate(BaseModel):
 class PaymentTransaction(BaseDBModel):
     user_id: Optional[str] = None
     order_id: Optional[str] = None
-    session_id: str
+    session_id: Optional[str] = None
     amount: float
     currency: str = "usd"
     payment_status: PaymentStatus = PaymentStatus.PENDING
@@ -229,24 +304,65 @@ class CheckoutRequest(BaseModel):
     notes: Optional[str] = None
 
 # Response Models
-class ApiResponse(BaseModel):
+DataT = TypeVar("DataT")
+
+class ApiResponse(BaseModel, Generic[DataT]):
     success: bool
     message: str = ""
-    data: Optional[Any] = None
+    data: Optional[DataT] = None
 
-class PaginatedResponse(BaseModel):
+class PaginatedResponse(BaseModel, Generic[DataT]):
     success: bool
     message: str = ""
-    data: List[Any] = []
+    data: List[DataT] = []
     page: int
     size: int
     total: int
     pages: int
 
+# Outbound document schemas. Responses are dumped by alias, so ids keep
+# going out as "_id" exactly like the raw MongoDB documents did.
+class ProductOut(Product):
+    pass
+
+class CategoryOut(Category):
+    pass
+
+class OrderOut(Order):
+    pass
+
+class UserOut(StoredUser):
+    hashed_password: str = Field(default="", exclude=True)
+
+class PaymentTransactionOut(PaymentTransaction):
+    pass
+
+# Parametrized once at import so their pydantic-core validators and
+# serializers are compiled a single time and shared by every request
+ProductPage = PaginatedResponse[ProductOut]
+OrderPage = PaginatedResponse[OrderOut]
+UserPage = PaginatedResponse[UserOut]
+PaymentTransactionPage = PaginatedResponse[PaymentTransactionOut]
+ProductResponse = ApiResponse[ProductOut]
+ProductListResponse = ApiResponse[List[ProductOut]]
+OrderResponse = ApiResponse[OrderOut]
+CategoryListResponse = ApiResponse[List[CategoryOut]]
+
+class ProductCursorPage(ProductPage):
+    # Keyset cursor for the page after this one, set when a sort is applied
+    next_cursor: Optional[str] = None
+
+class FacetedProductPage(ProductPage):
+    # facet -> value -> number of products, given the other facets' filters
+    facets: Dict[str, Dict[str, int]] = {}
+
 # Token Models
 class Token(BaseModel):
     access_token: str
     token_type: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 class TokenData(BaseModel):
     email: Optional[str] = None
\ No newline at end of file
@@ -0,0 +1,247 @@
+"""
+Order status workflow.
+
+Allowed transitions of OrderStatus are declared in TRANSITIONS. A transition
+is applied as one conditional update_one({_id, status: from}), so a
+customer cancelling and an admin confirming at the same moment cannot both
+succeed. Every applied transition is appended to the order_events
+collection with a per-order sequence number that clients can poll, and
+published to the order's pub/sub channel for streaming clients.
+
+Cancelling gives back the stock of orders whose checkout took it
+(stock_reserved; orders placed before checkout reserved stock have
+nothing to give back). The status change and the restock run in one
+transaction where the deployment supports them, and always before the
+event is recorded. Without transactions the cancelling write
+flags the order restock_pending and each line's stock goes back together
+with a key for that line on the product, so a restock cut short (a crashed
+worker, a failed write) is finished by RestockRetrier without returning
+any line twice; see _restock for the order of the steps.
+"""
+from models import OrderStatus
+from database import get_collection, run_transaction
+from pubsub import publish, order_channel, ADMIN_ORDERS_CHANNEL
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from typing import Optional
+import asyncio
+import os
+import uuid
+
+RESTOCK_RETRY_SECONDS = float(os.getenv("RESTOCK_RETRY_SECONDS", "60"))
+
+TRANSITIONS = {
+    OrderStatus.PENDING: {OrderStatus.CONFIRMED, OrderStatus.CANCELLED},
+    OrderStatus.CONFIRMED: {OrderStatus.PREPARING, OrderStatus.CANCELLED},
+    OrderStatus.PREPARING: {OrderStatus.OUT_FOR_DELIVERY, OrderStatus.CANCELLED},
+    OrderStatus.OUT_FOR_DELIVERY: {OrderStatus.DELIVERED},
+    OrderStatus.DELIVERED: set(),
+    OrderStatus.CANCELLED: set(),
+}
+
+class TransitionError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def can_transition(from_status: OrderStatus, to_status: OrderStatus) -> bool:
+    return to_status in TRANSITIONS.get(OrderStatus(from_status), set())
+
+async def record_event(order_id: str, event_type: str, data: dict, actor: Optional[str] = None, sequence: Optional[int] = None) -> dict:
+    """
+    Append an event to the order's log. `sequence` is the order's event_seq
+    value after it was incremented by the write that caused the event.
+    """
+    if sequence is None:
+        orders_collection = await get_collection("orders")
+        order = await orders_collection.find_one_and_update(
+            {"_id": order_id},
+            {"$inc": {"event_seq": 1}},
+            projection={"event_seq": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        sequence = order["event_seq"] if order else 0
+
+    event = {
+        "_id": str(uuid.uuid4()),
+        "order_id": order_id,
+        "seq": sequence,
+        "type": event_type,
+        "data": data,
+        "actor": actor,
+        "created_at": datetime.utcnow()
+    }
+    events_collection = await get_collection("order_events")
+    await events_collection.insert_one(event)
+
+    message = {**event, "created_at": event["created_at"].isoformat()}
+    await publish(order_channel(order_id), message)
+    await publish(ADMIN_ORDERS_CHANNEL, message)
+    return event
+
+async def transition_order(
+    order_id: str,
+    to_status: OrderStatus,
+    actor: Optional[str] = None,
+    query: Optional[dict] = None,
+    extra_updates: Optional[dict] = None,
+    from_statuses: Optional[set] = None
+) -> dict:
+    """
+    Move an order to `to_status`. `query` narrows which orders the caller may
+    touch (e.g. {"user_id": ...}) and `from_statuses` further limits the
+    states the caller may move it out of. Returns the updated order, raises
+    TransitionError when the order is missing or the move is not allowed.
+    """
+    to_status = OrderStatus(to_status)
+    orders_collection = await get_collection("orders")
+    scope = {"_id": order_id, **(query or {})}
+
+    current = await orders_collection.find_one(scope, {"status": 1, "stock_reserved": 1})
+    if not current:
+        raise TransitionError(404, "Order not found")
+    from_status = OrderStatus(current["status"])
+    if from_statuses is not None and from_status not in from_statuses:
+        raise TransitionError(400, f"Order cannot be {to_status.value} in current status")
+    if not can_transition(from_status, to_status):
+        raise TransitionError(400, f"Order cannot move from {from_status.value} to {to_status.value}")
+
+    now = datetime.utcnow()
+    restocking = to_status == OrderStatus.CANCELLED and bool(current.get("stock_reserved"))
+
+    async def write(session):
+        updated = await orders_collection.find_one_and_update(
+            {**scope, "status": from_status},
+            {
+                "$set": {
+                    "status": to_status,
+                    "updated_at": now,
+                    **({"restock_pending": True} if restocking else {}),
+                    **(extra_updates or {})
+                },
+                "$inc": {"event_seq": 1}
+            },
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        if updated and restocking:
+            await _restock(updated, session)
+        return updated
+
+    updated = await run_transaction(write)
+    if not updated:
+        # Someone else changed the status between our read and write
+        raise TransitionError(409, "Order status changed concurrently, please retry")
+
+    await record_event(
+        order_id,
+        "status_changed",
+        {"from": from_status.value, "to": to_status.value},
+        actor=actor,
+        sequence=updated["event_seq"]
+    )
+    return updated
+
+async def _restock(order: dict, session=None):
+    """
+    Give back the stock checkout took for a cancelled order. Three steps,
+    each safe to repeat, so RestockRetrier can resume after any of them:
+        1. each line's stock is returned together with a key for that line
+           on the product, a repeat skips lines already given back
+        2. the order swaps restock_pending for restock_cleanup_pending
+        3. the keys are pulled from the products, then the cleanup flag is
+           cleared (see _pull_restock_keys)
+    The keys are only pulled once step 2 has recorded that no line will be
+    returned again, so a retry can never find a line without its key.
+    """
+    orders_collection = await get_collection("orders")
+    products_collection = await get_collection("products")
+    for line, item in enumerate(order.get("items", [])):
+        key = _restock_key(order, line)
+        await products_collection.update_one(
+            {"_id": item["product_id"], "restocked_by": {"$ne": key}},
+            {"$inc": {"stock_count": item["quantity"]}, "$push": {"restocked_by": key}},
+            session=session
+        )
+    await orders_collection.update_one(
+        {"_id": order["_id"]},
+        {"$unset": {"restock_pending": ""}, "$set": {"restock_cleanup_pending": True}},
+        session=session
+    )
+    if session is not None:
+        await _pull_restock_keys(order, session)
+        return
+    try:
+        await _pull_restock_keys(order)
+    except Exception as e:
+        # The stock is back; RestockRetrier finishes the cleanup
+        print(f"Error clearing restock keys of order {order['_id']}: {e}")
+
+def _restock_key(order: dict, line: int) -> str:
+    return f"{order['_id']}:{line}"
+
+async def _pull_restock_keys(order: dict, session=None):
+    """Drop a restocked order's keys from its products; they only guard retries"""
+    orders_collection = await get_collection("orders")
+    products_collection = await get_collection("products")
+    items = order.get("items", [])
+    await products_collection.update_many(
+        {"_id": {"$in": [item["product_id"] for item in items]}},
+        {"$pull": {"restocked_by": {"$in": [_restock_key(order, line) for line in range(len(items))]}}},
+        session=session
+    )
+    await orders_collection.update_one(
+        {"_id": order["_id"]},
+        {"$unset": {"restock_cleanup_pending": ""}},
+        session=session
+    )
+
+async def resume_restocks() -> int:
+    """Finish restocks left pending for a while; returns how many orders"""
+    orders_collection = await get_collection("orders")
+    cutoff = datetime.utcnow() - timedelta(seconds=RESTOCK_RETRY_SECONDS)
+    resumed = 0
+    async for order in orders_collection.find({"restock_pending": True, "updated_at": {"$lt": cutoff}}):
+        await _restock(order)
+        resumed += 1
+    async for order in orders_collection.find({
+        "restock_cleanup_pending": True,
+        "restock_pending": {"$exists": False},
+        "updated_at": {"$lt": cutoff}
+    }):
+        await _pull_restock_keys(order)
+        resumed += 1
+    return resumed
+
+class RestockRetrier:
+    def __init__(self, interval: float = RESTOCK_RETRY_SECONDS):
+        self.interval = interval
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                resumed = await resume_restocks()
+                if resumed:
+                    print(f"Finished restocking {resumed} cancelled orders")
+            except Exception as e:
+                print(f"Error resuming order restocks: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+restock_retrier = RestockRetrier()
+
+async def get_events(order_id: str, since: int = 0, limit: int = 100) -> list:
+    events_collection = await get_collection("order_events")
+    return await events_collection.find(
+        {"order_id": order_id, "seq": {"$gt": since}}
+    ).sort("seq", 1).limit(limit).to_list(length=limit)
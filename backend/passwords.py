@@ -0,0 +1,125 @@
+"""
+Password hashing policy.
+
+New hashes use PASSWORD_HASH_SCHEME: bcrypt (default) or argon2 (argon2id,
+needs argon2-cffi). The cost is calibrated once per process so that one
+hash takes about PASSWORD_HASH_TARGET_MS on this hardware: bcrypt rounds
+go up by one per doubling, argon2's time cost linearly at a fixed
+ARGON2_MEMORY_KIB and ARGON2_PARALLELISM. Setting BCRYPT_ROUNDS or
+ARGON2_TIME_COST skips calibration. Whatever the hardware, costs never go
+below MIN_BCRYPT_ROUNDS and MIN_ARGON2_TIME_COST.
+
+Hashes from any known scheme verify. Those from another scheme, or below
+the current cost, report needs_update and are replaced after the user's
+next successful login (see auth.authenticate_user). A hash above the
+current cost is left alone, so moving to slower hardware never weakens
+existing hashes. benchmarks/bench_passwords.py reports the calibration
+and hashing throughput.
+"""
+from passlib.context import CryptContext
+from typing import Optional
+import math
+import os
+import threading
+import time
+
+PASSWORD_HASH_SCHEME = os.getenv("PASSWORD_HASH_SCHEME", "bcrypt")
+PASSWORD_HASH_TARGET_MS = float(os.getenv("PASSWORD_HASH_TARGET_MS", "250"))
+BCRYPT_ROUNDS = os.getenv("BCRYPT_ROUNDS")
+ARGON2_TIME_COST = os.getenv("ARGON2_TIME_COST")
+ARGON2_MEMORY_KIB = int(os.getenv("ARGON2_MEMORY_KIB", "19456"))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "1"))
+
+MIN_BCRYPT_ROUNDS = 10
+MAX_BCRYPT_ROUNDS = 16
+MIN_ARGON2_TIME_COST = 2
+MAX_ARGON2_TIME_COST = 20
+SCHEMES = ("bcrypt", "argon2")
+
+# Probe costs timed during calibration; cheap enough to repeat a few times
+BCRYPT_PROBE_ROUNDS = 8
+ARGON2_PROBE_TIME_COST = 2
+PROBE_SAMPLES = 3
+PROBE_PASSWORD = "calibration-password"
+
+def _time_hash(context: CryptContext, samples: int = PROBE_SAMPLES) -> float:
+    """Fastest of a few hashes, in seconds"""
+    best = math.inf
+    for _ in range(samples):
+        start = time.perf_counter()
+        context.hash(PROBE_PASSWORD)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def _bcrypt_context(rounds: int) -> CryptContext:
+    return CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds)
+
+def _argon2_context(time_cost: int, memory_kib: int, parallelism: int) -> CryptContext:
+    return CryptContext(schemes=["argon2"], argon2__type="ID", argon2__rounds=time_cost,
+                        argon2__memory_cost=memory_kib, argon2__parallelism=parallelism)
+
+def calibrate_bcrypt(target_ms: float) -> int:
+    seconds = _time_hash(_bcrypt_context(BCRYPT_PROBE_ROUNDS))
+    rounds = BCRYPT_PROBE_ROUNDS + round(math.log2(target_ms / 1000 / seconds))
+    return max(MIN_BCRYPT_ROUNDS, min(MAX_BCRYPT_ROUNDS, rounds))
+
+def calibrate_argon2(target_ms: float, memory_kib: int, parallelism: int) -> int:
+    seconds = _time_hash(_argon2_context(ARGON2_PROBE_TIME_COST, memory_kib, parallelism))
+    time_cost = round(ARGON2_PROBE_TIME_COST * target_ms / 1000 / seconds)
+    return max(MIN_ARGON2_TIME_COST, min(MAX_ARGON2_TIME_COST, time_cost))
+
+class HashPolicy:
+    def __init__(self, scheme: str = PASSWORD_HASH_SCHEME, target_ms: float = PASSWORD_HASH_TARGET_MS):
+        if scheme not in SCHEMES:
+            raise ValueError(f"Unknown password hash scheme {scheme}, expected one of {', '.join(SCHEMES)}")
+        self.scheme = scheme
+        self.target_ms = target_ms
+        self.settings: dict = {}
+        self._context: Optional[CryptContext] = None
+        self._lock = threading.Lock()
+
+    @property
+    def context(self) -> CryptContext:
+        # Calibrated on first use, normally from the app's startup
+        if self._context is None:
+            self.calibrate()
+        return self._context
+
+    def calibrate(self):
+        with self._lock:
+            if self._context is not None:
+                return
+            scheme = self.scheme
+            if scheme == "argon2":
+                try:
+                    time_cost = int(ARGON2_TIME_COST) if ARGON2_TIME_COST else \
+                        calibrate_argon2(self.target_ms, ARGON2_MEMORY_KIB, ARGON2_PARALLELISM)
+                    settings = {"argon2__type": "ID", "argon2__rounds": time_cost, "argon2__min_rounds": time_cost,
+                                "argon2__memory_cost": ARGON2_MEMORY_KIB, "argon2__parallelism": ARGON2_PARALLELISM}
+                except Exception as e:
+                    print(f"argon2 unavailable, hashing passwords with bcrypt: {e}")
+                    scheme = "bcrypt"
+            if scheme == "bcrypt":
+                rounds = int(BCRYPT_ROUNDS) if BCRYPT_ROUNDS else calibrate_bcrypt(self.target_ms)
+                settings = {"bcrypt__rounds": rounds, "bcrypt__min_rounds": rounds}
+            self.scheme = scheme
+            self.settings = settings
+            # Every other scheme is deprecated, so its hashes need an update
+            self._context = CryptContext(schemes=[scheme] + [other for other in SCHEMES if other != scheme],
+                                         default=scheme, deprecated="auto", **settings)
+            print(f"Password hashing: {scheme} {self.describe()}")
+
+    def describe(self) -> str:
+        return ", ".join(f"{key.split('__', 1)[1]}={value}" for key, value in self.settings.items()
+                         if not key.endswith("min_rounds"))
+
+    def hash(self, password: str) -> str:
+        return self.context.hash(password)
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        return self.context.verify(password, hashed_password)
+
+    def needs_update(self, hashed_password: str) -> bool:
+        return self.context.needs_update(hashed_password)
+
+policy = HashPolicy()
@@ -0,0 +1,195 @@
+"""
+Pricing engine: tax zones, delivery tiers and promotions.
+
+Rules live in the tax_zones, delivery_tiers and promotions collections and
+are compiled into lookup tables held in memory. The tables are reloaded
+every PRICING_REFRESH_SECONDS or as soon as the "pricing" namespace is
+bumped on the invalidation bus, so pricing a cart never touches the
+database.
+
+Rule documents:
+    tax_zones:      {state, zip_prefix?, rate, is_active}
+    delivery_tiers: {delivery_option, min_subtotal, fee, is_active}
+                    Options without tiers are charged the standard tiers.
+    promotions:     {code?, kind: percent|fixed|free_delivery, value,
+                     min_subtotal?, category_ids?, product_ids?,
+                     starts_at?, ends_at?, is_active}
+                    Promotions without a code are applied automatically.
+"""
+from database import get_collection
+from invalidation import on_bump
+from datetime import datetime
+from typing import Optional
+import asyncio
+import os
+import time
+
+PRICING_REFRESH_SECONDS = float(os.getenv("PRICING_REFRESH_SECONDS", "60"))
+
+# Used when the database holds no rules of a kind
+DEFAULT_TAX_RATE = 0.1
+# Options the storefront offers; all priced like standard until configured
+DELIVERY_OPTIONS = ("standard", "scheduled", "express")
+DEFAULT_DELIVERY_TIERS = {option: [(50.0, 0.0), (0.0, 5.99)] for option in DELIVERY_OPTIONS}
+
+class PricingError(Exception):
+    pass
+
+class Promotion:
+    __slots__ = ("code", "kind", "value", "min_subtotal", "category_ids", "product_ids", "starts_at", "ends_at")
+
+    def __init__(self, doc: dict):
+        self.code = doc.get("code").upper() if doc.get("code") else None
+        self.kind = doc["kind"]
+        self.value = float(doc.get("value", 0))
+        self.min_subtotal = float(doc.get("min_subtotal", 0))
+        self.category_ids = frozenset(doc.get("category_ids") or ())
+        self.product_ids = frozenset(doc.get("product_ids") or ())
+        self.starts_at = doc.get("starts_at")
+        self.ends_at = doc.get("ends_at")
+
+    def is_live(self, now: datetime) -> bool:
+        return (self.starts_at is None or self.starts_at <= now) and (self.ends_at is None or now < self.ends_at)
+
+    def eligible_subtotal(self, lines) -> float:
+        if not self.category_ids and not self.product_ids:
+            return sum(line["price"] * line["quantity"] for line in lines)
+        return sum(
+            line["price"] * line["quantity"] for line in lines
+            if line["product_id"] in self.product_ids or line.get("category_id") in self.category_ids
+        )
+
+class PricingRules:
+    """
+    Compiled, read-only rule tables. quote() is pure Python over dicts and
+    tuples, cheap enough to run on every cart change.
+    """
+    def __init__(self, tax_zones, delivery_tiers, promotions):
+        # state -> [(zip_prefix, rate)], longest prefix first; "*" is the fallback zone
+        self.tax_zones = {}
+        for zone in tax_zones:
+            state = zone.get("state", "*").upper()
+            self.tax_zones.setdefault(state, []).append((zone.get("zip_prefix") or "", float(zone["rate"])))
+        for zones in self.tax_zones.values():
+            zones.sort(key=lambda zone: len(zone[0]), reverse=True)
+
+        # delivery_option -> [(min_subtotal, fee)], highest threshold first
+        self.delivery_tiers = {}
+        for tier in delivery_tiers:
+            self.delivery_tiers.setdefault(tier["delivery_option"], []).append(
+                (float(tier.get("min_subtotal", 0)), float(tier["fee"]))
+            )
+        if not self.delivery_tiers:
+            self.delivery_tiers = {option: list(tiers) for option, tiers in DEFAULT_DELIVERY_TIERS.items()}
+        for tiers in self.delivery_tiers.values():
+            tiers.sort(reverse=True)
+
+        self.coupons = {}
+        self.automatic = []
+        for doc in promotions:
+            promotion = Promotion(doc)
+            if promotion.code:
+                self.coupons[promotion.code] = promotion
+            else:
+                self.automatic.append(promotion)
+
+    def tax_rate(self, state: Optional[str] = None, zip_code: Optional[str] = None) -> float:
+        for key in ((state or "").upper(), "*"):
+            for prefix, rate in self.tax_zones.get(key, ()):
+                if not prefix or (zip_code or "").startswith(prefix):
+                    return rate
+        return DEFAULT_TAX_RATE
+
+    def delivery_fee(self, delivery_option: str, subtotal: float) -> float:
+        # Options without tiers of their own cost the same as standard
+        tiers = self.delivery_tiers.get(delivery_option) or self.delivery_tiers.get("standard") \
+            or DEFAULT_DELIVERY_TIERS["standard"]
+        for min_subtotal, fee in tiers:
+            if subtotal >= min_subtotal:
+                return fee
+        return tiers[-1][1]
+
+    def quote(self, lines, state: Optional[str] = None, zip_code: Optional[str] = None,
+              delivery_option: str = "standard", coupon_code: Optional[str] = None) -> dict:
+        """
+        Price cart lines ({product_id, category_id, price, original_price,
+        quantity}). Raises PricingError for an unusable coupon.
+        """
+        now = datetime.utcnow()
+        subtotal = sum(line["price"] * line["quantity"] for line in lines)
+        savings = sum(
+            (line["original_price"] - line["price"]) * line["quantity"]
+            for line in lines if line.get("original_price") and line["original_price"] > line["price"]
+        )
+
+        promotions = [promotion for promotion in self.automatic if promotion.is_live(now)]
+        if coupon_code:
+            coupon = self.coupons.get(coupon_code.upper())
+            if coupon is None or not coupon.is_live(now):
+                raise PricingError("Invalid or expired coupon")
+            if subtotal < coupon.min_subtotal:
+                raise PricingError(f"Coupon requires a subtotal of at least {coupon.min_subtotal:.2f}")
+            promotions.append(coupon)
+
+        discount = 0.0
+        free_delivery = False
+        applied = []
+        for promotion in promotions:
+            if subtotal < promotion.min_subtotal:
+                continue
+            if promotion.kind == "free_delivery":
+                free_delivery = True
+            else:
+                eligible = promotion.eligible_subtotal(lines)
+                if not eligible:
+                    continue
+                if promotion.kind == "percent":
+                    discount += eligible * promotion.value / 100
+                else:
+                    discount += min(promotion.value, eligible)
+            applied.append(promotion.code or promotion.kind)
+        discount = min(discount, subtotal)
+
+        taxable = subtotal - discount
+        tax_rate = self.tax_rate(state, zip_code)
+        tax = taxable * tax_rate
+        delivery_fee = 0.0 if free_delivery else self.delivery_fee(delivery_option, taxable)
+
+        return {
+            "subtotal": round(subtotal, 2),
+            "savings": round(savings, 2),
+            "discount": round(discount, 2),
+            "tax_rate": tax_rate,
+            "tax": round(tax, 2),
+            "delivery_fee": delivery_fee,
+            "total_price": round(taxable + tax + delivery_fee, 2),
+            "promotions": applied
+        }
+
+_rules: Optional[PricingRules] = None
+_loaded_at = 0.0
+_reload_lock = asyncio.Lock()
+
+async def load_rules() -> PricingRules:
+    active = {"is_active": {"$ne": False}}
+    tax_zones = await (await get_collection("tax_zones")).find(active).to_list(length=None)
+    delivery_tiers = await (await get_collection("delivery_tiers")).find(active).to_list(length=None)
+    promotions = await (await get_collection("promotions")).find(active).to_list(length=None)
+    return PricingRules(tax_zones, delivery_tiers, promotions)
+
+async def get_rules() -> PricingRules:
+    global _rules, _loaded_at
+    if _rules is not None and time.monotonic() - _loaded_at < PRICING_REFRESH_SECONDS:
+        return _rules
+    async with _reload_lock:
+        # Another request may have reloaded while we waited
+        if _rules is None or time.monotonic() - _loaded_at >= PRICING_REFRESH_SECONDS:
+            _rules = await load_rules()
+            _loaded_at = time.monotonic()
+    return _rules
+
+def invalidate_rules():
+    global _loaded_at
+    _loaded_at = 0.0
+
+on_bump("pricing", invalidate_rules)
@@ -0,0 +1,191 @@
+"""
+Publish/subscribe hub for pushing order updates to clients.
+
+Publishers call publish(channel, message). The message goes through the
+configured Broker, which delivers it to the Hub of every worker:
+    mongo - CappedCollectionBroker, a capped "pubsub_messages" collection
+            that every worker tails, like the invalidation bus
+    local - InProcessBroker, straight to this worker's hub, for
+            single-worker deployments
+PUBSUB_BROKER picks one; "auto" (default) uses mongo whenever a database
+client is configured.
+
+Each subscriber owns a bounded queue. Publishing never waits on a slow
+consumer: when a queue is full the oldest message is dropped and the
+subscription is flagged as lagged, so the client knows to re-sync from
+the order events endpoint.
+"""
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime
+from typing import Dict, Optional, Set
+from invalidation import WORKER_ID
+import database
+import asyncio
+import os
+
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("PUBSUB_QUEUE_SIZE", "64"))
+PUBSUB_BROKER = os.getenv("PUBSUB_BROKER", "auto")
+CAPPED_COLLECTION = "pubsub_messages"
+CAPPED_SIZE_BYTES = int(os.getenv("PUBSUB_CAPPED_SIZE_BYTES", str(16 * 1024 * 1024)))
+
+class Subscription:
+    __slots__ = ("hub", "channels", "_queue", "_waiter", "lagged", "closed")
+
+    def __init__(self, hub: "Hub", channels):
+        self.hub = hub
+        self.channels = tuple(channels)
+        self._queue = None  # created on first message, idle subscribers stay small
+        self._waiter: Optional[asyncio.Future] = None
+        self.lagged = False
+        self.closed = False
+
+    def deliver(self, message: dict):
+        if self._queue is None:
+            self._queue = deque(maxlen=SUBSCRIBER_QUEUE_SIZE)
+        if len(self._queue) == self._queue.maxlen:
+            self.lagged = True
+        self._queue.append(message)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Next message, or None when `timeout` passes first"""
+        if not self._queue:
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.wait_for(self._waiter, timeout)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                self._waiter = None
+        return self._queue.popleft() if self._queue else None
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.hub.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class Hub:
+    def __init__(self):
+        self._channels: Dict[str, Set[Subscription]] = {}
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, *channels: str) -> Subscription:
+        subscription = Subscription(self, channels)
+        for channel in channels:
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for channel in subscription.channels:
+            subscribers = self._channels.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[channel]
+
+    def dispatch(self, channel: str, message: dict):
+        self.published += 1
+        for subscription in tuple(self._channels.get(channel, ())):
+            subscription.deliver(message)
+            self.delivered += 1
+
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._channels.values())
+
+class Broker(ABC):
+    """
+    Transport between workers. publish() must eventually call
+    hub.dispatch(channel, message) on every worker's hub, including this one.
+    """
+    def attach(self, hub: Hub):
+        self.hub = hub
+
+    @abstractmethod
+    async def publish(self, channel: str, message: dict):
+        ...
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+class InProcessBroker(Broker):
+    """Single-worker broker: deliver directly to the local hub"""
+    async def publish(self, channel: str, message: dict):
+        self.hub.dispatch(channel, message)
+
+class CappedCollectionBroker(Broker):
+    """
+    Messages are dispatched to this worker's hub right away and inserted
+    into a capped collection, which every other worker tails. The tail
+    keeps retrying while the database is unreachable.
+    """
+    def __init__(self):
+        self._task = None
+        self._collection = None
+        self.received = 0
+
+    async def publish(self, channel: str, message: dict):
+        self.hub.dispatch(channel, message)
+        if self._collection is None:
+            self._collection = await database.get_capped_collection(CAPPED_COLLECTION, CAPPED_SIZE_BYTES)
+        await self._collection.insert_one({
+            "origin": WORKER_ID,
+            "channel": channel,
+            "message": message,
+            "sent_at": datetime.utcnow()
+        })
+
+    async def _tail(self):
+        async for entry in database.tail_capped_collection(CAPPED_COLLECTION, CAPPED_SIZE_BYTES, "Pub/sub broker"):
+            if entry.get("origin") in (WORKER_ID, None):
+                continue
+            self.received += 1
+            self.hub.dispatch(entry["channel"], entry["message"])
+
+    async def start(self):
+        self._task = asyncio.create_task(self._tail())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+hub = Hub()
+broker: Broker = InProcessBroker()
+broker.attach(hub)
+
+def configure_broker(new_broker: Broker):
+    global broker
+    new_broker.attach(hub)
+    broker = new_broker
+
+async def start():
+    use_mongo = PUBSUB_BROKER == "mongo" or (PUBSUB_BROKER == "auto" and database.client is not None)
+    if use_mongo:
+        configure_broker(CappedCollectionBroker())
+    await broker.start()
+
+async def stop():
+    await broker.stop()
+
+async def publish(channel: str, message: dict):
+    try:
+        await broker.publish(channel, message)
+    except Exception as e:
+        print(f"Error publishing to {channel}: {e}")
+
+def order_channel(order_id: str) -> str:
+    return f"order:{order_id}"
+
+ADMIN_ORDERS_CHANNEL = "admin:orders"
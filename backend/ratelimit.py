@@ -0,0 +1,244 @@
+"""
+Rate limiting and admission control.
+
+AdmissionMiddleware runs in front of every HTTP request:
+    1. overload    - shed with 503 + Retry-After while the event loop lags
+                     more than ADMISSION_MAX_LOOP_LAG_MS behind schedule
+    2. concurrency - shed with 503 + Retry-After once ADMISSION_MAX_CONCURRENT
+                     requests are in flight
+    3. ip / user   - token buckets per client address and per authenticated
+                     user; an empty bucket is answered with 429 + Retry-After
+
+Each request takes ROUTE_COSTS tokens (1 by default) so the expensive paths
+(bcrypt logins, the admin dashboard, facet queries) drain a bucket faster;
+QUERY_COSTS prices a route by its query, so a product search or filtered
+listing costs more than a plain (cached) page.
+
+Behind a reverse proxy every request arrives from the proxy's address, so
+per-IP buckets must key on X-Forwarded-For instead: set
+TRUST_FORWARDED_FOR=true there. It defaults to true on Railway (detected
+from RAILWAY_ENVIRONMENT) and false elsewhere, since without a proxy that
+overwrites the header any client could pick its own bucket. The last
+address in the header is used, the one the proxy itself appended.
+Buckets live in memory per worker; a deployment that needs limits shared
+between workers plugs in a BucketStore backed by a shared store with
+configure_store(). Long-lived streams (SSE, WebSockets) are only rate
+limited on connect and do not count against the concurrency limit.
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from fastapi.responses import JSONResponse
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qsl
+from tokens import verify, TokenError
+import asyncio
+import math
+import os
+import time
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+IP_RATE_PER_SECOND = float(os.getenv("RATE_LIMIT_IP_PER_SECOND", "20"))
+IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", "60"))
+USER_RATE_PER_SECOND = float(os.getenv("RATE_LIMIT_USER_PER_SECOND", "10"))
+USER_BURST = float(os.getenv("RATE_LIMIT_USER_BURST", "40"))
+MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "256"))
+MAX_LOOP_LAG_MS = float(os.getenv("ADMISSION_MAX_LOOP_LAG_MS", "250"))
+LOOP_LAG_INTERVAL = 0.1
+MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000"))
+# Only honour X-Forwarded-For behind a proxy that sets it
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "true" if os.getenv("RAILWAY_ENVIRONMENT") else "false").lower() == "true"
+
+# (method, path) -> tokens taken per request
+ROUTE_COSTS = {
+    ("GET", "/api/products/facets"): 3,
+    ("POST", "/api/auth/login"): 10,
+    ("POST", "/api/auth/register"): 10,
+    ("POST", "/api/admin/register"): 10,
+    ("GET", "/api/admin/dashboard"): 20,
+    ("POST", "/api/orders"): 5,
+}
+
+# (method, path) -> (query parameters that make it expensive, tokens taken
+# when any of them is set); without them ROUTE_COSTS applies
+QUERY_COSTS = {
+    ("GET", "/api/products"): ({"search", "category", "category_id", "in_stock"}, 3),
+}
+
+# Never limited: probes, metrics scrapes and the API root
+EXEMPT_PATHS = {"/", "/health", "/health/live", "/health/ready", "/metrics"}
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, cost: float, rate: float, capacity: float, now: float) -> float:
+        """Take `cost` tokens; returns 0 on success or the seconds to wait"""
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / rate
+
+class BucketStore(ABC):
+    """
+    Holds token buckets. take() returns 0 when the request may proceed or the
+    number of seconds until enough tokens are available.
+    """
+    @abstractmethod
+    async def take(self, key: str, cost: float, rate: float, capacity: float) -> float:
+        ...
+
+class InMemoryBucketStore(BucketStore):
+    """Per-worker buckets, least recently used dropped beyond MAX_BUCKETS"""
+    def __init__(self, max_buckets: int = MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    async def take(self, key: str, cost: float, rate: float, capacity: float) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(capacity, now)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.take(cost, rate, capacity, now)
+
+store: BucketStore = InMemoryBucketStore()
+
+def configure_store(new_store: BucketStore):
+    global store
+    store = new_store
+
+class AdmissionStats:
+    def __init__(self):
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"overload": 0, "concurrency": 0, "ip": 0, "user": 0}
+        self.in_flight = 0
+        self.loop_lag = 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "in_flight": self.in_flight,
+            "max_concurrent": MAX_CONCURRENT,
+            "loop_lag_ms": round(self.loop_lag * 1000, 1)
+        }
+
+stats = AdmissionStats()
+
+class LoopLagMonitor:
+    """Measures how late a periodic sleep wakes up, i.e. event loop lag"""
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            stats.loop_lag = max(0.0, loop.time() - start - self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+loop_lag_monitor = LoopLagMonitor()
+
+def route_cost(method: str, path: str, query_string: bytes = b"") -> float:
+    route = (method, path.rstrip("/") or "/")
+    if route in QUERY_COSTS and query_string:
+        expensive, cost = QUERY_COSTS[route]
+        if any(value and name in expensive for name, value in parse_qsl(query_string.decode("latin-1"))):
+            return cost
+    return ROUTE_COSTS.get(route, 1)
+
+def client_ip(scope, headers: Dict[bytes, bytes]) -> str:
+    if TRUST_FORWARDED_FOR and b"x-forwarded-for" in headers:
+        return headers[b"x-forwarded-for"].split(b",")[-1].strip().decode("latin-1")
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+def token_subject(headers: Dict[bytes, bytes]) -> Optional[str]:
+    """Email of a validly signed bearer token; forged tokens get no user bucket"""
+    authorization = headers.get(b"authorization", b"")
+    if not authorization.lower().startswith(b"bearer "):
+        return None
+    try:
+        return verify(authorization[7:].decode("latin-1")).get("sub")
+    except TokenError:
+        return None
+
+def _reject(status_code: int, message: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"success": False, "message": message},
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+async def check_rate_limits(scope, headers: Dict[bytes, bytes]) -> Optional[Tuple[str, float]]:
+    """Returns (reason, retry_after) when a bucket is empty, None otherwise"""
+    cost = route_cost(scope["method"], scope["path"], scope.get("query_string", b""))
+    wait = await store.take("ip:" + client_ip(scope, headers), cost, IP_RATE_PER_SECOND, IP_BURST)
+    if wait:
+        return "ip", wait
+    subject = token_subject(headers)
+    if subject:
+        wait = await store.take("user:" + subject, cost, USER_RATE_PER_SECOND, USER_BURST)
+        if wait:
+            return "user", wait
+    return None
+
+class AdmissionMiddleware:
+    """ASGI middleware; streaming responses pass through untouched"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "websocket" and ADMISSION_ENABLED:
+            headers = dict(scope["headers"])
+            limited = await check_rate_limits({**scope, "method": "GET"}, headers)
+            if limited:
+                stats.rejected[limited[0]] += 1
+                await send({"type": "websocket.close", "code": 1013})
+                return
+            stats.admitted += 1
+            return await self.app(scope, receive, send)
+
+        if scope["type"] != "http" or not ADMISSION_ENABLED or scope["path"] in EXEMPT_PATHS:
+            return await self.app(scope, receive, send)
+
+        if stats.loop_lag * 1000 > MAX_LOOP_LAG_MS:
+            stats.rejected["overload"] += 1
+            return await _reject(503, "Server overloaded, please retry", 1)(scope, receive, send)
+        if stats.in_flight >= MAX_CONCURRENT:
+            stats.rejected["concurrency"] += 1
+            return await _reject(503, "Server busy, please retry", 1)(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        limited = await check_rate_limits(scope, headers)
+        if limited:
+            reason, retry_after = limited
+            stats.rejected[reason] += 1
+            return await _reject(429, "Too many requests", retry_after)(scope, receive, send)
+
+        stats.admitted += 1
+        if scope["path"].endswith("/stream"):
+            return await self.app(scope, receive, send)
+        stats.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            stats.in_flight -= 1
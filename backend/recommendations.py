@@ -0,0 +1,378 @@
+"""
+"Frequently bought together" recommendations from co-purchase counts.
+
+Every order's distinct products form a basket, and every pair in a basket
+counts once for both products. Counts are kept per product in a TopCounter
+of at most RECOMMEND_CANDIDATES entries (Space-Saving: a full counter
+replaces its smallest entry), so the matrix never grows beyond
+products x candidates no matter how many orders are read. Baskets larger
+than RECOMMEND_MAX_BASKET are cut to their first items, since pairs grow
+quadratically and bulk orders say little about affinity.
+
+The counts live in the product_recommendations collection,
+{_id: product_id, candidates: [[other_id, count], ...], seq, updated_at},
+with a watermark on the last order read in recommendation_state:
+    rebuild()             - stream every order and rewrite all lists
+                            (python recommendations.py)
+    update_incremental()  - fold orders after the watermark into the lists
+                            of the products they touch
+Only the worker holding the state document's lease runs updates. The lease
+is renewed while orders are read and checked again before every write, so
+a worker that stalled past it can't overwrite its successor's lists.
+
+Orders don't commit in created_at order, so an order stamped just before
+the watermark can appear after it was read. Updates therefore re-read the
+last RECOMMEND_LATE_SECONDS behind the watermark; the ids already counted
+in that window are kept in the state document and skipped.
+
+Every write of lists stamps them with the next list sequence number and,
+once they are all written, publishes that number as list_seq in the state
+document; a rebuild also bumps its generation, after deleting the lists it
+did not rewrite.
+
+Serving keeps just the top RECOMMEND_TOP_K ids per product in memory
+(related_index) and every RECOMMEND_REFRESH_SECONDS pulls the lists with a
+seq above its last sync, up to the published list_seq, so lookups never
+touch the database. Sequence numbers come from the database rather than
+any worker's clock; a new generation means lists were deleted, and the
+index is reloaded in full.
+"""
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+from database import get_collection
+from itertools import combinations
+from datetime import datetime, timedelta
+from pymongo import ReplaceOne, UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+RECOMMEND_TOP_K = int(os.getenv("RECOMMEND_TOP_K", "10"))
+RECOMMEND_CANDIDATES = int(os.getenv("RECOMMEND_CANDIDATES", "50"))
+RECOMMEND_MAX_BASKET = int(os.getenv("RECOMMEND_MAX_BASKET", "40"))
+RECOMMEND_REFRESH_SECONDS = float(os.getenv("RECOMMEND_REFRESH_SECONDS", "30"))
+RECOMMEND_LEASE_SECONDS = float(os.getenv("RECOMMEND_LEASE_SECONDS", "120"))
+RECOMMEND_LATE_SECONDS = float(os.getenv("RECOMMEND_LATE_SECONDS", "60"))
+
+STATE_ID = "co_purchase"
+WRITE_BATCH = 1000
+ORDER_PROJECTION = {"items.product_id": 1, "created_at": 1}
+# Cancelled orders were never bought together
+ORDER_FILTER = {"status": {"$ne": "cancelled"}}
+
+class TopCounter:
+    """
+    Counts for at most `capacity` keys; a full counter evicts its smallest.
+    A capacity of None counts exactly.
+    """
+    __slots__ = ("capacity", "counts")
+
+    def __init__(self, capacity: Optional[int], counts: Optional[Iterable[Tuple[str, int]]] = None):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = dict(counts or ())
+
+    def add(self, key: str, count: int = 1):
+        counts = self.counts
+        if key in counts:
+            counts[key] += count
+        elif self.capacity is None or len(counts) < self.capacity:
+            counts[key] = count
+        else:
+            # The newcomer inherits the evicted count, so it can overtake
+            # a stale entry rather than being evicted again right away
+            smallest = min(counts, key=counts.get)
+            counts[key] = counts.pop(smallest) + count
+
+    def top(self, k: Optional[int] = None) -> List[Tuple[str, int]]:
+        ranked = sorted(self.counts.items(), key=lambda entry: (-entry[1], entry[0]))
+        return ranked if k is None else ranked[:k]
+
+def basket(order: dict) -> List[str]:
+    """Distinct product ids of an order, in item order, capped"""
+    seen = {}
+    for item in order.get("items") or ():
+        product_id = item.get("product_id")
+        if product_id:
+            seen.setdefault(product_id, None)
+    return list(seen)[:RECOMMEND_MAX_BASKET]
+
+def count_pairs(counters: Dict[str, TopCounter], products: List[str], capacity: Optional[int]):
+    for first, second in combinations(products, 2):
+        for product_id, other_id in ((first, second), (second, first)):
+            counter = counters.get(product_id)
+            if counter is None:
+                counter = counters[product_id] = TopCounter(capacity)
+            counter.add(other_id)
+
+class LeaseLost(Exception):
+    pass
+
+class Progress:
+    """The newest order read, plus the orders read within RECOMMEND_LATE_SECONDS of it"""
+    def __init__(self, state: Optional[dict] = None):
+        state = state or {}
+        self.watermark: Optional[dict] = state.get("watermark")
+        self.recent: Deque[dict] = deque(state.get("recent") or ())
+
+    def query(self) -> dict:
+        if not self.watermark:
+            return dict(ORDER_FILTER)
+        query = {**ORDER_FILTER, "created_at": {"$gte": self.watermark["created_at"] - timedelta(seconds=RECOMMEND_LATE_SECONDS)}}
+        if self.recent:
+            query["_id"] = {"$nin": [entry["_id"] for entry in self.recent]}
+        return query
+
+    def read(self, order: dict):
+        entry = {"created_at": order["created_at"], "_id": order["_id"]}
+        if not self.watermark or (entry["created_at"], entry["_id"]) > (self.watermark["created_at"], self.watermark["_id"]):
+            self.watermark = entry
+        self.recent.append(entry)
+        cutoff = self.watermark["created_at"] - timedelta(seconds=RECOMMEND_LATE_SECONDS)
+        while self.recent and self.recent[0]["created_at"] < cutoff:
+            self.recent.popleft()
+
+    def state(self) -> dict:
+        return {"watermark": self.watermark, "recent": list(self.recent)}
+
+async def _acquire_lease(owner: str) -> Optional[dict]:
+    """The state document if this worker now holds the lease, else None"""
+    state_collection = await get_collection("recommendation_state")
+    now = datetime.utcnow()
+    try:
+        return await state_collection.find_one_and_update(
+            {"_id": STATE_ID, "$or": [{"lease_until": {"$exists": False}}, {"lease_until": {"$lt": now}}, {"owner": owner}]},
+            {"$set": {"owner": owner, "lease_until": now + timedelta(seconds=RECOMMEND_LEASE_SECONDS)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Upsert lost to another worker's live lease
+        return None
+
+async def _renew_lease(owner: str):
+    """Extend the lease; raises LeaseLost if another worker took it"""
+    state_collection = await get_collection("recommendation_state")
+    now = datetime.utcnow()
+    result = await state_collection.update_one(
+        {"_id": STATE_ID, "owner": owner},
+        {"$set": {"lease_until": now + timedelta(seconds=RECOMMEND_LEASE_SECONDS)}}
+    )
+    if not result.matched_count:
+        raise LeaseLost(f"Another worker took over the recommendation lease from {owner}")
+
+class LeaseKeeper:
+    """Renews the lease once a third of it has passed"""
+    def __init__(self, owner: str):
+        self.owner = owner
+        self.renewed = time.monotonic()
+
+    async def keep(self):
+        if time.monotonic() - self.renewed > RECOMMEND_LEASE_SECONDS / 3:
+            await self.renew()
+
+    async def renew(self):
+        await _renew_lease(self.owner)
+        self.renewed = time.monotonic()
+
+def _next_seq(state: Optional[dict]) -> int:
+    return ((state or {}).get("list_seq") or 0) + 1
+
+async def _publish_lists(owner: str, seq: int, rebuilt: bool = False):
+    """Let syncs read the lists written with `seq`; only once all are written"""
+    state_collection = await get_collection("recommendation_state")
+    update = {"$set": {"list_seq": seq}}
+    if rebuilt:
+        update["$inc"] = {"generation": 1}
+    result = await state_collection.update_one({"_id": STATE_ID, "owner": owner}, update)
+    if not result.matched_count:
+        raise LeaseLost(f"Another worker took over the recommendation lease from {owner}")
+
+async def _release_lease(owner: str, progress: Optional[Progress]):
+    state_collection = await get_collection("recommendation_state")
+    update = {"$unset": {"owner": "", "lease_until": ""}}
+    if progress and progress.watermark:
+        update["$set"] = progress.state()
+    await state_collection.update_one({"_id": STATE_ID, "owner": owner}, update)
+
+async def rebuild(owner: Optional[str] = None) -> dict:
+    """Recount every order from scratch and replace all lists"""
+    owner = owner or str(uuid.uuid4())
+    state = await _acquire_lease(owner)
+    if not state:
+        return {"skipped": True}
+    seq = _next_seq(state)
+    start = time.perf_counter()
+    orders_collection = await get_collection("orders")
+    recommendations_collection = await get_collection("product_recommendations")
+
+    counters: Dict[str, TopCounter] = {}
+    orders = 0
+    progress = Progress()
+    lease = LeaseKeeper(owner)
+    try:
+        async for order in orders_collection.find(ORDER_FILTER, ORDER_PROJECTION).sort([("created_at", 1), ("_id", 1)]):
+            count_pairs(counters, basket(order), RECOMMEND_CANDIDATES)
+            progress.read(order)
+            orders += 1
+            await lease.keep()
+
+        now = datetime.utcnow()
+        writes = []
+        for product_id, counter in counters.items():
+            writes.append(ReplaceOne(
+                {"_id": product_id},
+                {"candidates": [list(entry) for entry in counter.top()], "seq": seq, "updated_at": now},
+                upsert=True
+            ))
+            if len(writes) >= WRITE_BATCH:
+                await lease.renew()
+                await recommendations_collection.bulk_write(writes, ordered=False)
+                writes = []
+        if writes:
+            await lease.renew()
+            await recommendations_collection.bulk_write(writes, ordered=False)
+        # Products that lost every co-purchase since the last rebuild
+        await lease.renew()
+        await recommendations_collection.delete_many({"seq": {"$ne": seq}})
+        await _publish_lists(owner, seq, rebuilt=True)
+    except LeaseLost as e:
+        print(f"Recommendation rebuild abandoned: {e}")
+        return {"skipped": True}
+    finally:
+        await _release_lease(owner, progress)
+    return {"orders": orders, "products": len(counters), "seconds": round(time.perf_counter() - start, 2)}
+
+async def update_incremental(owner: str, limit: int = 10000) -> dict:
+    """Fold up to `limit` orders not yet counted into the stored lists"""
+    state = await _acquire_lease(owner)
+    if not state:
+        return {"skipped": True}
+    orders_collection = await get_collection("orders")
+    recommendations_collection = await get_collection("product_recommendations")
+
+    delta: Dict[str, TopCounter] = {}
+    orders = 0
+    progress = Progress(state)
+    lease = LeaseKeeper(owner)
+    try:
+        cursor = orders_collection.find(progress.query(), ORDER_PROJECTION).sort([("created_at", 1), ("_id", 1)]).limit(limit)
+        async for order in cursor:
+            # Deltas are exact; the candidate bound applies when merging
+            count_pairs(delta, basket(order), None)
+            progress.read(order)
+            orders += 1
+            await lease.keep()
+
+        if delta:
+            stored = {
+                document["_id"]: document["candidates"]
+                async for document in recommendations_collection.find({"_id": {"$in": list(delta)}})
+            }
+            now = datetime.utcnow()
+            seq = _next_seq(state)
+            writes = []
+            for product_id, counts in delta.items():
+                counter = TopCounter(RECOMMEND_CANDIDATES, stored.get(product_id, ()))
+                for other_id, count in counts.counts.items():
+                    counter.add(other_id, count)
+                writes.append(UpdateOne(
+                    {"_id": product_id},
+                    {"$set": {"candidates": [list(entry) for entry in counter.top()], "seq": seq, "updated_at": now}},
+                    upsert=True
+                ))
+            # One check for all batches: a partial merge would be counted again
+            await lease.renew()
+            for offset in range(0, len(writes), WRITE_BATCH):
+                await recommendations_collection.bulk_write(writes[offset:offset + WRITE_BATCH], ordered=False)
+            await _publish_lists(owner, seq)
+    except LeaseLost as e:
+        # Nothing was written, the new holder reads these orders again
+        print(f"Recommendation update abandoned: {e}")
+        return {"skipped": True}
+    finally:
+        await _release_lease(owner, progress)
+    return {"orders": orders, "products": len(delta)}
+
+class RelatedIndex:
+    def __init__(self, top_k: int = RECOMMEND_TOP_K, refresh_seconds: float = RECOMMEND_REFRESH_SECONDS):
+        self.top_k = top_k
+        self.refresh_seconds = refresh_seconds
+        self.owner = str(uuid.uuid4())
+        self.version = 0
+        self._related: Dict[str, Tuple[str, ...]] = {}
+        self._synced_seq: Optional[int] = None
+        self._generation: Optional[int] = None
+        self._task = None
+
+    def __len__(self):
+        return len(self._related)
+
+    def related(self, product_id: str) -> Tuple[str, ...]:
+        return self._related.get(product_id, ())
+
+    async def sync(self) -> int:
+        """Pull lists published since the last sync; returns how many changed"""
+        state_collection = await get_collection("recommendation_state")
+        recommendations_collection = await get_collection("product_recommendations")
+        state = await state_collection.find_one({"_id": STATE_ID}, {"list_seq": 1, "generation": 1}) or {}
+        published = state.get("list_seq") or 0
+        generation = state.get("generation") or 0
+        if self._synced_seq is not None and generation == self._generation:
+            if published == self._synced_seq:
+                return 0
+            related_by_product = self._related
+            query = {"seq": {"$gt": self._synced_seq, "$lte": published}}
+        else:
+            # First sync, or a rebuild deleted lists: start from what is stored
+            related_by_product = {}
+            query = {}
+        changed = 0
+        async for document in recommendations_collection.find(query):
+            related = tuple(other_id for other_id, _ in document["candidates"][:self.top_k])
+            if self._related.get(document["_id"]) != related:
+                changed += 1
+            related_by_product[document["_id"]] = related
+        if related_by_product is not self._related:
+            changed += len(self._related.keys() - related_by_product.keys())
+            self._related = related_by_product
+        self._synced_seq, self._generation = published, generation
+        if changed:
+            self.version += 1
+        return changed
+
+    async def _run(self):
+        while True:
+            try:
+                await update_incremental(self.owner)
+                await self.sync()
+            except Exception as e:
+                print(f"Error updating recommendations: {e}")
+            await asyncio.sleep(self.refresh_seconds)
+
+    def start(self):
+        if self.refresh_seconds > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+related_index = RelatedIndex()
+
+async def main(args):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    import database
+    database.client = AsyncIOMotorClient(database.MONGODB_URL)
+    result = await rebuild()
+    if result.get("skipped"):
+        print("Another worker holds the recommendation lease, try again later")
+        return
+    print(f"Counted {result['orders']} orders into lists for {result['products']} products in {result['seconds']}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the frequently-bought-together lists from all orders")
+    asyncio.run(main(parser.parse_args()))
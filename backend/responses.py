@@ -0,0 +1,28 @@
+from fastapi.responses import Response
+from pydantic import BaseModel, ValidationError
+from typing import Iterable, List, Type
+
+class ModelResponse(Response):
+    """
+    JSON response rendered straight from a pydantic model with its compiled
+    serializer. Skips FastAPI's dump -> re-validate -> encode round trip for
+    routes that already build their typed response model.
+    """
+    media_type = "application/json"
+
+    def render(self, content: BaseModel) -> bytes:
+        return content.__pydantic_serializer__.to_json(content, by_alias=True)
+
+def valid_documents(model_cls: Type[BaseModel], documents: Iterable[dict]) -> List[BaseModel]:
+    """
+    Validate listing documents one by one, logging and skipping those that no
+    longer fit the schema, so one bad legacy document can't fail a whole page.
+    """
+    valid = []
+    for document in documents:
+        try:
+            valid.append(model_cls.model_validate(document))
+        except ValidationError as e:
+            fields = ", ".join(".".join(str(part) for part in error["loc"]) for error in e.errors())
+            print(f"Skipping invalid {model_cls.__name__} document {document.get('_id')}, bad fields: {fields}")
+    return valid
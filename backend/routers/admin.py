@@ -1,13 +1,25 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, WebSocket, UploadFile, File, status as http_status
 from typing import Optional, List
 from models import (
-    ApiResponse, PaginatedResponse, User, Order, OrderStatus, 
-    OrderUpdate, Product, Category, PaymentTransaction, UserRole
+    ApiResponse, User, Order, OrderStatus, 
+    OrderUpdate, Product, Category, PaymentTransaction, UserRole,
+    OrderPage, ProductPage, UserPage, PaymentTransactionPage,
+    OrderOut, ProductOut, UserOut, PaymentTransactionOut
 )
 from database import get_collection
-from auth import get_current_admin_user, get_password_hash
+from auth import get_current_admin_user, get_password_hash_async, get_stream_user, user_from_token
+from responses import ModelResponse, valid_documents
+from category_counts import reconcile_product_counts
+from invalidation import bump
+import pricing
+import ratelimit
+from order_workflow import transition_order, TransitionError
+from pubsub import hub, ADMIN_ORDERS_CHANNEL
+from streaming import sse_response, websocket_pump
+from images import image_store, ImageError
 from datetime import datetime, timedelta
 from pydantic import BaseModel, EmailStr, Field
+from pymongo.errors import DuplicateKeyError
 
 router = APIRouter()
 
@@ -28,27 +40,25 @@ async def register_admin(
     try:
         users_collection = await get_collection("users")
         
-        # Check if email already exists
-        existing_user = await users_collection.find_one({"email": admin_data.email})
-        if existing_user:
-            raise HTTPException(
-                status_code=400,
-                detail="Email already registered"
-            )
-        
         # Create new admin user
         new_admin = User(
             name=admin_data.name,
             email=admin_data.email,
             phone=admin_data.phone,
             role=UserRole.ADMIN,
-            hashed_password=get_password_hash(admin_data.password),
+            hashed_password=await get_password_hash_async(admin_data.password),
             is_verified=True
         )
         
-        # Insert into database
+        # Insert into database; the unique email index rejects taken addresses
         admin_dict = new_admin.model_dump(by_alias=True) if hasattr(new_admin, 'model_dump') else new_admin.dict(by_alias=True)
-        await users_collection.insert_one(admin_dict)
+        try:
+            await users_collection.insert_one(admin_dict)
+        except DuplicateKeyError:
+            raise HTTPException(
+                status_code=400,
+                detail="Email already registered"
+            )
         
         # Remove password from response
         admin_response = new_admin.model_dump(by_alias=True) if hasattr(new_admin, 'model_dump') else new_admin.dict(by_alias=True)
@@ -182,7 +192,7 @@ async def get_admin_dashboard(
             detail=f"Failed to get dashboard data: {str(e)}"
         )
 
-@router.get("/orders", response_model=PaginatedResponse)
+@router.get("/orders", response_model=OrderPage)
 async def get_all_orders(
     page: int = Query(1, ge=1),
     size: int = Query(10, ge=1, le=100),
@@ -213,15 +223,15 @@ async def get_all_orders(
         # Calculate pagination info
         pages = (total + size - 1) // size
         
-        return PaginatedResponse(
+        return ModelResponse(OrderPage(
             success=True,
             message="Orders retrieved successfully",
-            data=orders,
+            data=valid_documents(OrderOut, orders),
             page=page,
             size=size,
             total=total,
             pages=pages
-        )
+        ))
         
     except Exception as e:
         raise HTTPException(
@@ -229,6 +239,41 @@ async def get_all_orders(
             detail=f"Failed to get orders: {str(e)}"
         )
 
+@router.get("/orders/stream")
+async def stream_all_orders(
+    request: Request,
+    current_user: User = Depends(get_stream_user)
+):
+    """
+    Server-Sent Events stream of every order change (Admin only)
+    """
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=403,
+            detail="Not enough permissions"
+        )
+    
+    return sse_response(request, hub.subscribe(ADMIN_ORDERS_CHANNEL))
+
+@router.websocket("/orders/ws")
+async def all_orders_websocket(
+    websocket: WebSocket,
+    token: str = Query(...)
+):
+    """
+    WebSocket stream of every order change (Admin only)
+    """
+    try:
+        user = await user_from_token(token)
+    except HTTPException:
+        user = None
+    if user is None or user.role != UserRole.ADMIN:
+        await websocket.close(code=http_status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    await websocket_pump(websocket, hub.subscribe(ADMIN_ORDERS_CHANNEL))
+
 @router.put("/orders/{order_id}", response_model=ApiResponse)
 async def update_order_status(
     order_id: str,
@@ -249,17 +294,24 @@ async def update_order_status(
                 detail="Order not found"
             )
         
-        # Update order
-        update_data = {k: v for k, v in order_updates.dict().items() if v is not None}
-        update_data["updated_at"] = datetime.utcnow()
-        
-        await orders_collection.update_one(
-            {"_id": order_id},
-            {"$set": update_data}
-        )
+        extra_updates = {"notes": order_updates.notes} if order_updates.notes is not None else {}
         
-        # Get updated order
-        updated_order = await orders_collection.find_one({"_id": order_id})
+        if order_updates.status is not None and order_updates.status != existing_order["status"]:
+            # Status changes go through the workflow's conditional transition
+            updated_order = await transition_order(
+                order_id,
+                order_updates.status,
+                actor=current_user.id,
+                extra_updates=extra_updates
+            )
+        else:
+            if extra_updates:
+                extra_updates["updated_at"] = datetime.utcnow()
+                await orders_collection.update_one(
+                    {"_id": order_id},
+                    {"$set": extra_updates}
+                )
+            updated_order = await orders_collection.find_one({"_id": order_id})
         
         return ApiResponse(
             success=True,
@@ -267,6 +319,11 @@ async def update_order_status(
             data=updated_order
         )
         
+    except TransitionError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -275,7 +332,7 @@ async def update_order_status(
             detail=f"Failed to update order: {str(e)}"
         )
 
-@router.get("/users", response_model=PaginatedResponse)
+@router.get("/users", response_model=UserPage)
 async def get_all_users(
     page: int = Query(1, ge=1),
     size: int = Query(10, ge=1, le=100),
@@ -300,22 +357,19 @@ async def get_all_users(
         skip = (page - 1) * size
         users = await users_collection.find(query).sort("created_at", -1).skip(skip).limit(size).to_list(length=size)
         
-        # Remove passwords from response
-        for user in users:
-            user.pop("hashed_password", None)
-        
         # Calculate pagination info
         pages = (total + size - 1) // size
         
-        return PaginatedResponse(
+        # UserOut drops hashed_password from the response
+        return ModelResponse(UserPage(
             success=True,
             message="Users retrieved successfully",
-            data=users,
+            data=valid_documents(UserOut, users),
             page=page,
             size=size,
             total=total,
             pages=pages
-        )
+        ))
         
     except Exception as e:
         raise HTTPException(
@@ -323,7 +377,7 @@ async def get_all_users(
             detail=f"Failed to get users: {str(e)}"
         )
 
-@router.get("/products", response_model=PaginatedResponse)
+@router.get("/products", response_model=ProductPage)
 async def get_all_products_admin(
     page: int = Query(1, ge=1),
     size: int = Query(10, ge=1, le=100),
@@ -349,15 +403,15 @@ async def get_all_products_admin(
         # Calculate pagination info
         pages = (total + size - 1) // size
         
-        return PaginatedResponse(
+        return ModelResponse(ProductPage(
             success=True,
             message="Products retrieved successfully",
-            data=products,
+            data=valid_documents(ProductOut, products),
             page=page,
             size=size,
             total=total,
             pages=pages
-        )
+        ))
         
     except Exception as e:
         raise HTTPException(
@@ -365,7 +419,92 @@ async def get_all_products_admin(
             detail=f"Failed to get products: {str(e)}"
         )
 
-@router.get("/payments", response_model=PaginatedResponse)
+@router.post("/categories/reconcile-counts", response_model=ApiResponse)
+async def reconcile_category_counts(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Rebuild every category's product_count from the products collection (Admin only)
+    """
+    try:
+        updated = await reconcile_product_counts()
+        await bump("categories")
+        
+        return ApiResponse(
+            success=True,
+            message="Category product counts reconciled",
+            data={"categories_updated": updated}
+        )
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to reconcile category counts: {str(e)}"
+        )
+
+@router.get("/pricing", response_model=ApiResponse)
+async def get_pricing_rules(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Get the compiled pricing rules currently in use (Admin only)
+    """
+    try:
+        rules = await pricing.get_rules()
+        
+        return ApiResponse(
+            success=True,
+            message="Pricing rules retrieved successfully",
+            data={
+                "tax_zones": {state: [{"zip_prefix": prefix, "rate": rate} for prefix, rate in zones] for state, zones in rules.tax_zones.items()},
+                "delivery_tiers": {option: [{"min_subtotal": min_subtotal, "fee": fee} for min_subtotal, fee in tiers] for option, tiers in rules.delivery_tiers.items()},
+                "coupons": sorted(rules.coupons),
+                "automatic_promotions": len(rules.automatic)
+            }
+        )
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to get pricing rules: {str(e)}"
+        )
+
+@router.post("/pricing/refresh", response_model=ApiResponse)
+async def refresh_pricing_rules(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Reload tax zones, delivery tiers and promotions after editing them (Admin only)
+    """
+    try:
+        await bump("pricing")
+        await pricing.get_rules()
+        
+        return ApiResponse(
+            success=True,
+            message="Pricing rules reloaded"
+        )
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to reload pricing rules: {str(e)}"
+        )
+
+@router.get("/admission", response_model=ApiResponse)
+async def get_admission_stats(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Get admitted and rejected request counts for this worker (Admin only)
+    """
+    return ApiResponse(
+        success=True,
+        message="Admission stats retrieved successfully",
+        data=ratelimit.stats.snapshot()
+    )
+
+@router.get("/payments", response_model=PaymentTransactionPage)
 async def get_all_payments(
     page: int = Query(1, ge=1),
     size: int = Query(10, ge=1, le=100),
@@ -387,18 +526,50 @@ async def get_all_payments(
         # Calculate pagination info
         pages = (total + size - 1) // size
         
-        return PaginatedResponse(
+        return ModelResponse(PaymentTransactionPage(
             success=True,
             message="Payment transactions retrieved successfully",
-            data=transactions,
+            data=valid_documents(PaymentTransactionOut, transactions),
             page=page,
             size=size,
             total=total,
             pages=pages
-        )
+        ))
         
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to get payment transactions: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+
+@router.post("/images", response_model=ApiResponse)
+async def upload_image(
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Upload a product image (Admin only). The response carries the URLs of
+    its resized versions for Product.image / images.
+    """
+    try:
+        image = await image_store.save_upload(file)
+        
+        return ApiResponse(
+            success=True,
+            message="Image uploaded successfully",
+            data=image
+        )
+        
+    except ImageError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to upload image: {str(e)}"
+        )
+    finally:
+        await file.close()
@@ -1,10 +1,16 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from fastapi.security import HTTPBearer
+from fastapi import APIRouter, HTTPException, Depends, Header, Request, status
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from datetime import timedelta, datetime
-from models import User, UserCreate, UserLogin, Token, ApiResponse, UserRole
+from models import User, UserCreate, UserLogin, Token, RefreshRequest, ApiResponse, UserRole
 from database import get_collection
-from auth import authenticate_user, create_access_token, get_password_hash, get_current_user, ACCESS_TOKEN_EXPIRE_MINUTES
+from auth import authenticate_user, get_password_hash_async, get_current_user, ACCESS_TOKEN_EXPIRE_MINUTES
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from carts import cart_store
+from invalidation import bump
+import sessions
+import tokens
+from typing import Optional
 
 router = APIRouter()
 security = HTTPBearer()
@@ -17,16 +23,8 @@ async def register_user(user_data: UserCreate):
     try:
         users_collection = await get_collection("users")
         
-        # Check if user already exists
-        existing_user = await users_collection.find_one({"email": user_data.email})
-        if existing_user:
-            raise HTTPException(
-                status_code=400,
-                detail="Email already registered"
-            )
-        
         # Create new user
-        hashed_password = get_password_hash(user_data.password)
+        hashed_password = await get_password_hash_async(user_data.password)
         user = User(
             name=user_data.name,
             email=user_data.email,
@@ -36,9 +34,16 @@ async def register_user(user_data: UserCreate):
             role=UserRole.CUSTOMER
         )
         
-        # Insert user into database
+        # Insert user into database; the unique email index rejects
+        # addresses already registered, in any capitalisation
         user_dict = user.model_dump(by_alias=True) if hasattr(user, 'model_dump') else user.dict(by_alias=True)
-        await users_collection.insert_one(user_dict)
+        try:
+            await users_collection.insert_one(user_dict)
+        except DuplicateKeyError:
+            raise HTTPException(
+                status_code=400,
+                detail="Email already registered"
+            )
         
         # Remove password from response
         user_dict.pop("hashed_password", None)
@@ -58,26 +63,32 @@ async def register_user(user_data: UserCreate):
         )
 
 @router.post("/login", response_model=ApiResponse)
-async def login_user(user_credentials: UserLogin):
+async def login_user(
+    user_credentials: UserLogin,
+    request: Request,
+    x_cart_id: Optional[str] = Header(None)
+):
     """
-    Login user and return access token
+    Login user and return an access token and a refresh token. An anonymous
+    cart sent as X-Cart-Id is merged into the user's cart.
     """
     try:
-        print(f"Login attempt for email: {user_credentials.email}")
         user = await authenticate_user(user_credentials.email, user_credentials.password)
         if not user:
-            print("Authentication failed - user not found or wrong password")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect email or password",
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
-        print(f"User authenticated successfully: {user.email}")
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": user.email}, expires_delta=access_token_expires
-        )
+        token_pair = await sessions.create(user, access_token_expires, request.headers.get("user-agent"))
+        
+        if x_cart_id:
+            try:
+                await cart_store.merge(x_cart_id, user.id)
+            except Exception as e:
+                print(f"Cart merge failed: {e}")
         
         # Remove password from user data
         user_dict = user.model_dump() if hasattr(user, 'model_dump') else user.dict()
@@ -87,8 +98,7 @@ async def login_user(user_credentials: UserLogin):
             success=True,
             message="Login successful",
             data={
-                "access_token": access_token,
-                "token_type": "bearer",
+                **token_pair,
                 "user": user_dict
             }
         )
@@ -96,14 +106,77 @@ async def login_user(user_credentials: UserLogin):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Login error: {str(e)}")
-        import traceback
-        traceback.print_exc()
         raise HTTPException(
             status_code=500,
             detail=f"Failed to login: {str(e)}"
         )
 
+@router.post("/refresh", response_model=ApiResponse)
+async def refresh_tokens(refresh_request: RefreshRequest):
+    """
+    Exchange a refresh token for a new access token and refresh token,
+    without the password. Each refresh token can be used once.
+    """
+    try:
+        token_pair = await sessions.refresh(
+            refresh_request.refresh_token, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        )
+        
+        return ApiResponse(
+            success=True,
+            message="Token refreshed successfully",
+            data=token_pair
+        )
+        
+    except sessions.SessionError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail,
+            headers={"WWW-Authenticate": "Bearer"} if e.status_code == 401 else None
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to refresh token: {str(e)}"
+        )
+
+@router.post("/logout", response_model=ApiResponse)
+async def logout_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Revoke the access token used for this request and end its session
+    """
+    try:
+        claims = tokens.verify(credentials.credentials)
+        await tokens.revoke(claims)
+        if claims.get("sid"):
+            await sessions.end(claims["sid"])
+        
+        return ApiResponse(
+            success=True,
+            message="Logged out successfully"
+        )
+        
+    except tokens.TokenError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to logout: {str(e)}"
+        )
+
+@router.get("/jwks")
+async def get_signing_keys():
+    """
+    Public keys that verify access tokens, by kid (JWK Set)
+    """
+    return tokens.keyring.jwks()
+
 @router.get("/me", response_model=ApiResponse)
 async def get_current_user_info(current_user: User = Depends(get_current_user)):
     """
@@ -137,10 +210,17 @@ async def update_current_user(
         users_collection = await get_collection("users")
         
         # Update user in database
-        await users_collection.update_one(
-            {"_id": current_user.id},
-            {"$set": {**user_updates, "updated_at": datetime.utcnow()}}
-        )
+        try:
+            await users_collection.update_one(
+                {"_id": current_user.id},
+                {"$set": {**user_updates, "updated_at": datetime.utcnow()}}
+            )
+        except DuplicateKeyError:
+            raise HTTPException(
+                status_code=400,
+                detail="Email already registered"
+            )
+        await bump("users")
         
         # Get updated user
         updated_user = await users_collection.find_one({"_id": current_user.id})
@@ -152,6 +232,8 @@ async def update_current_user(
             data=updated_user
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
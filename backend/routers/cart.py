@@ -0,0 +1,182 @@
+from fastapi import APIRouter, HTTPException, Depends, Header
+from typing import Optional
+from models import CartLineCreate, CartLineUpdate, ApiResponse, User
+from auth import get_current_user, get_optional_user
+from carts import cart_store, user_cart_id, new_cart_id
+from checkout import load_products
+
+router = APIRouter()
+
+async def _resolve_cart(user: Optional[User], cart_id: Optional[str], create: bool = False):
+    """
+    Signed-in users always use their own cart; anonymous clients identify
+    theirs with the X-Cart-Id header returned when it was created. An
+    unknown X-Cart-Id resolves to no cart; with `create` a new cart with a
+    fresh id is started instead.
+    """
+    if user is not None:
+        return await cart_store.get(user_cart_id(user.id), user.id)
+    cart = None
+    if cart_id and not cart_id.startswith("user:"):
+        cart = await cart_store.get(cart_id, create=False)
+    if cart is None and create:
+        cart = await cart_store.get(new_cart_id())
+    return cart
+
+def _cart_response(cart, message: str) -> ApiResponse:
+    return ApiResponse(
+        success=True,
+        message=message,
+        data=cart.to_dict() if cart else None
+    )
+
+@router.get("/", response_model=ApiResponse)
+async def get_cart(
+    x_cart_id: Optional[str] = Header(None),
+    current_user: Optional[User] = Depends(get_optional_user)
+):
+    """
+    Get the current cart
+    """
+    try:
+        cart = await _resolve_cart(current_user, x_cart_id)
+        return _cart_response(cart, "Cart retrieved successfully")
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to get cart: {str(e)}"
+        )
+
+@router.post("/items", response_model=ApiResponse)
+async def add_cart_item(
+    line: CartLineCreate,
+    x_cart_id: Optional[str] = Header(None),
+    current_user: Optional[User] = Depends(get_optional_user)
+):
+    """
+    Add a product to the cart, creating the cart if needed
+    """
+    try:
+        products = await load_products([line.product_id], use_cache=True)
+        product = products.get(line.product_id)
+        if not product:
+            raise HTTPException(
+                status_code=404,
+                detail="Product not found"
+            )
+
+        cart = await _resolve_cart(current_user, x_cart_id, create=True)
+        cart.add(product, line.quantity)
+        await cart_store.changed(cart)
+
+        return _cart_response(cart, "Item added to cart")
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to add item to cart: {str(e)}"
+        )
+
+@router.put("/items/{product_id}", response_model=ApiResponse)
+async def update_cart_item(
+    product_id: str,
+    line: CartLineUpdate,
+    x_cart_id: Optional[str] = Header(None),
+    current_user: Optional[User] = Depends(get_optional_user)
+):
+    """
+    Set the quantity of a cart line (0 removes it)
+    """
+    try:
+        cart = await _resolve_cart(current_user, x_cart_id)
+        if cart is None or product_id not in cart.items:
+            raise HTTPException(
+                status_code=404,
+                detail="Item not in cart"
+            )
+
+        cart.set_quantity(cart.items[product_id], line.quantity)
+        await cart_store.changed(cart)
+
+        return _cart_response(cart, "Cart updated successfully")
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to update cart: {str(e)}"
+        )
+
+@router.delete("/items/{product_id}", response_model=ApiResponse)
+async def remove_cart_item(
+    product_id: str,
+    x_cart_id: Optional[str] = Header(None),
+    current_user: Optional[User] = Depends(get_optional_user)
+):
+    """
+    Remove a product from the cart
+    """
+    try:
+        cart = await _resolve_cart(current_user, x_cart_id)
+        if cart is None or product_id not in cart.items:
+            raise HTTPException(
+                status_code=404,
+                detail="Item not in cart"
+            )
+
+        cart.remove(product_id)
+        await cart_store.changed(cart)
+
+        return _cart_response(cart, "Item removed from cart")
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to remove item from cart: {str(e)}"
+        )
+
+@router.delete("/", response_model=ApiResponse)
+async def clear_cart(
+    x_cart_id: Optional[str] = Header(None),
+    current_user: Optional[User] = Depends(get_optional_user)
+):
+    """
+    Remove every item from the cart
+    """
+    try:
+        cart = await _resolve_cart(current_user, x_cart_id)
+        if cart is not None:
+            cart.clear()
+            await cart_store.changed(cart)
+
+        return _cart_response(cart, "Cart cleared successfully")
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to clear cart: {str(e)}"
+        )
+
+@router.post("/merge", response_model=ApiResponse)
+async def merge_cart(
+    x_cart_id: str = Header(...),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Merge an anonymous cart into the signed-in user's cart
+    """
+    try:
+        cart = await cart_store.merge(x_cart_id, current_user.id)
+        return _cart_response(cart, "Cart merged successfully")
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to merge cart: {str(e)}"
+        )
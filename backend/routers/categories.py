@@ -1,26 +1,60 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi.responses import Response
 from typing import List
-from models import Category, CategoryCreate, CategoryUpdate, ApiResponse, User
+from models import Category, CategoryOut, CategoryCreate, CategoryUpdate, ApiResponse, CategoryListResponse, User
 from database import get_collection
 from auth import get_current_admin_user
+from responses import ModelResponse, valid_documents
+from cache import catalog_cache
+from invalidation import bump
+from singleflight import category_flights, flight_key
+import category_lifecycle
 from datetime import datetime
 
 router = APIRouter()
 
-@router.get("/", response_model=ApiResponse)
+async def _run_cascade(job, background_tasks: BackgroundTasks) -> dict:
+    """
+    Run small cascades before responding, hand large ones to a background job.
+    """
+    if category_lifecycle.runs_inline(job):
+        await category_lifecycle.run_job(job)
+    else:
+        background_tasks.add_task(category_lifecycle.run_job, job)
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "affected_products": job.total,
+        "processed": job.processed
+    }
+
+async def _fetch_active_categories() -> bytes:
+    key = flight_key("categories", "active")
+    categories_collection = await get_collection("categories")
+    categories = await categories_collection.find({"is_active": True}).to_list(length=None)
+    
+    body = ModelResponse(CategoryListResponse(
+        success=True,
+        message="Categories retrieved successfully",
+        data=valid_documents(CategoryOut, categories)
+    )).body
+    # Only cache if no invalidation happened while we were reading
+    if key == flight_key("categories", "active"):
+        catalog_cache.set("categories", "active", body)
+    return body
+
+@router.get("/", response_model=CategoryListResponse)
 async def get_categories():
     """
     Get all active categories
     """
     try:
-        categories_collection = await get_collection("categories")
-        categories = await categories_collection.find({"is_active": True}).to_list(length=None)
+        body = catalog_cache.get("categories", "active")
+        if body is None:
+            # Cache misses arriving together share one query
+            body = await category_flights.do(flight_key("categories", "active"), _fetch_active_categories)
         
-        return ApiResponse(
-            success=True,
-            message="Categories retrieved successfully",
-            data=categories
-        )
+        return Response(content=body, media_type="application/json")
         
     except Exception as e:
         raise HTTPException(
@@ -74,6 +108,7 @@ async def create_category(
         
         # Insert category into database
         result = await categories_collection.insert_one(category_dict)
+        await bump("categories")
         
         # Get the created category
         created_category = await categories_collection.find_one({"_id": result.inserted_id})
@@ -94,6 +129,7 @@ async def create_category(
 async def update_category(
     category_id: str,
     category_updates: CategoryUpdate,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_admin_user)
 ):
     """
@@ -118,9 +154,18 @@ async def update_category(
             {"_id": category_id},
             {"$set": update_data}
         )
+        await bump("categories")
+        
+        # Products carry the category name, push renames down to them
+        cascade = None
+        if category_updates.name and category_updates.name != existing_category["name"]:
+            job = await category_lifecycle.create_job(category_id, "rename", {"name": category_updates.name})
+            cascade = await _run_cascade(job, background_tasks)
         
         # Get updated category
         updated_category = await categories_collection.find_one({"_id": category_id})
+        if cascade:
+            updated_category["cascade"] = cascade
         
         return ApiResponse(
             success=True,
@@ -139,6 +184,7 @@ async def update_category(
 @router.delete("/{category_id}", response_model=ApiResponse)
 async def delete_category(
     category_id: str,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_admin_user)
 ):
     """
@@ -160,10 +206,16 @@ async def delete_category(
             {"_id": category_id},
             {"$set": {"is_active": False, "updated_at": datetime.utcnow()}}
         )
+        await bump("categories")
+        
+        # Deactivate the category's products as well
+        job = await category_lifecycle.create_job(category_id, "delete")
+        cascade = await _run_cascade(job, background_tasks)
         
         return ApiResponse(
             success=True,
-            message="Category deleted successfully"
+            message="Category deleted successfully",
+            data={"cascade": cascade}
         )
         
     except HTTPException:
@@ -172,4 +224,35 @@ async def delete_category(
         raise HTTPException(
             status_code=500,
             detail=f"Failed to delete category: {str(e)}"
+        )
+
+@router.get("/jobs/{job_id}", response_model=ApiResponse)
+async def get_category_job(
+    job_id: str,
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Get progress of a category cascade job (Admin only)
+    """
+    try:
+        job = await category_lifecycle.get_job(job_id)
+        
+        if not job:
+            raise HTTPException(
+                status_code=404,
+                detail="Job not found"
+            )
+        
+        return ApiResponse(
+            success=True,
+            message="Job retrieved successfully",
+            data=job
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to get job: {str(e)}"
         )
\ No newline at end of file
@@ -0,0 +1,36 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+from images import image_store, ImageError, IMMUTABLE
+from media_files import load_file_info, FileInfoResponse
+
+router = APIRouter()
+
+@router.get("/images/{name}")
+async def get_image(name: str, request: Request):
+    """
+    Serve a resized product image, generating it on first request
+    """
+    try:
+        # Names are content hashes, so a validator the client holds is always current
+        etag = f'"{name}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": IMMUTABLE})
+        
+        path, media_type = await image_store.derivative(name)
+        info = load_file_info(path, media_type, variants=False)
+        if info is None:
+            raise ImageError(404, "Image not found")
+        info.etag = etag
+        
+        return FileInfoResponse(info, IMMUTABLE)
+        
+    except ImageError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to get image: {str(e)}"
+        )
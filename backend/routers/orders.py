@@ -1,13 +1,18 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Header, Request, WebSocket, status as http_status
 from typing import Optional, List
-from models import Order, OrderCreate, OrderUpdate, ApiResponse, PaginatedResponse, User, OrderStatus
+from models import Order, OrderOut, OrderCreate, OrderUpdate, QuoteRequest, ApiResponse, OrderPage, OrderResponse, User, OrderStatus
 from database import get_collection
-from auth import get_current_user, get_current_admin_user
+from auth import get_current_user, get_current_admin_user, get_stream_user, user_from_token
+from responses import ModelResponse, valid_documents
+from checkout import place_order, quote, CheckoutError
+from order_workflow import transition_order, get_events, TransitionError
+from pubsub import hub, order_channel
+from streaming import sse_response, websocket_pump
 from datetime import datetime
 
 router = APIRouter()
 
-@router.get("/", response_model=PaginatedResponse)
+@router.get("/", response_model=OrderPage)
 async def get_user_orders(
     page: int = Query(1, ge=1),
     size: int = Query(10, ge=1, le=100),
@@ -35,15 +40,15 @@ async def get_user_orders(
         # Calculate pagination info
         pages = (total + size - 1) // size
         
-        return PaginatedResponse(
+        return ModelResponse(OrderPage(
             success=True,
             message="Orders retrieved successfully",
-            data=orders,
+            data=valid_documents(OrderOut, orders),
             page=page,
             size=size,
             total=total,
             pages=pages
-        )
+        ))
         
     except Exception as e:
         raise HTTPException(
@@ -51,7 +56,7 @@ async def get_user_orders(
             detail=f"Failed to get orders: {str(e)}"
         )
 
-@router.get("/{order_id}", response_model=ApiResponse)
+@router.get("/{order_id}", response_model=OrderResponse)
 async def get_order(
     order_id: str,
     current_user: User = Depends(get_current_user)
@@ -69,11 +74,11 @@ async def get_order(
                 detail="Order not found"
             )
         
-        return ApiResponse(
+        return ModelResponse(OrderResponse(
             success=True,
             message="Order retrieved successfully",
             data=order
-        )
+        ))
         
     except HTTPException:
         raise
@@ -83,50 +88,55 @@ async def get_order(
             detail=f"Failed to get order: {str(e)}"
         )
 
+@router.post("/quote", response_model=ApiResponse)
+async def quote_order(quote_request: QuoteRequest):
+    """
+    Price a cart (tax, delivery, promotions) without placing an order
+    """
+    try:
+        totals = await quote(quote_request)
+        
+        return ApiResponse(
+            success=True,
+            message="Quote calculated successfully",
+            data=totals
+        )
+        
+    except CheckoutError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to calculate quote: {str(e)}"
+        )
+
 @router.post("/", response_model=ApiResponse)
 async def create_order(
     order_data: OrderCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Create a new order
+    Create a new order. Prices, tax and delivery fee are recomputed from the
+    catalog; retries sending the same Idempotency-Key get the original order.
     """
     try:
-        orders_collection = await get_collection("orders")
-        
-        # Calculate totals
-        subtotal = sum(item.price * item.quantity for item in order_data.items)
-        tax = subtotal * 0.1  # 10% tax
-        delivery_fee = 5.99 if subtotal < 50 else 0  # Free delivery over $50
-        total_price = subtotal + tax + delivery_fee
-        
-        # Create order
-        order = Order(
-            user_id=current_user.id,
-            items=order_data.items,
-            subtotal=subtotal,
-            tax=tax,
-            delivery_fee=delivery_fee,
-            total_price=total_price,
-            delivery_address=order_data.delivery_address,
-            payment_method=order_data.payment_method,
-            delivery_option=order_data.delivery_option,
-            notes=order_data.notes
-        )
-        
-        # Insert order into database
-        order_dict = order.dict(by_alias=True)
-        result = await orders_collection.insert_one(order_dict)
-        
-        # Get the created order
-        created_order = await orders_collection.find_one({"_id": result.inserted_id})
+        order, created = await place_order(current_user, order_data, idempotency_key)
         
         return ApiResponse(
             success=True,
-            message="Order created successfully",
-            data=created_order
+            message="Order created successfully" if created else "Order already created",
+            data=order
         )
         
+    except CheckoutError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -190,33 +200,70 @@ async def cancel_order(
     """
     Cancel an order (only if status is pending)
     """
+    try:
+        # Customers may only cancel orders that are still pending; the
+        # conditional update loses cleanly against a concurrent admin change
+        await transition_order(
+            order_id,
+            OrderStatus.CANCELLED,
+            actor=current_user.id,
+            query={"user_id": current_user.id},
+            from_statuses={OrderStatus.PENDING}
+        )
+        
+        return ApiResponse(
+            success=True,
+            message="Order cancelled successfully"
+        )
+        
+    except TransitionError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to cancel order: {str(e)}"
+        )
+
+@router.get("/{order_id}/events", response_model=ApiResponse)
+async def get_order_events(
+    order_id: str,
+    since: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get order events newer than `since` (the last seq the client has seen)
+    """
     try:
         orders_collection = await get_collection("orders")
+        order = await orders_collection.find_one(
+            {"_id": order_id, "user_id": current_user.id},
+            {"status": 1, "event_seq": 1}
+        )
         
-        # Check if order exists and belongs to user
-        existing_order = await orders_collection.find_one({"_id": order_id, "user_id": current_user.id})
-        if not existing_order:
+        if not order:
             raise HTTPException(
                 status_code=404,
                 detail="Order not found"
             )
         
-        # Only allow cancellation if order is pending
-        if existing_order["status"] != OrderStatus.PENDING:
-            raise HTTPException(
-                status_code=400,
-                detail="Order cannot be cancelled in current status"
-            )
-        
-        # Update order status to cancelled
-        await orders_collection.update_one(
-            {"_id": order_id},
-            {"$set": {"status": OrderStatus.CANCELLED, "updated_at": datetime.utcnow()}}
-        )
+        events = []
+        if order.get("event_seq", 0) > since:
+            events = await get_events(order_id, since, limit)
         
         return ApiResponse(
             success=True,
-            message="Order cancelled successfully"
+            message="Order events retrieved successfully",
+            data={
+                "status": order["status"],
+                "last_seq": events[-1]["seq"] if events else since,
+                "events": events
+            }
         )
         
     except HTTPException:
@@ -224,5 +271,67 @@ async def cancel_order(
     except Exception as e:
         raise HTTPException(
             status_code=500,
-            detail=f"Failed to cancel order: {str(e)}"
-        )
\ No newline at end of file
+            detail=f"Failed to get order events: {str(e)}"
+        )
+
+async def _stream_backlog(order_id: str, user: User, since: int):
+    orders_collection = await get_collection("orders")
+    order = await orders_collection.find_one({"_id": order_id, "user_id": user.id}, {"_id": 1})
+    if not order:
+        return None
+    events = await get_events(order_id, since) if since else []
+    return [{**event, "created_at": event["created_at"].isoformat()} for event in events]
+
+@router.get("/{order_id}/stream")
+async def stream_order(
+    order_id: str,
+    request: Request,
+    since: int = Query(0, ge=0),
+    current_user: User = Depends(get_stream_user)
+):
+    """
+    Server-Sent Events stream of an order's status and payment changes.
+    Reconnecting clients resume from the Last-Event-ID header.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    
+    # Subscribe before reading the backlog so nothing falls in between;
+    # live repeats of backlog events are dropped by seq
+    subscription = hub.subscribe(order_channel(order_id))
+    backlog = await _stream_backlog(order_id, current_user, since)
+    if backlog is None:
+        subscription.close()
+        raise HTTPException(
+            status_code=404,
+            detail="Order not found"
+        )
+    
+    return sse_response(request, subscription, backlog, since)
+
+@router.websocket("/{order_id}/ws")
+async def order_websocket(
+    websocket: WebSocket,
+    order_id: str,
+    token: str = Query(...),
+    since: int = Query(0, ge=0)
+):
+    """
+    WebSocket stream of an order's status and payment changes
+    """
+    try:
+        user = await user_from_token(token)
+    except HTTPException:
+        await websocket.close(code=http_status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    subscription = hub.subscribe(order_channel(order_id))
+    backlog = await _stream_backlog(order_id, user, since)
+    if backlog is None:
+        subscription.close()
+        await websocket.close(code=http_status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    await websocket_pump(websocket, subscription, backlog, since)
\ No newline at end of file
@@ -5,6 +5,8 @@ import stripe
 from models import PaymentTransaction, PaymentStatus, ApiResponse, User
 from database import get_collection
 from auth import get_current_user
+from order_workflow import record_event
+from circuit import stripe_circuit, CircuitOpenError
 import os
 from typing import Optional, Dict, Any
 import uuid
@@ -22,6 +24,8 @@ stripe.api_key = STRIPE_SECRET_KEY
 from pydantic import BaseModel
 
 class CheckoutSessionRequest(BaseModel):
+    # Pay for an order placed through checkout; its total is the amount
+    order_id: Optional[str] = None
     amount: Optional[float] = None
     currency: str = "usd"
     stripe_price_id: Optional[str] = None
@@ -55,6 +59,22 @@ async def create_checkout_session(
             "source": "grocery_ecommerce"
         })
         
+        # Checkout already stored a pending payment record for the order
+        order = None
+        if checkout_data.order_id:
+            orders_collection = await get_collection("orders")
+            order = await orders_collection.find_one(
+                {"_id": checkout_data.order_id, "user_id": current_user.id},
+                {"total_price": 1, "payment_id": 1}
+            )
+            if not order:
+                raise HTTPException(
+                    status_code=404,
+                    detail="Order not found"
+                )
+            checkout_data.amount = order["total_price"]
+            metadata["order_id"] = order["_id"]
+        
         # Create checkout session request
         if checkout_data.amount is not None:
             # Custom amount checkout
@@ -82,20 +102,36 @@ async def create_checkout_session(
             )
         
         # Create checkout session with Stripe
-        session: CheckoutSessionResponse = await stripe_checkout.create_checkout_session(checkout_request)
-        
-        # Store payment transaction in database
-        payment_transaction = PaymentTransaction(
-            user_id=current_user.id,
-            session_id=session.session_id,
-            amount=checkout_data.amount or 0.0,  # For fixed price, amount will be updated when status is checked
-            currency=checkout_data.currency,
-            payment_status=PaymentStatus.INITIATED,
-            metadata=metadata
+        session: CheckoutSessionResponse = await stripe_circuit.call(
+            lambda: stripe_checkout.create_checkout_session(checkout_request)
         )
         
         transactions_collection = await get_collection("payment_transactions")
-        await transactions_collection.insert_one(payment_transaction.dict(by_alias=True))
+        linked = None
+        if order is not None and order.get("payment_id"):
+            # Attach the session to the order's payment record rather than starting another
+            linked = await transactions_collection.find_one_and_update(
+                {"_id": order["payment_id"], "user_id": current_user.id},
+                {"$set": {
+                    "session_id": session.session_id,
+                    "currency": checkout_data.currency,
+                    "payment_status": PaymentStatus.INITIATED,
+                    "metadata": metadata,
+                    "updated_at": datetime.utcnow()
+                }}
+            )
+        if linked is None:
+            # Store payment transaction in database
+            payment_transaction = PaymentTransaction(
+                user_id=current_user.id,
+                order_id=order["_id"] if order is not None else None,
+                session_id=session.session_id,
+                amount=checkout_data.amount or 0.0,  # For fixed price, amount will be updated when status is checked
+                currency=checkout_data.currency,
+                payment_status=PaymentStatus.INITIATED,
+                metadata=metadata
+            )
+            await transactions_collection.insert_one(payment_transaction.dict(by_alias=True))
         
         return ApiResponse(
             success=True,
@@ -106,6 +142,14 @@ async def create_checkout_session(
             }
         )
         
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, int(e.retry_after)))}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -122,7 +166,9 @@ async def get_checkout_status(
     """
     try:
         # Get checkout status from Stripe
-        checkout_status: CheckoutStatusResponse = await stripe_checkout.get_checkout_status(session_id)
+        checkout_status: CheckoutStatusResponse = await stripe_circuit.call(
+            lambda: stripe_checkout.get_checkout_status(session_id)
+        )
         
         # Find the payment transaction in database
         transactions_collection = await get_collection("payment_transactions")
@@ -159,6 +205,15 @@ async def get_checkout_status(
                     }
                 }
             )
+            
+            # Let clients following the order see the payment change
+            if transaction.get("order_id"):
+                await record_event(
+                    transaction["order_id"],
+                    "payment_status_changed",
+                    {"from": transaction["payment_status"], "to": new_status.value},
+                    actor=current_user.id
+                )
         
         return ApiResponse(
             success=True,
@@ -173,6 +228,14 @@ async def get_checkout_status(
             }
         )
         
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, int(e.retry_after)))}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -1,66 +1,169 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import Response
 from typing import Optional, List
-from models import Product, ProductCreate, ProductUpdate, ApiResponse, PaginatedResponse, User
+from models import Product, ProductOut, ProductCreate, ProductUpdate, ApiResponse, ProductCursorPage, ProductResponse, ProductListResponse, FacetedProductPage, User, discount_pct
 from database import get_collection
 from auth import get_current_user, get_current_admin_user
+from responses import ModelResponse, valid_documents
+from category_counts import adjust_product_count, move_product_count
+from pymongo import ReturnDocument
+from invalidation import bump
+from singleflight import product_flights, flight_key
+from facets import facet_index
+from recommendations import related_index, RECOMMEND_TOP_K
+from cache import catalog_cache
+from sorting import SORT_MODES, InvalidCursor, resolve, after, sort_spec, next_cursor
 from datetime import datetime
 
+# Reads of the current prices retried when another update changes them first
+PRICE_UPDATE_ATTEMPTS = 5
+
 router = APIRouter()
 
-@router.get("/", response_model=PaginatedResponse)
+async def _find_page(query: dict, page: int, size: int, mode: Optional[str], position: Optional[tuple]) -> ProductCursorPage:
+    products_collection = await get_collection("products")
+    
+    # Get total count
+    total = await products_collection.count_documents(query)
+    
+    # Sorted listings page by keyset cursor when one is given, else by skip
+    if mode:
+        cursor = products_collection.find(after(query, mode, position) if position else query).sort(sort_spec(mode))
+    else:
+        cursor = products_collection.find(query)
+    if not position:
+        cursor = cursor.skip((page - 1) * size)
+    products = await cursor.limit(size).to_list(length=size)
+    
+    # Calculate pagination info
+    pages = (total + size - 1) // size
+    
+    return ProductCursorPage(
+        success=True,
+        message="Products retrieved successfully",
+        data=valid_documents(ProductOut, products),
+        page=page,
+        size=size,
+        total=total,
+        pages=pages,
+        next_cursor=next_cursor(mode, products, size)
+    )
+
+async def _fetch_products_page(page: int, size: int, category: Optional[str], category_id: Optional[str], search: Optional[str],
+                               in_stock: Optional[bool], mode: Optional[str], position: Optional[tuple]) -> bytes:
+    # Build query
+    query = {"is_active": True}
+    if category_id:
+        query["category_id"] = category_id
+    if category:
+        query["category"] = category
+    if search:
+        query["$or"] = [
+            {"name": {"$regex": search, "$options": "i"}},
+            {"description": {"$regex": search, "$options": "i"}},
+            {"tags": {"$in": [search]}}
+        ]
+    if in_stock is not None:
+        query["in_stock"] = in_stock
+    
+    return ModelResponse(await _find_page(query, page, size, mode, position)).body
+
+@router.get("/", response_model=ProductCursorPage)
 async def get_products(
     page: int = Query(1, ge=1),
     size: int = Query(10, ge=1, le=100),
     category: Optional[str] = None,
+    category_id: Optional[str] = None,
     search: Optional[str] = None,
-    in_stock: Optional[bool] = None
+    in_stock: Optional[bool] = None,
+    sort: Optional[str] = Query(None, description=f"One of: {', '.join(SORT_MODES)}"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page")
 ):
     """
     Get products with pagination and filtering
     """
     try:
-        products_collection = await get_collection("products")
+        mode, position = resolve(sort or None, cursor)
         
-        # Build query
-        query = {"is_active": True}
-        if category:
-            query["category"] = category
-        if search:
-            query["$or"] = [
-                {"name": {"$regex": search, "$options": "i"}},
-                {"description": {"$regex": search, "$options": "i"}},
-                {"tags": {"$in": [search]}}
-            ]
-        if in_stock is not None:
-            query["in_stock"] = in_stock
+        # Identical concurrent requests share one query and one rendered body
+        category = category or None
+        category_id = category_id or None
+        search = search or None
+        body = await product_flights.do(
+            flight_key("products", page, size, category, category_id, search, in_stock, mode, cursor),
+            lambda: _fetch_products_page(page, size, category, category_id, search, in_stock, mode, position)
+        )
         
-        # Get total count
-        total = await products_collection.count_documents(query)
+        return Response(content=body, media_type="application/json")
         
-        # Get products with pagination
-        skip = (page - 1) * size
-        products = await products_collection.find(query).skip(skip).limit(size).to_list(length=size)
+    except InvalidCursor as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to get products: {str(e)}"
+        )
+
+@router.get("/facets", response_model=FacetedProductPage)
+async def browse_products(
+    page: int = Query(1, ge=1),
+    size: int = Query(20, ge=1, le=100),
+    category_id: List[str] = Query([]),
+    brand: List[str] = Query([]),
+    origin: List[str] = Query([]),
+    tag: List[str] = Query([]),
+    price: List[str] = Query([], description="Price buckets, e.g. 2-5 or 50+"),
+    rating: List[str] = Query([], description="Rating bands, e.g. 4+"),
+    in_stock: Optional[bool] = None
+):
+    """
+    Browse products by facets. Values within a facet are OR'ed, facets are
+    AND'ed; the response carries product counts for every facet value.
+    """
+    try:
+        await facet_index.ensure_loaded()
+        result = facet_index.query(
+            {
+                "category_id": category_id,
+                "brand": brand,
+                "origin": origin,
+                "tags": tag,
+                "price": price,
+                "rating": rating,
+                "in_stock": [] if in_stock is None else ["true" if in_stock else "false"]
+            },
+            offset=(page - 1) * size,
+            limit=size
+        )
         
-        # Calculate pagination info
-        pages = (total + size - 1) // size
+        products_collection = await get_collection("products")
+        found = {
+            product["_id"]: product
+            async for product in products_collection.find({"_id": {"$in": result["ids"]}, "is_active": True})
+        }
+        products = [found[product_id] for product_id in result["ids"] if product_id in found]
         
-        return PaginatedResponse(
+        return ModelResponse(FacetedProductPage(
             success=True,
             message="Products retrieved successfully",
-            data=products,
+            data=valid_documents(ProductOut, products),
             page=page,
             size=size,
-            total=total,
-            pages=pages
-        )
+            total=result["total"],
+            pages=(result["total"] + size - 1) // size,
+            facets=result["facets"]
+        ))
         
     except Exception as e:
         raise HTTPException(
             status_code=500,
-            detail=f"Failed to get products: {str(e)}"
+            detail=f"Failed to browse products: {str(e)}"
         )
 
-@router.get("/{product_id}", response_model=ApiResponse)
+@router.get("/{product_id}", response_model=ProductResponse)
 async def get_product(product_id: str):
     """
     Get a specific product by ID
@@ -75,11 +178,11 @@ async def get_product(product_id: str):
                 detail="Product not found"
             )
         
-        return ApiResponse(
+        return ModelResponse(ProductResponse(
             success=True,
             message="Product retrieved successfully",
             data=product
-        )
+        ))
         
     except HTTPException:
         raise
@@ -89,6 +192,41 @@ async def get_product(product_id: str):
             detail=f"Failed to get product: {str(e)}"
         )
 
+@router.get("/{product_id}/related", response_model=ProductListResponse)
+async def get_related_products(product_id: str, limit: int = Query(RECOMMEND_TOP_K, ge=1, le=RECOMMEND_TOP_K)):
+    """
+    Products frequently bought together with this one, most often first
+    """
+    try:
+        # Lists come from memory; rendered bodies are cached until the
+        # catalog or the lists change
+        key = ("related", product_id, limit, related_index.version)
+        body = catalog_cache.get("products", key)
+        if body is None:
+            related_ids = related_index.related(product_id)[:limit]
+            products = []
+            if related_ids:
+                products_collection = await get_collection("products")
+                found = {
+                    product["_id"]: product
+                    async for product in products_collection.find({"_id": {"$in": list(related_ids)}, "is_active": True})
+                }
+                products = [found[related_id] for related_id in related_ids if related_id in found]
+            body = ModelResponse(ProductListResponse(
+                success=True,
+                message="Related products retrieved successfully",
+                data=valid_documents(ProductOut, products)
+            )).body
+            catalog_cache.set("products", key, body)
+        
+        return Response(content=body, media_type="application/json")
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to get related products: {str(e)}"
+        )
+
 @router.post("/", response_model=ApiResponse)
 async def create_product(
     product_data: ProductCreate,
@@ -106,6 +244,10 @@ async def create_product(
         
         # Insert product into database
         result = await products_collection.insert_one(product_dict)
+        if product.is_active:
+            await adjust_product_count(product.category_id, 1)
+        facet_index.upsert(product_dict)
+        await bump("products", "categories")
         
         # Get the created product
         created_product = await products_collection.find_one({"_id": result.inserted_id})
@@ -134,25 +276,52 @@ async def update_product(
     try:
         products_collection = await get_collection("products")
         
-        # Check if product exists
-        existing_product = await products_collection.find_one({"_id": product_id, "is_active": True})
+        # Update product, getting back the state it was in before the write
+        update_data = {k: v for k, v in product_updates.dict().items() if v is not None}
+        update_data["updated_at"] = datetime.utcnow()
+        
+        existing_product = None
+        for _ in range(PRICE_UPDATE_ATTEMPTS):
+            query = {"_id": product_id, "is_active": True}
+            # The stored discount backs the "discount" sort and is written
+            # with the prices; a price changed by anyone since it was read
+            # fails the filter and the discount is recomputed
+            if "price" in update_data or "original_price" in update_data:
+                current = await products_collection.find_one(query, {"price": 1, "original_price": 1})
+                if not current:
+                    break
+                price = update_data.get("price", current.get("price"))
+                original_price = update_data.get("original_price", current.get("original_price"))
+                update_data["discount_pct"] = discount_pct(price, original_price)
+                query["price"] = current.get("price")
+                query["original_price"] = current.get("original_price")
+            existing_product = await products_collection.find_one_and_update(
+                query,
+                {"$set": update_data},
+                return_document=ReturnDocument.BEFORE
+            )
+            if existing_product or "discount_pct" not in update_data:
+                break
         if not existing_product:
+            if "discount_pct" in update_data and await products_collection.count_documents({"_id": product_id, "is_active": True}):
+                raise HTTPException(
+                    status_code=409,
+                    detail="Product prices are being changed concurrently, please retry"
+                )
             raise HTTPException(
                 status_code=404,
                 detail="Product not found"
             )
         
-        # Update product
-        update_data = {k: v for k, v in product_updates.dict().items() if v is not None}
-        update_data["updated_at"] = datetime.utcnow()
-        
-        await products_collection.update_one(
-            {"_id": product_id},
-            {"$set": update_data}
-        )
+        # Keep category counters in step with category moves
+        if "category_id" in update_data:
+            await move_product_count(existing_product.get("category_id"), update_data["category_id"])
+        await bump("products", "categories")
         
         # Get updated product
         updated_product = await products_collection.find_one({"_id": product_id})
+        if updated_product:
+            facet_index.upsert(updated_product)
         
         return ApiResponse(
             success=True,
@@ -179,19 +348,21 @@ async def delete_product(
     try:
         products_collection = await get_collection("products")
         
-        # Check if product exists
-        existing_product = await products_collection.find_one({"_id": product_id, "is_active": True})
+        # Soft delete product; only the request that flips is_active
+        # decrements the category counter
+        existing_product = await products_collection.find_one_and_update(
+            {"_id": product_id, "is_active": True},
+            {"$set": {"is_active": False, "updated_at": datetime.utcnow()}},
+            projection={"category_id": 1}
+        )
         if not existing_product:
             raise HTTPException(
                 status_code=404,
                 detail="Product not found"
             )
-        
-        # Soft delete product
-        await products_collection.update_one(
-            {"_id": product_id},
-            {"$set": {"is_active": False, "updated_at": datetime.utcnow()}}
-        )
+        await adjust_product_count(existing_product.get("category_id"), -1)
+        facet_index.remove(product_id)
+        await bump("products", "categories")
         
         return ApiResponse(
             success=True,
@@ -206,46 +377,35 @@ async def delete_product(
             detail=f"Failed to delete product: {str(e)}"
         )
 
-@router.get("/category/{category_id}", response_model=PaginatedResponse)
+@router.get("/category/{category_id}", response_model=ProductCursorPage)
 async def get_products_by_category(
     category_id: str,
     page: int = Query(1, ge=1),
     size: int = Query(10, ge=1, le=100),
-    in_stock: Optional[bool] = None
+    in_stock: Optional[bool] = None,
+    sort: Optional[str] = Query(None, description=f"One of: {', '.join(SORT_MODES)}"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page")
 ):
     """
     Get products by category with pagination
     """
     try:
-        products_collection = await get_collection("products")
+        mode, position = resolve(sort or None, cursor)
         
         # Build query
-        query = {"category_id": category_id, "is_active": True}
+        query = {"is_active": True, "category_id": category_id}
         if in_stock is not None:
             query["in_stock"] = in_stock
         
-        # Get total count
-        total = await products_collection.count_documents(query)
-        
-        # Get products with pagination
-        skip = (page - 1) * size
-        products = await products_collection.find(query).skip(skip).limit(size).to_list(length=size)
-        
-        # Calculate pagination info
-        pages = (total + size - 1) // size
+        return ModelResponse(await _find_page(query, page, size, mode, position))
         
-        return PaginatedResponse(
-            success=True,
-            message="Products retrieved successfully",
-            data=products,
-            page=page,
-            size=size,
-            total=total,
-            pages=pages
+    except InvalidCursor as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
         )
-        
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to get products by category: {str(e)}"
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,165 @@
+"""
+Login sessions and refresh tokens.
+
+Login starts a session and returns a short-lived access token together
+with a refresh token. Exchanging the refresh token for a new pair costs
+two indexed reads/writes and no password hash, so clients stay signed in
+for up to SESSION_MAX_DAYS without re-sending the password (and paying
+for bcrypt) every ACCESS_TOKEN_EXPIRE_MINUTES.
+
+Refresh tokens are opaque, "{session id}.{secret}", and the sessions
+collection only stores a hash of the secret. Every refresh rotates the
+secret with a compare-and-set on the stored hash, so of two refreshes
+racing with one token exactly one wins. A session left unused for
+REFRESH_TOKEN_EXPIRE_DAYS expires and is removed by a TTL index.
+
+Presenting a secret that was already rotated away (the last
+USED_HASHES_KEPT are remembered) means the refresh token was copied: the
+session is deleted and its latest access token revoked, signing out both
+the thief and the user. The only exception is a replay
+within REFRESH_REUSE_GRACE_SECONDS of the rotation, which is what a
+client retrying a refresh whose response it lost (or two tabs refreshing
+at once) looks like; that is refused without ending the session.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+from database import get_collection
+from tokens import issue, verify, revoke
+import hashlib
+import os
+import secrets
+import time
+import uuid
+
+REFRESH_TOKEN_EXPIRE_DAYS = float(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+SESSION_MAX_DAYS = float(os.getenv("SESSION_MAX_DAYS", "90"))
+REFRESH_REUSE_GRACE_SECONDS = float(os.getenv("REFRESH_REUSE_GRACE_SECONDS", "10"))
+# Rotated-away secrets remembered per session for reuse detection
+USED_HASHES_KEPT = 50
+
+class SessionError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class SessionStats:
+    """Updated from the event loop thread only"""
+    def __init__(self):
+        self.created = 0
+        self.refreshed = 0
+        self.rejected = 0
+        self.reuse_detected = 0
+
+stats = SessionStats()
+
+def _secret_hash(secret: str) -> str:
+    return hashlib.sha256(secret.encode()).hexdigest()
+
+def _parse(refresh_token: str):
+    session_id, _, secret = refresh_token.partition(".")
+    if not session_id or not secret:
+        raise SessionError(401, "Invalid refresh token")
+    return session_id, secret
+
+def _expiry(now: datetime, created_at: datetime) -> datetime:
+    return min(now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS), created_at + timedelta(days=SESSION_MAX_DAYS))
+
+def _access_token(email: str, session_id: str, expires_delta: timedelta):
+    access_token = issue({"sub": email, "sid": session_id}, expires_delta)
+    # Also warms the claims cache for the client's next request
+    return access_token, verify(access_token)
+
+def _pair(access_token: str, session_id: str, secret: str, expires_delta: timedelta) -> dict:
+    return {
+        "access_token": access_token,
+        "refresh_token": f"{session_id}.{secret}",
+        "token_type": "bearer",
+        "expires_in": int(expires_delta.total_seconds())
+    }
+
+async def create(user, expires_delta: timedelta, user_agent: Optional[str] = None) -> dict:
+    """Start a session for an authenticated user; returns the token pair"""
+    session_id = uuid.uuid4().hex
+    secret = secrets.token_urlsafe(32)
+    access_token, claims = _access_token(user.email, session_id, expires_delta)
+    now = datetime.utcnow()
+    sessions_collection = await get_collection("sessions")
+    await sessions_collection.insert_one({
+        "_id": session_id,
+        "user_id": user.id,
+        "email": user.email,
+        "token_hash": _secret_hash(secret),
+        "used_hashes": [],
+        "access_jti": claims["jti"],
+        "access_exp": claims["exp"],
+        "user_agent": user_agent,
+        "created_at": now,
+        "rotated_at": now,
+        "expires_at": _expiry(now, now)
+    })
+    stats.created += 1
+    return _pair(access_token, session_id, secret, expires_delta)
+
+async def refresh(refresh_token: str, expires_delta: timedelta) -> dict:
+    """Rotate a refresh token; returns a new token pair or raises SessionError"""
+    from auth import get_user_by_email
+
+    session_id, secret = _parse(refresh_token)
+    presented = _secret_hash(secret)
+    now = datetime.utcnow()
+    sessions_collection = await get_collection("sessions")
+    session = await sessions_collection.find_one({"_id": session_id})
+    if session is None or session["expires_at"] <= now:
+        stats.rejected += 1
+        raise SessionError(401, "Session expired")
+
+    if session["token_hash"] != presented:
+        stats.rejected += 1
+        if presented not in session.get("used_hashes", ()):
+            raise SessionError(401, "Invalid refresh token")
+        if presented == session["used_hashes"][-1] and \
+                (now - session["rotated_at"]).total_seconds() <= REFRESH_REUSE_GRACE_SECONDS:
+            raise SessionError(409, "Refresh token already used")
+        stats.reuse_detected += 1
+        print(f"Refresh token reuse detected for session {session_id}, revoking it")
+        await end(session)
+        raise SessionError(401, "Invalid refresh token")
+
+    # Deactivated or deleted accounts can't mint new tokens
+    user = await get_user_by_email(session["email"])
+    if user is None:
+        stats.rejected += 1
+        await end(session)
+        raise SessionError(401, "Session expired")
+
+    new_secret = secrets.token_urlsafe(32)
+    access_token, claims = _access_token(session["email"], session_id, expires_delta)
+    result = await sessions_collection.update_one(
+        {"_id": session_id, "token_hash": presented},
+        {"$set": {
+            "token_hash": _secret_hash(new_secret),
+            "access_jti": claims["jti"],
+            "access_exp": claims["exp"],
+            "rotated_at": now,
+            "expires_at": _expiry(now, session["created_at"])
+        }, "$push": {"used_hashes": {"$each": [presented], "$slice": -USED_HASHES_KEPT}}}
+    )
+    if not result.modified_count:
+        # Another refresh with the same token won the race
+        stats.rejected += 1
+        raise SessionError(409, "Refresh token already used")
+    stats.refreshed += 1
+    return _pair(access_token, session_id, new_secret, expires_delta)
+
+async def end(session):
+    """Delete a session (document or id) and revoke its latest access token"""
+    sessions_collection = await get_collection("sessions")
+    if not isinstance(session, dict):
+        session = await sessions_collection.find_one_and_delete({"_id": session})
+        if session is None:
+            return
+    else:
+        await sessions_collection.delete_one({"_id": session["_id"]})
+    if session.get("access_jti") and session["access_exp"] > time.time():
+        await revoke({"jti": session["access_jti"], "exp": session["access_exp"], "sub": session["email"]})
@@ -0,0 +1,53 @@
+"""
+Request coalescing ("single flight") for identical concurrent reads.
+
+The first caller for a key starts the fetch; callers arriving while it is
+in flight await the same result instead of querying the database again.
+Nothing is kept once the fetch finishes, so this never serves stale data on
+its own; pair it with a cache for that. Keys should include the cache
+namespace version (see flight_key) so a request that arrives after an
+invalidation never joins a fetch started before it.
+
+The fetch runs in its own task: a caller that disconnects does not cancel
+the work the other callers are waiting on.
+"""
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from cache import catalog_cache
+import asyncio
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.executions = 0
+
+    async def do(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            self.executions += 1
+            flight = asyncio.ensure_future(fetch())
+            self._flights[key] = flight
+            flight.add_done_callback(lambda _: self._flights.pop(key, None))
+        return await asyncio.shield(flight)
+
+    @property
+    def coalescing_ratio(self) -> float:
+        """Share of calls that were served by another caller's fetch"""
+        return 1 - self.executions / self.calls if self.calls else 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "in_flight": len(self._flights),
+            "coalescing_ratio": round(self.coalescing_ratio, 4)
+        }
+
+def flight_key(namespace: str, *params: Hashable) -> tuple:
+    return (namespace, catalog_cache.version(namespace), *params)
+
+product_flights = SingleFlight("products")
+category_flights = SingleFlight("categories")
+image_flights = SingleFlight("images")
@@ -0,0 +1,112 @@
+"""
+Server-side sort modes for product listings.
+
+Each mode orders by one field with _id as the tie-breaker. Every field has
+two compound indexes, (is_active, field, _id) for the whole catalog and
+(is_active, category_id, field, _id) for one category, so MongoDB reads
+the rows in index order and never sorts in memory. Descending modes walk
+the same indexes backwards.
+
+Pages are addressed with keyset cursors: a cursor holds the mode, the last
+row's sort value and its _id, and the next page starts right after that
+row. A deep page then costs the same as the first one, where skip() has to
+walk past every earlier row.
+"""
+from typing import List, Optional, Tuple
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from bson import json_util
+from database import get_collection
+from models import discount_pct
+import base64
+
+SORT_MODES = {
+    "price_asc": ("price", ASCENDING),
+    "price_desc": ("price", DESCENDING),
+    "rating": ("rating", DESCENDING),
+    "popularity": ("review_count", DESCENDING),
+    "newest": ("created_at", DESCENDING),
+    "discount": ("discount_pct", DESCENDING),
+}
+
+SORT_FIELDS = sorted({field for field, _ in SORT_MODES.values()})
+
+INDEXES = [
+    index
+    for field in SORT_FIELDS
+    for index in (
+        IndexModel([("is_active", ASCENDING), (field, ASCENDING), ("_id", ASCENDING)],
+                   name=f"active_{field}_sort"),
+        IndexModel([("is_active", ASCENDING), ("category_id", ASCENDING), (field, ASCENDING), ("_id", ASCENDING)],
+                   name=f"active_category_{field}_sort"),
+    )
+]
+
+class InvalidCursor(ValueError):
+    pass
+
+def sort_spec(mode: str) -> List[Tuple[str, int]]:
+    field, direction = SORT_MODES[mode]
+    return [(field, direction), ("_id", direction)]
+
+def encode_cursor(mode: str, document: dict) -> str:
+    field, _ = SORT_MODES[mode]
+    payload = json_util.dumps([mode, document.get(field), document["_id"]])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, object, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        mode, value, last_id = json_util.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+    if mode not in SORT_MODES:
+        raise InvalidCursor("Invalid cursor")
+    return mode, value, last_id
+
+def resolve(sort: Optional[str], cursor: Optional[str]) -> Tuple[Optional[str], Optional[tuple]]:
+    """
+    Validate the sort and cursor parameters of a listing request. A cursor
+    implies its own mode; passing a different sort alongside it is an error.
+    """
+    if sort is not None and sort not in SORT_MODES:
+        raise InvalidCursor(f"Unknown sort '{sort}', expected one of: {', '.join(SORT_MODES)}")
+    if not cursor:
+        return sort, None
+    mode, value, last_id = decode_cursor(cursor)
+    if sort is not None and sort != mode:
+        raise InvalidCursor("Cursor was issued for a different sort")
+    return mode, (value, last_id)
+
+def after(query: dict, mode: str, position: tuple) -> dict:
+    """
+    Restrict `query` to the rows after `position` in `mode` order. The
+    plain range on the sort field gives the index scan a tight lower bound;
+    the $or only breaks ties on _id within the boundary value.
+    """
+    field, direction = SORT_MODES[mode]
+    value, last_id = position
+    beyond, inclusive = ("$gt", "$gte") if direction == ASCENDING else ("$lt", "$lte")
+    keyset = dict(query)
+    keyset[field] = {inclusive: value}
+    keyset["$and"] = query.get("$and", []) + [{"$or": [{field: {beyond: value}}, {"_id": {beyond: last_id}}]}]
+    return keyset
+
+def next_cursor(mode: str, documents: List[dict], size: int) -> Optional[str]:
+    if not mode or len(documents) < size:
+        return None
+    return encode_cursor(mode, documents[-1])
+
+async def backfill_discounts():
+    """Store discount_pct on products written before the field existed"""
+    products_collection = await get_collection("products")
+    updates = []
+    async for product in products_collection.find({"discount_pct": {"$exists": False}}, {"price": 1, "original_price": 1}):
+        updates.append(UpdateOne(
+            {"_id": product["_id"]},
+            {"$set": {"discount_pct": discount_pct(product.get("price"), product.get("original_price"))}}
+        ))
+        if len(updates) >= 1000:
+            await products_collection.bulk_write(updates, ordered=False)
+            updates = []
+    if updates:
+        await products_collection.bulk_write(updates, ordered=False)
@@ -0,0 +1,77 @@
+"""
+Server-Sent Events and WebSocket delivery of pub/sub messages.
+"""
+from fastapi import Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pubsub import Subscription
+from typing import Optional
+import json
+import os
+
+HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+
+LAGGED_MESSAGE = {"type": "lagged"}
+
+def sse_format(message: dict) -> str:
+    lines = []
+    if "seq" in message:
+        lines.append(f"id: {message['seq']}")
+    lines.append(f"event: {message.get('type', 'message')}")
+    lines.append(f"data: {json.dumps(message, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+def _last_seq(backlog, since: int) -> int:
+    return max([since] + [message["seq"] for message in backlog if "seq" in message])
+
+def _replayed(message: Optional[dict], last_seq: int) -> bool:
+    """Live messages already sent as part of the backlog"""
+    return message is not None and message.get("seq", last_seq + 1) <= last_seq
+
+def sse_response(request: Request, subscription: Subscription, backlog=(), since: int = 0) -> StreamingResponse:
+    """
+    Stream `backlog` followed by live messages until the client goes away.
+    The subscription is opened before the backlog is read, so live messages
+    with a seq up to the backlog's last (or `since`) are dropped as repeats.
+    A comment line is sent every HEARTBEAT_SECONDS to keep proxies open.
+    """
+    last_seq = _last_seq(backlog, since)
+
+    async def stream():
+        with subscription:
+            yield "retry: 3000\n\n"
+            for message in backlog:
+                yield sse_format(message)
+            while not await request.is_disconnected():
+                message = await subscription.get(timeout=HEARTBEAT_SECONDS)
+                if _replayed(message, last_seq):
+                    continue
+                if subscription.lagged:
+                    # Messages were dropped; tell the client to re-sync
+                    subscription.lagged = False
+                    yield sse_format(LAGGED_MESSAGE)
+                yield sse_format(message) if message is not None else ": keep-alive\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def websocket_pump(websocket: WebSocket, subscription: Subscription, backlog=(), since: int = 0):
+    last_seq = _last_seq(backlog, since)
+    with subscription:
+        try:
+            for message in backlog:
+                await websocket.send_text(json.dumps(message, default=str))
+            while True:
+                message = await subscription.get(timeout=HEARTBEAT_SECONDS)
+                if _replayed(message, last_seq):
+                    continue
+                if subscription.lagged:
+                    subscription.lagged = False
+                    await websocket.send_text(json.dumps(LAGGED_MESSAGE))
+                await websocket.send_text(
+                    json.dumps(message, default=str) if message is not None else '{"type": "ping"}'
+                )
+        except WebSocketDisconnect:
+            pass
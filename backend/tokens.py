@@ -0,0 +1,325 @@
+"""
+Access token issuing and verification.
+
+Signing keys:
+    With JWT_KEYS_DIR set, every <kid>.pem in it is a key: private keys
+    (RSA -> RS256, EC P-256 -> ES256) can sign, public-only <kid>.pub.pem
+    files only verify. New tokens are signed with JWT_SIGNING_KID, or the
+    newest private key, and carry its kid in the header. Rotating is adding
+    a new key file; the old one stays until its last tokens have expired.
+    The directory is re-read every JWT_KEYS_RELOAD_SECONDS. SECRET_KEY
+    (HS256, kid "hs") remains a verification key, and signs when there are
+    no asymmetric keys. Each kid is verified only with its own algorithm.
+
+Verified claims are cached in an LRU keyed by a hash of the token until
+the token's exp, so a client's repeated requests decode it once; the
+admission middleware and the auth dependency share the cache.
+
+Revocation is per token (jti). Revoked ids live in the revoked_tokens
+collection until their token would have expired (TTL index), and every
+worker keeps a Bloom filter over them plus the exact set: a token is
+checked against the exact set only when the filter says it might be
+revoked. Each worker refreshes from the database every
+REVOCATION_REFRESH_SECONDS and at once when another worker revokes.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+from jose import JWTError, jwt
+from database import get_collection
+from invalidation import bump, on_bump
+import asyncio
+import hashlib
+import math
+import os
+import time
+import uuid
+
+SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
+ALGORITHM = os.getenv("ALGORITHM", "HS256")
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR")
+JWT_SIGNING_KID = os.getenv("JWT_SIGNING_KID")
+JWT_KEYS_RELOAD_SECONDS = float(os.getenv("JWT_KEYS_RELOAD_SECONDS", "30"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+REVOCATION_REFRESH_SECONDS = float(os.getenv("REVOCATION_REFRESH_SECONDS", "30"))
+REVOCATION_FALSE_POSITIVE_RATE = float(os.getenv("REVOCATION_FALSE_POSITIVE_RATE", "0.01"))
+
+SECRET_KID = "hs"
+
+class TokenError(JWTError):
+    pass
+
+class SigningKey:
+    __slots__ = ("kid", "algorithm", "signing_key", "verifying_key")
+
+    def __init__(self, kid: str, algorithm: str, signing_key, verifying_key):
+        self.kid = kid
+        self.algorithm = algorithm
+        self.signing_key = signing_key
+        self.verifying_key = verifying_key
+
+def _load_pem(kid: str, data: bytes) -> SigningKey:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+    try:
+        private_key = serialization.load_pem_private_key(data, password=None)
+        public_key = private_key.public_key()
+    except ValueError:
+        private_key = None
+        public_key = serialization.load_pem_public_key(data)
+    if isinstance(public_key, rsa.RSAPublicKey):
+        algorithm = "RS256"
+    elif isinstance(public_key, ec.EllipticCurvePublicKey) and public_key.curve.name == "secp256r1":
+        algorithm = "ES256"
+    else:
+        raise ValueError(f"Unsupported key type for kid {kid}")
+    public_pem = public_key.public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return SigningKey(kid, algorithm, data.decode() if private_key is not None else None, public_pem.decode())
+
+class KeyRing:
+    def __init__(self, directory: Optional[str] = JWT_KEYS_DIR, signing_kid: Optional[str] = JWT_SIGNING_KID):
+        self.directory = directory
+        self.signing_kid = signing_kid
+        self.keys: Dict[str, SigningKey] = {}
+        self.signing: Optional[SigningKey] = None
+        self._directory_mtime = None
+        self._checked_at = 0.0
+        self.load()
+
+    def load(self):
+        keys = {SECRET_KID: SigningKey(SECRET_KID, ALGORITHM, SECRET_KEY, SECRET_KEY)}
+        newest = None
+        if self.directory and os.path.isdir(self.directory):
+            self._directory_mtime = os.stat(self.directory).st_mtime_ns
+            for name in sorted(os.listdir(self.directory)):
+                if not name.endswith(".pem"):
+                    continue
+                kid = name[:-len(".pub.pem")] if name.endswith(".pub.pem") else name[:-len(".pem")]
+                path = os.path.join(self.directory, name)
+                try:
+                    with open(path, "rb") as key_file:
+                        key = _load_pem(kid, key_file.read())
+                except Exception as e:
+                    print(f"Skipping JWT key {name}: {e}")
+                    continue
+                keys[kid] = key
+                if key.signing_key is not None:
+                    modified = os.stat(path).st_mtime
+                    if newest is None or modified > newest[0]:
+                        newest = (modified, kid)
+        signing_kid = self.signing_kid if self.signing_kid in keys else (newest[1] if newest else SECRET_KID)
+        self.keys = keys
+        self.signing = keys[signing_kid]
+        self._checked_at = time.monotonic()
+
+    def maybe_reload(self):
+        """Re-read the key directory if it changed since the last load"""
+        if not self.directory or time.monotonic() - self._checked_at < JWT_KEYS_RELOAD_SECONDS:
+            return
+        self._checked_at = time.monotonic()
+        try:
+            if os.stat(self.directory).st_mtime_ns != self._directory_mtime:
+                self.load()
+        except FileNotFoundError:
+            pass
+
+    def jwks(self) -> dict:
+        """Public keys for other services, in JWK Set form"""
+        from jose import jwk
+        keys = []
+        for key in self.keys.values():
+            if key.kid == SECRET_KID:
+                continue
+            entry = jwk.construct(key.verifying_key, key.algorithm).to_dict()
+            entry.update({"kid": key.kid, "use": "sig", "alg": key.algorithm})
+            keys.append(entry)
+        return {"keys": keys}
+
+def token_hash(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+class ClaimsCache:
+    """Verified claims by token hash; entries expire with the token"""
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: bytes) -> Optional[dict]:
+        claims = self._entries.get(key)
+        if claims is None or claims["exp"] <= time.time():
+            if claims is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return claims
+
+    def set(self, key: bytes, claims: dict):
+        self._entries[key] = claims
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+class BloomFilter:
+    def __init__(self, capacity: int, false_positive_rate: float = REVOCATION_FALSE_POSITIVE_RATE):
+        capacity = max(1, capacity)
+        self.size = max(1024, int(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        # Optimal for a filter at capacity; an emptier one only gets fewer false positives
+        self.hashes = max(1, round(-math.log2(false_positive_rate)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> Iterable[int]:
+        # Our jtis are 128 random bits in hex already; anything else is hashed
+        try:
+            value = int(item, 16) if len(item) == 32 else None
+        except ValueError:
+            value = None
+        if value is None:
+            value = int.from_bytes(hashlib.blake2b(item.encode(), digest_size=16).digest(), "little")
+        first, second = value & 0xFFFFFFFFFFFFFFFF, (value >> 64) | 1
+        size = self.size
+        return [(first + i * second) % size for i in range(self.hashes)]
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        bits = self._bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+class RevocationList:
+    def __init__(self):
+        self._exact = set()
+        self._bloom = BloomFilter(0)
+        self._stale = asyncio.Event()
+        self._task = None
+        # Revoked here while a refresh was reading, merged into its result
+        self._added_during_refresh: Optional[set] = None
+        self.bloom_hits = 0
+        self.loaded_at = 0.0
+
+    def __len__(self):
+        return len(self._exact)
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        if not jti or jti not in self._bloom:
+            return False
+        self.bloom_hits += 1
+        return jti in self._exact
+
+    def add(self, jti: str):
+        if self._added_during_refresh is not None:
+            self._added_during_refresh.add(jti)
+        # Grow the filter well before its false positive rate degrades
+        if len(self._exact) >= self._capacity():
+            self._rebuild(self._exact | {jti})
+        else:
+            self._exact.add(jti)
+            self._bloom.add(jti)
+
+    def _capacity(self) -> int:
+        return max(1, int(self._bloom.size * math.log(2) ** 2 / -math.log(REVOCATION_FALSE_POSITIVE_RATE)))
+
+    def _rebuild(self, jtis: set):
+        bloom = BloomFilter(max(1024, len(jtis) * 2))
+        for jti in jtis:
+            bloom.add(jti)
+        self._exact, self._bloom = jtis, bloom
+
+    async def refresh(self):
+        self._added_during_refresh = set()
+        try:
+            revoked_collection = await get_collection("revoked_tokens")
+            now = datetime.utcnow()
+            jtis = {document["_id"] async for document in revoked_collection.find({"expires_at": {"$gt": now}}, {"_id": 1})}
+            self._rebuild(jtis | self._added_during_refresh)
+        finally:
+            self._added_during_refresh = None
+        self.loaded_at = time.time()
+
+    def mark_stale(self):
+        self._stale.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+                keyring.maybe_reload()
+            except Exception as e:
+                print(f"Error refreshing token revocations: {e}")
+            try:
+                await asyncio.wait_for(self._stale.wait(), REVOCATION_REFRESH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._stale.clear()
+
+    def start(self):
+        if self._task is None:
+            self._stale = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+keyring = KeyRing()
+claims_cache = ClaimsCache()
+revocations = RevocationList()
+
+on_bump("revocations", revocations.mark_stale, remote_only=True)
+
+def issue(claims: dict, expires_delta: timedelta) -> str:
+    key = keyring.signing
+    now = datetime.utcnow()
+    to_encode = dict(claims)
+    to_encode.update({"exp": now + expires_delta, "iat": now, "jti": uuid.uuid4().hex})
+    return jwt.encode(to_encode, key.signing_key, algorithm=key.algorithm, headers={"kid": key.kid})
+
+def verify(token: str) -> dict:
+    """Claims of a valid, unexpired, unrevoked token; raises TokenError"""
+    cache_key = token_hash(token)
+    claims = claims_cache.get(cache_key)
+    if claims is None:
+        try:
+            header = jwt.get_unverified_header(token)
+            # Tokens from before key ids were introduced are HS256
+            key = keyring.keys.get(header.get("kid") or SECRET_KID)
+            if key is None:
+                raise TokenError("Unknown signing key")
+            claims = jwt.decode(token, key.verifying_key, algorithms=[key.algorithm])
+        except TokenError:
+            raise
+        except JWTError as e:
+            raise TokenError(str(e))
+        if "exp" not in claims:
+            raise TokenError("Token has no expiry")
+        claims_cache.set(cache_key, claims)
+    if revocations.is_revoked(claims.get("jti")):
+        raise TokenError("Token has been revoked")
+    return claims
+
+async def revoke(claims: dict):
+    """Revoke one token everywhere until it would have expired anyway"""
+    jti = claims.get("jti")
+    if not jti:
+        raise TokenError("Token has no id and cannot be revoked")
+    revoked_collection = await get_collection("revoked_tokens")
+    await revoked_collection.update_one(
+        {"_id": jti},
+        {"$set": {"expires_at": datetime.utcfromtimestamp(claims["exp"]), "sub": claims.get("sub")}},
+        upsert=True
+    )
+    revocations.add(jti)
+    await bump("revocations")